@@ -0,0 +1,159 @@
+"""压测入口：模拟大量用户按场景压测本地服务器，结果输出为 JSON
+
+示例：
+    python -m benchmark.main --spawn-server async --scenario all --users 1000 --output async.json
+    python -m benchmark.main --spawn-server async --workers 4 --scenario group_flood --users 2000
+    python -m benchmark.main --scenario group_flood --users 200 --server-pid 12345
+    python -m benchmark.main --spawn-server thread --scenario churn --compression zlib
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from config import DEFAULT_CONFIG, SERVER_IP, SERVER_PORT
+from protocol import COMPRESSION_ZLIB
+from benchmark.scenarios import SCENARIOS
+from util import raise_fd_limit
+
+MAIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SimpleChatApp 压测工具")
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all",
+                        help="压测场景（all 依次运行全部场景）")
+    parser.add_argument("--users", type=int, default=200, help="模拟用户数")
+    parser.add_argument("--senders", type=int, default=10, help="群聊洪泛场景中的发送者数")
+    parser.add_argument("--messages", type=int, default=100, help="每个发送者发送的消息数")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="每个发送者每秒发送的消息数（0 表示尽快发送）")
+    parser.add_argument("--duration", type=float, default=10, help="上下线抖动场景持续时间（秒）")
+    parser.add_argument("--concurrency", type=int, default=500, help="同时进行的登录握手数上限")
+    parser.add_argument("--timeout", type=float, default=60, help="等待消息投递完成的最长时间（秒）")
+    parser.add_argument("--host", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--spawn-server", choices=["thread", "async"],
+                        help="在临时目录中以指定模式启动服务器（压测结束后关闭）")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="与 --spawn-server 一起使用：以多进程模式启动服务器的 worker 数")
+    parser.add_argument("--server-pid", type=int,
+                        help="已运行服务器的进程号（用于读取内存占用，多进程模式下含全部 worker）")
+    parser.add_argument("--compression", choices=["", COMPRESSION_ZLIB], default="",
+                        help="模拟用户登录时请求的压缩方式（默认不压缩）")
+    parser.add_argument("--output", help="结果 JSON 文件（默认输出到标准输出）")
+    return parser.parse_args()
+
+def child_pids(pid):
+    """直接子进程（多进程模式下的 worker）"""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def read_rss_mb(pid):
+    """读取进程（含子进程）当前/峰值常驻内存之和（MB），非 Linux 平台返回 None"""
+    if pid is None:
+        return None, None
+    totals = {"VmRSS": 0, "VmHWM": 0}
+    for process_id in [pid, *child_pids(pid)]:
+        try:
+            with open(f"/proc/{process_id}/status", encoding="utf-8") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            if process_id == pid:
+                return None, None
+            continue
+        for key in totals:
+            if key in fields:
+                totals[key] += int(fields[key].split()[0])
+    return round(totals["VmRSS"] / 1024, 1), round(totals["VmHWM"] / 1024, 1)
+
+def spawn_server(mode, port, backlog, workers=0):
+    """在临时目录中启动服务器（独立的配置文件和数据库，不影响本地数据），等待端口可连接。
+    关闭限流：压测的所有模拟用户来自同一 IP，且要测的是转发能力上限"""
+    workdir = tempfile.mkdtemp(prefix="chat-bench-")
+    config = dict(DEFAULT_CONFIG, server_port=port, server_mode=mode, listen_backlog=backlog,
+                  workers=workers, rate_limit_user=0, rate_limit_ip=0, rate_limit_room=0)
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    env = dict(os.environ, PYTHONPATH=MAIN_DIR)
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    process = subprocess.Popen([sys.executable, "-m", "server.main", "--mode", mode],
+                               cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process, workdir
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    stop_server(process, workdir)
+    raise RuntimeError(f"服务器启动失败，日志：{os.path.join(workdir, 'server.log')}")
+
+def stop_server(process, workdir):
+    """Ctrl+C 方式关闭服务器（让其打印统计并刷盘），再删除临时目录"""
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+async def run_scenarios(names, options, server_pid):
+    results = {}
+    for name in names:
+        print(f"▶️  运行场景 {name} ...", file=sys.stderr)
+        result = await SCENARIOS[name](options.host, options.port, options)
+        result["server_rss_mb"], result["server_peak_rss_mb"] = read_rss_mb(server_pid)
+        results[name] = result
+        print(f"✅ {name}：{json.dumps(result, ensure_ascii=False)}", file=sys.stderr)
+    return results
+
+def main():
+    options = parse_args()
+    raise_fd_limit()
+    names = list(SCENARIOS) if options.scenario == "all" else [options.scenario]
+
+    process = workdir = None
+    server_pid = options.server_pid
+    if options.spawn_server:
+        options.host = "127.0.0.1"
+        process, workdir = spawn_server(options.spawn_server, options.port,
+                                        max(1024, options.concurrency), options.workers)
+        server_pid = process.pid
+    try:
+        results = asyncio.run(run_scenarios(names, options, server_pid))
+    finally:
+        if process is not None:
+            stop_server(process, workdir)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "server_mode": options.spawn_server or "external",
+        "server_workers": options.workers if options.spawn_server else None,
+        "compression": options.compression or None,
+        "options": {key: value for key, value in vars(options).items() if key != "output"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"📄 结果已写入 {options.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""压测场景：登录风暴、群聊洪泛、私聊网状、上下线抖动
+
+每个场景返回一个结果字典（吞吐、延迟分位数等），由 benchmark/main.py 汇总为 JSON。
+"""
+import asyncio
+import random
+import time
+from benchmark.sim_user import SimUser, BenchStats
+
+DRAIN_IDLE_SECONDS = 2.0  # 投递数量不再增长超过该时间即认为已收完
+
+def percentiles_ms(samples_ns):
+    """p50 / p99 / p999 / 最大值（毫秒）"""
+    if not samples_ns:
+        return {"p50": None, "p99": None, "p999": None, "max": None}
+    ordered = sorted(samples_ns)
+    def at(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] / 1e6, 3)
+    return {"p50": at(0.50), "p99": at(0.99), "p999": at(0.999),
+            "max": round(ordered[-1] / 1e6, 3)}
+
+async def login_all(names, host, port, stats, concurrency, compression=""):
+    """并发登录一批用户（同时进行中的握手数不超过 concurrency），返回登录成功的用户"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(name):
+        async with semaphore:
+            user = SimUser(name, stats, compression)
+            return user if await user.login(host, port) else None
+    users = await asyncio.gather(*(one(name) for name in names))
+    return [user for user in users if user is not None]
+
+async def close_all(users):
+    await asyncio.gather(*(user.close() for user in users))
+
+async def wait_deliveries(stats, expected, timeout):
+    """等待投递数达到预期，或长时间不再增长"""
+    deadline = time.monotonic() + timeout
+    last, last_change = stats.received, time.monotonic()
+    while stats.received < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        if stats.received != last:
+            last, last_change = stats.received, time.monotonic()
+        elif time.monotonic() - last_change > DRAIN_IDLE_SECONDS:
+            break
+
+async def pace(rate, sent, start):
+    """按每秒 rate 条的速率发送（rate 为 0 时只让出事件循环）"""
+    if rate > 0:
+        delay = start + sent / rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            return
+    await asyncio.sleep(0)
+
+def user_names(prefix, count):
+    return [f"{prefix}{i}" for i in range(count)]
+
+async def login_storm(host, port, options):
+    """登录风暴：全部用户同时登录"""
+    stats = BenchStats()
+    start = time.perf_counter()
+    users = await login_all(user_names("storm", options.users), host, port, stats,
+                            options.concurrency, options.compression)
+    elapsed = time.perf_counter() - start
+    await close_all(users)
+    return {
+        "logins": len(users),
+        "failed_logins": stats.failed_logins,
+        "elapsed_s": round(elapsed, 3),
+        "connections_per_sec": round(len(users) / elapsed, 1),
+        "login_latency_ms": percentiles_ms(stats.login_ns),
+        "bytes_received": stats.bytes_received,
+    }
+
+async def group_flood(host, port, options):
+    """群聊洪泛：部分用户持续向大厅发消息，全部用户接收"""
+    stats = BenchStats()
+    users = await login_all(user_names("flood", options.users), host, port, stats,
+                            options.concurrency, options.compression)
+    await asyncio.sleep(0.5)  # 等上线通知发完，避免计入测量
+    senders = users[:max(1, min(options.senders, len(users)))]
+
+    async def flood(user):
+        start = time.monotonic()
+        for sent in range(options.messages):
+            await user.send_group()
+            await pace(options.rate, sent + 1, start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(flood(user) for user in senders))
+    send_elapsed = time.perf_counter() - start
+    expected = len(senders) * options.messages * (len(users) - 1)
+    await wait_deliveries(stats, expected, options.timeout)
+    elapsed = time.perf_counter() - start
+    await close_all(users)
+    return {
+        "users": len(users),
+        "senders": len(senders),
+        "messages_sent": len(senders) * options.messages,
+        "send_elapsed_s": round(send_elapsed, 3),
+        "deliveries": stats.received,
+        "expected_deliveries": expected,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_sec": round(len(senders) * options.messages / elapsed, 1),
+        "deliveries_per_sec": round(stats.received / elapsed, 1),
+        "latency_ms": percentiles_ms(stats.latencies_ns),
+    }
+
+async def private_mesh(host, port, options):
+    """私聊网状：每个用户向随机的其他用户发私聊"""
+    stats = BenchStats()
+    users = await login_all(user_names("mesh", options.users), host, port, stats,
+                            options.concurrency, options.compression)
+    await asyncio.sleep(0.5)
+    names = [user.name for user in users]
+
+    async def chatter(user):
+        start = time.monotonic()
+        for sent in range(options.messages):
+            target = random.choice(names)
+            while target == user.name and len(names) > 1:
+                target = random.choice(names)
+            await user.send_private(target)
+            await pace(options.rate, sent + 1, start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(chatter(user) for user in users))
+    send_elapsed = time.perf_counter() - start
+    expected = len(users) * options.messages
+    await wait_deliveries(stats, expected, options.timeout)
+    elapsed = time.perf_counter() - start
+    await close_all(users)
+    return {
+        "users": len(users),
+        "messages_sent": expected,
+        "deliveries": stats.received,
+        "elapsed_s": round(elapsed, 3),
+        "send_elapsed_s": round(send_elapsed, 3),
+        "messages_per_sec": round(expected / elapsed, 1),
+        "latency_ms": percentiles_ms(stats.latencies_ns),
+    }
+
+async def churn(host, port, options):
+    """上下线抖动：一半用户保持在线观察，另一半反复登录、下线"""
+    stats = BenchStats()
+    observers = await login_all(user_names("watch", max(1, options.users // 2)), host, port,
+                                stats, options.concurrency, options.compression)
+    frames_before, bytes_before = stats.frames, stats.bytes_received
+    churn_stats = BenchStats()
+    deadline = time.monotonic() + options.duration
+
+    async def flapper(name):
+        cycles = 0
+        while time.monotonic() < deadline:
+            user = SimUser(name, churn_stats, options.compression)
+            if await user.login(host, port):
+                cycles += 1
+                await asyncio.sleep(random.uniform(0, 0.2))
+                await user.close()
+            else:
+                await asyncio.sleep(0.1)
+        return cycles
+
+    start = time.perf_counter()
+    cycles = await asyncio.gather(*(flapper(name) for name in
+                                    user_names("flap", max(1, options.users - len(observers)))))
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.5)
+    presence_frames = stats.frames - frames_before
+    presence_bytes = stats.bytes_received - bytes_before
+    await close_all(observers)
+    return {
+        "observers": len(observers),
+        "flapping_users": len(cycles),
+        "login_cycles": sum(cycles),
+        "failed_logins": churn_stats.failed_logins,
+        "elapsed_s": round(elapsed, 3),
+        "connections_per_sec": round(sum(cycles) / elapsed, 1),
+        "login_latency_ms": percentiles_ms(churn_stats.login_ns),
+        "presence_frames_per_observer": round(presence_frames / max(1, len(observers)), 1),
+        "presence_bytes_per_observer": round(presence_bytes / max(1, len(observers)), 1),
+    }
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "group_flood": group_flood,
+    "private_mesh": private_mesh,
+    "churn": churn,
+}
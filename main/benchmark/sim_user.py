@@ -0,0 +1,105 @@
+"""模拟用户：无界面的协议客户端（与 client/core.py 使用同一套帧格式）
+
+消息内容带上发送时刻（perf_counter_ns），收到后即可算出端到端投递延迟；
+发送方与接收方都在压测进程内，时钟一致。
+"""
+import asyncio
+import time
+from config import BUFFER_SIZE
+from protocol import (MSG_LOGIN, MSG_GROUP, MSG_PRIVATE, MSG_EXIT, DEFAULT_ROOM,
+                      FrameDecoder, encode_frame, encode_login, split_fields)
+
+BENCH_TAG = "bench:"  # 压测消息内容前缀，后接发送时刻（纳秒）
+
+class BenchStats:
+    """一个场景的统计：投递延迟、收到的消息数、登录耗时、收到的字节数"""
+    def __init__(self):
+        self.latencies_ns = []
+        self.login_ns = []
+        self.received = 0
+        self.frames = 0
+        self.bytes_received = 0
+        self.failed_logins = 0
+
+    def record_delivery(self, content):
+        if content.startswith(BENCH_TAG):
+            self.latencies_ns.append(time.perf_counter_ns() - int(content[len(BENCH_TAG):]))
+            self.received += 1
+
+class SimUser:
+    """一个模拟用户（asyncio 连接）"""
+    def __init__(self, name, stats, compression=""):
+        self.name = name
+        self.stats = stats
+        self.compression = compression  # 登录时请求的压缩方式
+        self.reader = None
+        self.writer = None
+        self.decoder = FrameDecoder()
+        self.reader_task = None
+
+    async def login(self, host, port):
+        """连接并登录，成功后开始后台接收；返回是否登录成功"""
+        start = time.perf_counter_ns()
+        try:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+            self.writer.write(encode_login(self.name, self.compression))
+            success = await self._wait_login_response()
+        except OSError:
+            success = False
+        if not success:
+            self.stats.failed_logins += 1
+            await self.close(send_exit=False)
+            return False
+        self.stats.login_ns.append(time.perf_counter_ns() - start)
+        self.reader_task = asyncio.create_task(self._read_loop())
+        return True
+
+    async def _wait_login_response(self):
+        while True:
+            data = await self.reader.read(BUFFER_SIZE)
+            if not data:
+                return False
+            self.stats.bytes_received += len(data)
+            for msg_type, payload in self.decoder.feed(data):
+                if msg_type == MSG_LOGIN:
+                    return split_fields(payload, 2)[0] == "1"
+
+    async def _read_loop(self):
+        """持续接收，统计带压测前缀的群聊/私聊消息"""
+        try:
+            while True:
+                data = await self.reader.read(BUFFER_SIZE)
+                if not data:
+                    return
+                self.stats.bytes_received += len(data)
+                for msg_type, payload in self.decoder.feed(data):
+                    self.stats.frames += 1
+                    if msg_type == MSG_GROUP:
+                        self.stats.record_delivery(split_fields(payload, 5)[4])
+                    elif msg_type == MSG_PRIVATE:
+                        self.stats.record_delivery(split_fields(payload, 2)[1])
+        except (OSError, asyncio.CancelledError):
+            return
+
+    async def send_group(self, room=DEFAULT_ROOM):
+        self.writer.write(encode_frame(MSG_GROUP, room, f"{BENCH_TAG}{time.perf_counter_ns()}"))
+        await self.writer.drain()
+
+    async def send_private(self, target):
+        self.writer.write(encode_frame(MSG_PRIVATE, target, f"{BENCH_TAG}{time.perf_counter_ns()}"))
+        await self.writer.drain()
+
+    async def close(self, send_exit=True):
+        """下线（默认先发送退出帧，服务器不保留续传会话）"""
+        if self.writer is None:
+            return
+        try:
+            if send_exit:
+                self.writer.write(encode_frame(MSG_EXIT))
+                await self.writer.drain()
+            self.writer.close()
+        except OSError:
+            pass
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        self.writer = None
@@ -0,0 +1,122 @@
+"""命令行机器人：基于 ChatClient（不依赖 PyQt6），一个进程内可运行大量机器人
+
+示例：
+    python -m client.bot --name watcher                        # 打印收到的消息
+    python -m client.bot --name echo --echo                    # 把收到的私聊原样回复
+    python -m client.bot --name bot --count 1000 --say "hello" --interval 5 --duration 60
+    python -m client.bot --name dev --room 技术 --say "构建完成"
+多个机器人时用户名依次为 name0、name1……，只打印第一个机器人收到的消息。
+"""
+import argparse
+import asyncio
+import time
+from config import SERVER_IP, SERVER_PORT
+from protocol import DEFAULT_ROOM
+from messages import GroupMessage, HistoryMessage, PrivateMessage, SystemNotice, RoomJoined, RoomLeft
+from client.chat_client import ChatClient, MAX_PENDING
+from util import raise_fd_limit
+
+JOIN_WAIT = 5  # 发言前等待加入房间确认的最长时间（秒）
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SimpleChatApp 命令行机器人")
+    parser.add_argument("--name", default="bot", help="用户名（多个机器人时作为前缀）")
+    parser.add_argument("--count", type=int, default=1, help="机器人数量")
+    parser.add_argument("--room", default=DEFAULT_ROOM, help="加入并发言的房间")
+    parser.add_argument("--say", help="发言内容（不指定时不发言）")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="发言间隔（秒，0 表示只发言一次）")
+    parser.add_argument("--echo", action="store_true", help="把收到的私聊原样回复给对方")
+    parser.add_argument("--duration", type=float, default=0, help="运行时间（秒，0 表示直到 Ctrl+C）")
+    parser.add_argument("--concurrency", type=int, default=500, help="同时进行的登录握手数上限")
+    parser.add_argument("--host", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    return parser.parse_args()
+
+def format_message(message):
+    """一条消息的单行文本"""
+    if isinstance(message, HistoryMessage):
+        return f"[{message.room}] (历史) [{message.sender}] {message.time_str} {message.content}"
+    if isinstance(message, GroupMessage):
+        return f"[{message.room}] [{message.sender}] {message.time_str} {message.content}"
+    if isinstance(message, PrivateMessage):
+        return f"[私聊] [{message.sender}] {message.content}"
+    if isinstance(message, SystemNotice):
+        return f"[系统] {message.text}"
+    if isinstance(message, RoomJoined):
+        return f"[{message.room}] {message.username} 加入了房间"
+    if isinstance(message, RoomLeft):
+        return f"[{message.room}] {message.username} 离开了房间"
+    return repr(message)
+
+async def say_loop(client, options):
+    """加入房间后按间隔发言"""
+    deadline = time.monotonic() + JOIN_WAIT
+    while options.room not in client.rooms and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    while True:
+        client.send_group(options.say, options.room)
+        await client.drain()
+        if not options.interval:
+            return
+        await asyncio.sleep(options.interval)
+
+async def run_bot(client, options, verbose):
+    """运行一个已登录的机器人，直到连接结束"""
+    if options.room != DEFAULT_ROOM:
+        client.join_room(options.room)
+    say_task = asyncio.create_task(say_loop(client, options)) if options.say else None
+    try:
+        async for message in client:
+            if verbose:
+                print(format_message(message))
+            if options.echo and isinstance(message, PrivateMessage):
+                client.send_private(message.sender, message.content)
+    finally:
+        if say_task is not None:
+            say_task.cancel()
+    if verbose and client.error:
+        print(f"{client.username}：{client.error}")
+
+async def run(options):
+    count = max(options.count, 1)
+    names = [options.name] if count == 1 else [f"{options.name}{i}" for i in range(count)]
+    semaphore = asyncio.Semaphore(options.concurrency)
+    clients = []
+    for i, name in enumerate(names):
+        # 不打印也不回复的机器人不保留消息，只维护连接与在线状态
+        consumes = i == 0 or options.echo
+        clients.append(ChatClient(name, options.host, options.port,
+                                  max_pending=MAX_PENDING if consumes else 0))
+
+    async def login(client):
+        async with semaphore:
+            if not await client.connect():
+                print(f"{client.username} 登录失败：{client.error}")
+                return False
+            return True
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login(client) for client in clients))
+    print(f"已登录 {sum(results)}/{count} 个机器人（{time.perf_counter() - start:.2f} 秒）")
+    bots = [run_bot(client, options, i == 0) for i, (client, ok) in enumerate(zip(clients, results)) if ok]
+    try:
+        if options.duration:
+            await asyncio.wait_for(asyncio.gather(*bots), options.duration)
+        else:
+            await asyncio.gather(*bots)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        await asyncio.gather(*(client.close() for client in clients))
+
+def main():
+    options = parse_args()
+    raise_fd_limit()
+    try:
+        asyncio.run(run(options))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
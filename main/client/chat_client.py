@@ -0,0 +1,312 @@
+"""asyncio 聊天客户端：不依赖 PyQt6，供机器人、集成测试和压测工具使用
+
+与图形客户端共用 ClientCore（登录、在线状态、断线续传、心跳），只负责 asyncio 连接与任务：
+    client = ChatClient("bot")
+    if await client.connect():
+        client.send_group("大家好")
+        async for message in client:  # GroupMessage / HistoryMessage / PrivateMessage / SystemNotice / RoomJoined / RoomLeft
+            ...
+在线状态通过 client.online（当前在线用户集合）和 add_presence_callback() 获取。
+每个客户端只有一个接收任务和一个心跳任务、没有线程，一个进程内可以运行数千个实例。
+"""
+import asyncio
+import time
+from config import SERVER_IP, SERVER_PORT, BUFFER_SIZE, CONNECT_TIMEOUT, HEARTBEAT_INTERVAL
+from protocol import DEFAULT_ROOM, HISTORY_LAST, FrameDecoder, ProtocolError
+from messages import PrivateMessage, SystemNotice, RoomJoined, RoomLeft
+from client.core import ClientCore, ClientListener, RECONNECT_INTERVAL, RESUME_TIMEOUT
+
+MAX_PENDING = 1000  # 未取走的消息上限，超出时丢弃最早的消息
+
+_END = object()  # 消息迭代结束标记
+
+def parse_online_list(online_list):
+    """解析在线列表（逗号分隔，"无" 表示为空）"""
+    if not online_list or online_list == "无":
+        return set()
+    return {name.strip() for name in online_list.split(",") if name.strip()}
+
+class ChatClient(ClientListener):
+    """一个用户的 asyncio 客户端（必须在事件循环中使用）"""
+    def __init__(self, username, host=SERVER_IP, port=SERVER_PORT, cache=None, max_pending=MAX_PENDING):
+        self.username = username
+        self.address = (host, port)
+        self.core = ClientCore(username, self._send, listener=self, cache=cache)
+        self.reader = None
+        self.writer = None  # 未连接（或正在重连）时为 None
+        self.decoder = FrameDecoder()
+        self.last_received = time.monotonic()  # 最后收到服务器数据的时间（心跳检查用）
+        self.abort_reason = ""  # 主动中断连接的原因（心跳超时）
+        self.closed = False
+        self.error = ""  # 最近一次错误（连接失败、登录失败、连接中断且无法恢复）
+        self.online = set()  # 当前在线的用户
+        self.rooms = {DEFAULT_ROOM}  # 已加入的房间（会话过期重新登录后自动重新加入）
+        self.presence_callbacks = []
+        self.messages = asyncio.Queue()  # 等待 async for 取走的消息
+        self.max_pending = max_pending  # None 表示不限；0 表示不保留消息（只使用回调）
+        self.login_future = None
+        self.logged_in = False
+        self.run_task = None
+        self.heartbeat_task = None
+        self.presence_check = None  # 在线状态缺口检查（loop.call_later 句柄）
+
+    # ---------- 连接 ----------
+
+    async def connect(self, timeout=CONNECT_TIMEOUT):
+        """连接并登录，返回是否登录成功（失败原因见 self.error）"""
+        self.login_future = asyncio.get_running_loop().create_future()
+        try:
+            await self._open(timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.error = f"连接服务器失败：{e or '连接超时'}"
+            self.closed = True
+            self._put(_END)
+            return False
+        self._send(self.core.login_frame())
+        self.run_task = asyncio.create_task(self._run())
+        try:
+            success = await asyncio.wait_for(asyncio.shield(self.login_future), timeout)
+        except asyncio.TimeoutError:
+            self.error = "登录超时"
+            success = False
+        if not success:
+            await self.close(send_exit=False)
+            return False
+        if HEARTBEAT_INTERVAL:
+            self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        return True
+
+    async def close(self, send_exit=True):
+        """下线（默认先发送退出帧，服务器不保留续传会话），消息迭代随之结束"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer is not None:
+            if send_exit:
+                self.core.send_exit()
+            try:
+                await self.writer.drain()
+            except OSError:
+                pass
+            self._close_writer()
+        if self.run_task is not None:
+            self.run_task.cancel()
+            try:
+                await self.run_task
+            except asyncio.CancelledError:
+                pass
+        else:
+            self._finish()
+
+    async def drain(self):
+        """等待发送缓冲区写出（大量发送时用于流量控制）"""
+        if self.writer is not None:
+            try:
+                await self.writer.drain()
+            except OSError:
+                pass
+
+    async def _open(self, timeout):
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(*self.address), timeout)
+        self.decoder = FrameDecoder()
+        self.abort_reason = ""
+        self.last_received = time.monotonic()
+
+    def _send(self, data):
+        """ClientCore 的发送函数：写入连接的发送缓冲区，未连接时返回 False"""
+        writer = self.writer
+        if writer is None or writer.is_closing():
+            return False
+        writer.write(data)
+        return True
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def _run(self):
+        """接收直到连接断开；有会话时在宽限期内重连并续传，否则结束"""
+        try:
+            reason = await self._read_frames()
+            while not self.closed:
+                delay = self.core.connection_lost(reason)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                if self.closed:
+                    break
+                remaining = self.core.reconnect_remaining()
+                if remaining is None:
+                    break
+                try:
+                    await self._open(min(remaining, RECONNECT_INTERVAL * 3))
+                except (OSError, asyncio.TimeoutError) as e:
+                    reason = str(e) or "连接超时"
+                    continue
+                self.core.start_resume()
+                reason = await self._read_frames()
+        finally:
+            self._finish()
+
+    async def _read_frames(self):
+        """接收并处理帧直到连接断开，返回断开原因（空字符串表示服务器关闭了连接）"""
+        reader = self.reader
+        try:
+            while True:
+                if self.core.resuming:
+                    data = await asyncio.wait_for(reader.read(BUFFER_SIZE), RESUME_TIMEOUT)
+                else:
+                    data = await reader.read(BUFFER_SIZE)
+                if not data:
+                    return self.abort_reason
+                self.last_received = time.monotonic()
+                for msg_type, payload in self.decoder.feed(data):
+                    self.core.handle_frame(msg_type, payload)
+                if self.presence_check is None:
+                    self._schedule_presence_check()
+        except asyncio.TimeoutError:
+            return "续传无应答"
+        except (OSError, ProtocolError) as e:
+            return self.abort_reason or str(e)
+        finally:
+            if self.reader is reader:
+                self._close_writer()
+
+    async def _heartbeat_loop(self):
+        """空闲超过 HEARTBEAT_INTERVAL 时发送心跳，超过 HEARTBEAT_TIMEOUT 视为服务器失联并重连"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if self.writer is None or self.core.resuming:
+                continue
+            if not self.core.check_heartbeat(time.monotonic() - self.last_received):
+                self.abort_reason = "心跳超时，服务器无响应"
+                self.writer.transport.abort()
+
+    def _schedule_presence_check(self):
+        remaining = self.core.presence_gap_remaining()
+        if remaining is not None:
+            self.presence_check = asyncio.get_running_loop().call_later(remaining, self._check_presence_gap)
+
+    def _check_presence_gap(self):
+        """在线状态版本号缺口超时后请求完整在线列表"""
+        self.presence_check = None
+        self.core.check_presence_gap()
+        self._schedule_presence_check()
+
+    def _finish(self):
+        """连接不再恢复：结束登录等待、心跳与消息迭代"""
+        self.closed = True
+        if self.login_future is not None and not self.login_future.done():
+            self.login_future.set_result(False)
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+        if self.presence_check is not None:
+            self.presence_check.cancel()
+            self.presence_check = None
+        self._put(_END)
+
+    # ---------- 发送 ----------
+
+    def send_group(self, content, room=DEFAULT_ROOM):
+        return self.core.send_group(content, room)
+
+    def send_private(self, target, content):
+        return self.core.send_private(target, content)
+
+    def join_room(self, room):
+        return self.core.join_room(room)
+
+    def leave_room(self, room):
+        return self.core.leave_room(room)
+
+    def request_history(self, room, count, mode=HISTORY_LAST):
+        return self.core.request_history(room, count, mode)
+
+    # ---------- 接收 ----------
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.messages.get()
+        if message is _END:
+            self.messages.put_nowait(_END)  # 之后的迭代同样立即结束
+            raise StopAsyncIteration
+        return message
+
+    def _put(self, message):
+        if message is not _END and self.max_pending is not None:
+            if self.max_pending <= 0:
+                return
+            if self.messages.qsize() >= self.max_pending:
+                self.messages.get_nowait()  # 丢弃最早的消息
+        self.messages.put_nowait(message)
+
+    def add_presence_callback(self, callback):
+        """注册在线状态回调 callback(username, online)：用户上线时 online 为 True，下线时为 False"""
+        self.presence_callbacks.append(callback)
+
+    def _set_online(self, usernames):
+        """以完整在线列表为准，对变化的用户调用回调"""
+        joined, left = usernames - self.online, self.online - usernames
+        self.online = usernames
+        for username in left:
+            self._notify_presence(username, False)
+        for username in joined:
+            self._notify_presence(username, True)
+
+    def _notify_presence(self, username, online):
+        for callback in self.presence_callbacks:
+            callback(username, online)
+
+    # ---------- ClientListener ----------
+
+    def on_login_result(self, success, online_list):
+        if success:
+            self._set_online(parse_online_list(online_list))
+            if self.logged_in:
+                for room in self.rooms - {DEFAULT_ROOM}:
+                    self.join_room(room)  # 会话过期后重新登录：重新加入之前的房间
+            self.logged_in = True
+        if self.login_future is not None and not self.login_future.done():
+            self.login_future.set_result(success)
+
+    def on_group_message(self, message):
+        self._put(message)
+
+    def on_history_message(self, message):
+        self._put(message)
+
+    def on_private_message(self, sender, content):
+        self._put(PrivateMessage(sender, content))
+
+    def on_system_message(self, text):
+        self._put(SystemNotice(text))
+
+    def on_online_list(self, online_list):
+        self._set_online(parse_online_list(online_list))
+
+    def on_user_joined(self, username):
+        if username not in self.online:
+            self.online.add(username)
+            self._notify_presence(username, True)
+
+    def on_user_left(self, username):
+        if username in self.online:
+            self.online.discard(username)
+            self._notify_presence(username, False)
+
+    def on_room_joined(self, room, username):
+        if username == self.username:
+            self.rooms.add(room)
+        self._put(RoomJoined(room, username))
+
+    def on_room_left(self, room, username):
+        if username == self.username:
+            self.rooms.discard(room)
+        self._put(RoomLeft(room, username))
+
+    def on_error(self, text):
+        self.error = text
@@ -1,28 +1,43 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QLineEdit, QTextEdit, QPushButton, QLabel, QListWidget,
-                             QListWidgetItem, QMessageBox)
-from PyQt6.QtGui import QFont, QColor, QTextCursor
-from PyQt6.QtCore import Qt
+                             QLineEdit, QPushButton, QLabel, QListView,
+                             QMessageBox, QTabWidget, QInputDialog)
+from PyQt6.QtGui import QFont
+from PyQt6.QtCore import QTimer
 from client.message_sender import MessageSender
-from client.message_receiver import ReceiveThread
+from client.message_receiver import MessageReceiver
 from client.private_chat_ui import PrivateChatWindow
+from client.online_model import OnlineUserModel, OnlineFilterModel, USERNAME_ROLE
+from client.message_view import MessageView, KIND_NORMAL, KIND_SELF, KIND_SYSTEM, KIND_HISTORY
+from client.message_cache import open_message_cache, group_key, FLUSH_INTERVAL
+from client.search_ui import SearchDialog
+from config import HISTORY_ON_LOGIN, RENDER_FPS
+from protocol import DEFAULT_ROOM, HISTORY_SINCE
 from datetime import datetime
 
+EXIT_FLUSH_TIMEOUT = 0.5  # 退出时等待发送队列（含下线帧）发完的最长时间（秒）
+
 def get_current_time():
     """获取当前时间，格式：hh:mm:ss"""
     return datetime.now().strftime("%H:%M:%S")
 
 class ChatWindow(QMainWindow):
     """聊天主窗口（含下线按钮+时间戳）"""
-    def __init__(self, username, client_socket):
+    def __init__(self, username, connection):
         super().__init__()
         self.username = username
-        self.client_socket = client_socket
-        self.receive_thread = None
-        self.sender = MessageSender(client_socket, username, self._display_self_message)
+        self.connection = connection  # 已连接且已发送登录帧的 ClientConnection
+        self.cache = open_message_cache(username, connection.address)  # 本地消息缓存（未启用时为 None）
+        self.cache_cursors = {}  # 房间名 -> 已从本地缓存加载的最早消息的本地ID（0 表示已全部加载）
+        self.receiver = MessageReceiver(connection, username, self.cache, self)
+        self.sender = MessageSender(self.receiver.core, self._display_self_message)
         self.private_chat_windows = {}
+        self.room_views = {}    # 房间名 -> 消息显示区域（每个房间一个标签页）
+        self.pending_messages = {}  # 房间名 -> 等待显示的实时消息 [(类别, 文本)]
+        self.pending_history = {}   # 房间名 -> 等待显示的历史消息 [(类别, 文本)]
+        self.logged_in = False      # 是否已登录过（之后的登录成功为会话过期后的重新登录）
+        self.catching_up = set()    # 重新登录后补齐过的房间：此后收到的历史消息是断线期间错过的，追加在实时消息之后
         self.init_ui()
-        self.start_receive_thread()
+        self.start_receiver()
 
     def init_ui(self):
         """初始化UI（含下线按钮）"""
@@ -49,18 +64,40 @@ class ChatWindow(QMainWindow):
         online_title.setStyleSheet("color: #2c3e50;")
         left_layout.addWidget(online_title)
 
-        self.online_list_widget = QListWidget()
-        self.online_list_widget.setFont(self.list_font)
-        self.online_list_widget.setStyleSheet("""
+        self.online_search = QLineEdit()
+        self.online_search.setFont(self.list_font)
+        self.online_search.setPlaceholderText("搜索用户")
+        self.online_search.setClearButtonEnabled(True)
+        self.online_search.setFixedWidth(150)
+        self.online_search.setStyleSheet("""
+            background-color: white;
+            border: 1px solid #ddd;
+            border-radius: 5px;
+            padding: 4px;
+        """)
+        left_layout.addWidget(self.online_search)
+
+        # 在线列表：源模型按用户名增量维护，过滤模型负责搜索
+        self.online_model = OnlineUserModel(self.username, self.list_font,
+                                            QFont("微软雅黑", 9, QFont.Weight.Bold), self)
+        self.online_filter = OnlineFilterModel(self)
+        self.online_filter.setSourceModel(self.online_model)
+        self.online_search.textChanged.connect(self.online_filter.set_keyword)
+
+        self.online_list_view = QListView()
+        self.online_list_view.setModel(self.online_filter)
+        self.online_list_view.setFont(self.list_font)
+        self.online_list_view.setUniformItemSizes(True)
+        self.online_list_view.setEditTriggers(QListView.EditTrigger.NoEditTriggers)
+        self.online_list_view.setStyleSheet("""
             background-color: white;
             border: 1px solid #ddd;
             border-radius: 5px;
             padding: 5px;
         """)
-        self.online_list_widget.setFixedWidth(150)
-        self.online_list_widget.itemDoubleClicked.connect(self.on_item_double_click)
-        self._add_online_item("加载中...", is_system=True)
-        left_layout.addWidget(self.online_list_widget, stretch=1)
+        self.online_list_view.setFixedWidth(150)
+        self.online_list_view.doubleClicked.connect(self.on_item_double_click)
+        left_layout.addWidget(self.online_list_view, stretch=1)
 
         main_layout.addLayout(left_layout)
 
@@ -75,6 +112,31 @@ class ChatWindow(QMainWindow):
         self.status_label.setStyleSheet("color: #666;")
         status_layout.addWidget(self.status_label, stretch=1)
 
+        self.join_room_btn = QPushButton("加入房间")
+        self.join_room_btn.setFont(self.normal_font)
+        self.join_room_btn.setStyleSheet("""
+            background-color: #2ecc71;
+            color: white;
+            border: none;
+            border-radius: 5px;
+            padding: 6px 12px;
+        """)
+        self.join_room_btn.clicked.connect(self.do_join_room)
+        status_layout.addWidget(self.join_room_btn)
+
+        self.search_btn = QPushButton("搜索记录")
+        self.search_btn.setFont(self.normal_font)
+        self.search_btn.setStyleSheet("""
+            background-color: #9b59b6;
+            color: white;
+            border: none;
+            border-radius: 5px;
+            padding: 6px 12px;
+        """)
+        self.search_btn.clicked.connect(self.do_search)
+        self.search_btn.setEnabled(self.cache is not None)
+        status_layout.addWidget(self.search_btn)
+
         self.logout_btn = QPushButton("下线")
         self.logout_btn.setFont(self.normal_font)
         self.logout_btn.setStyleSheet("""
@@ -88,17 +150,14 @@ class ChatWindow(QMainWindow):
         status_layout.addWidget(self.logout_btn)
         right_layout.addLayout(status_layout)
 
-        # 消息显示区域
-        self.msg_display = QTextEdit()
-        self.msg_display.setReadOnly(True)
-        self.msg_display.setFont(self.normal_font)
-        self.msg_display.setStyleSheet("""
-            background-color: white;
-            border: 1px solid #ddd;
-            border-radius: 5px;
-            padding: 10px;
-        """)
-        right_layout.addWidget(self.msg_display, stretch=1)
+        # 消息显示区域（房间标签页，大厅不可关闭）
+        self.room_tabs = QTabWidget()
+        self.room_tabs.setFont(self.normal_font)
+        self.room_tabs.setTabsClosable(True)
+        self.room_tabs.tabCloseRequested.connect(self.on_room_tab_close)
+        self._add_room_tab(DEFAULT_ROOM)
+        self.room_tabs.tabBar().setTabButton(0, self.room_tabs.tabBar().ButtonPosition.RightSide, None)
+        right_layout.addWidget(self.room_tabs, stretch=1)
 
         # 消息输入区域
         input_layout = QHBoxLayout()
@@ -130,6 +189,132 @@ class ChatWindow(QMainWindow):
 
         main_layout.addLayout(right_layout, stretch=1)
 
+        # 消息刷新定时器：收到的消息先缓存，每帧合并为一次更新
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(1000 // RENDER_FPS if RENDER_FPS > 0 else 0)
+        self.render_timer.timeout.connect(self._flush_messages)
+
+        # 本地缓存定时提交：期间收到的消息合并为一个事务
+        if self.cache is not None:
+            self.cache_timer = QTimer(self)
+            self.cache_timer.timeout.connect(self.cache.flush)
+            self.cache_timer.start(int(FLUSH_INTERVAL * 1000))
+
+    def _add_room_tab(self, room):
+        """新建房间标签页"""
+        msg_display = MessageView(self.normal_font, self.bold_font)
+        msg_display.setStyleSheet("""
+            background-color: white;
+            border: 1px solid #ddd;
+            border-radius: 5px;
+            padding: 10px;
+        """)
+        msg_display.top_reached.connect(lambda: self._load_older_messages(room))
+        self.room_views[room] = msg_display
+        self.room_tabs.addTab(msg_display, room)
+        return msg_display
+
+    def current_room(self):
+        """当前标签页对应的房间"""
+        return self.room_tabs.tabText(self.room_tabs.currentIndex()) or DEFAULT_ROOM
+
+    def do_join_room(self):
+        """输入房间名并请求加入"""
+        room, ok = QInputDialog.getText(self, "加入房间", "房间名（1-20个字符）：")
+        room = room.strip()
+        if not ok or not room:
+            return
+        if room in self.room_views:
+            self.room_tabs.setCurrentWidget(self.room_views[room])
+            return
+        self.sender.join_room(room)
+
+    def on_room_tab_close(self, index):
+        """关闭房间标签页即离开房间（服务器确认后移除标签页）"""
+        room = self.room_tabs.tabText(index)
+        if room != DEFAULT_ROOM:
+            self.sender.leave_room(room)
+
+    def _on_room_joined(self, room, username):
+        """有人加入房间（本人加入时打开标签页）"""
+        if username == self.username:
+            if room not in self.room_views:
+                self._add_room_tab(room)
+                self._load_room_history(room)
+            else:
+                self._catch_up_room(room)  # 重新登录后重新加入了已打开的房间
+            self.room_tabs.setCurrentWidget(self.room_views[room])
+            self._display_system_message(f"已加入房间 {room}", room)
+        elif room in self.room_views:
+            self._display_system_message(f"{username} 加入了房间", room)
+
+    def _on_room_left(self, room, username):
+        """有人离开房间（本人离开时关闭标签页）"""
+        if room not in self.room_views:
+            return
+        if username == self.username:
+            msg_display = self.room_views.pop(room)
+            self.pending_messages.pop(room, None)
+            self.pending_history.pop(room, None)
+            self.cache_cursors.pop(room, None)
+            self.catching_up.discard(room)
+            self.room_tabs.removeTab(self.room_tabs.indexOf(msg_display))
+            msg_display.deleteLater()
+        else:
+            self._display_system_message(f"{username} 离开了房间", room)
+
+    def _load_room_history(self, room):
+        """进入房间：先显示本地缓存中最近的一页消息，再向服务器补齐缓存之后的消息
+        （没有缓存时按原方式请求最近 HISTORY_ON_LOGIN 条）"""
+        last_id = None
+        if self.cache is not None:
+            if room not in self.cache_cursors:
+                rows = self.cache.page(group_key(room))
+                self.cache_cursors[room] = rows[0][0] if rows else 0
+                for _, sender, time_str, content in rows:
+                    self._display_history_message(room, self._format_cached(sender, time_str, content))
+            last_id = self.cache.last_msg_id(room)
+        if last_id is not None:
+            self.sender.request_history(room, last_id, HISTORY_SINCE)
+        elif HISTORY_ON_LOGIN > 0:
+            self.sender.request_history(room, HISTORY_ON_LOGIN)
+
+    def _catch_up_room(self, room):
+        """重新登录后补齐断线期间错过的消息：从已收到的最大消息ID之后请求，结果追加在实时消息之后
+        （登录到了另一个集群节点、没有可比较的消息ID时请求最近 HISTORY_ON_LOGIN 条）"""
+        last_id = self.receiver.core.last_msg_ids.get(room)
+        if last_id is None and self.cache is not None:
+            last_id = self.cache.last_msg_id(room)
+        self.catching_up.add(room)
+        if last_id is not None:
+            self.sender.request_history(room, last_id, HISTORY_SINCE)
+        elif HISTORY_ON_LOGIN > 0:
+            self.sender.request_history(room, HISTORY_ON_LOGIN)
+
+    def _load_older_messages(self, room):
+        """消息区滚动到顶部：从本地缓存加载更早的一页"""
+        before = self.cache_cursors.get(room)
+        msg_display = self.room_views.get(room)
+        if not before or msg_display is None:
+            return
+        rows = self.cache.page(group_key(room), before=before)
+        if not rows:
+            self.cache_cursors[room] = 0
+            return
+        count = msg_display.prepend_messages(
+            [(KIND_HISTORY, self._format_cached(sender, time_str, content)) for _, sender, time_str, content in rows])
+        if count:
+            self.cache_cursors[room] = rows[-count][0]  # 超出回滚容量时只插入了较新的部分
+
+    def _format_cached(self, sender, time_str, content):
+        name = "我" if sender == self.username else sender
+        return f"[{name}] {time_str}\n{content}"
+
+    def do_search(self):
+        """打开聊天记录搜索窗口"""
+        SearchDialog(self, self.cache, self.username).exec()
+
     def do_logout(self):
         """执行下线逻辑"""
         reply = QMessageBox.question(
@@ -141,13 +326,12 @@ class ChatWindow(QMainWindow):
         if reply == QMessageBox.StandardButton.Yes:
             self.close()
 
-    def on_item_double_click(self, item):
+    def on_item_double_click(self, index):
         """双击在线列表触发私聊"""
-        item_text = item.text().strip()
-        if "加载中..." in item_text or "暂无在线用户" in item_text or "（自己）" in item_text:
-            return
+        target_user = index.data(USERNAME_ROLE)
+        if target_user is None:
+            return  # 占位项
 
-        target_user = item_text.replace("（自己）", "").strip()
         if target_user == self.username:
             QMessageBox.information(self, "提示", "不能与自己私聊！")
             return
@@ -160,7 +344,8 @@ class ChatWindow(QMainWindow):
                 parent=self,
                 username=self.username,
                 target_user=target_user,
-                message_sender=self.sender
+                message_sender=self.sender,
+                cache=self.cache
             )
             self.private_chat_windows[target_user] = chat_window
             chat_window.show()
@@ -180,7 +365,7 @@ class ChatWindow(QMainWindow):
             self.close()
             return
 
-        self.sender.send_group_message(msg)
+        self.sender.send_group_message(msg, self.current_room())
         self.msg_input.clear()
 
     def handle_private_message(self, sender, msg):
@@ -202,84 +387,90 @@ class ChatWindow(QMainWindow):
                     parent=self,
                     username=self.username,
                     target_user=sender,
-                    message_sender=self.sender
+                    message_sender=self.sender,
+                    cache=self.cache
                 )
                 self.private_chat_windows[sender] = chat_window
-                chat_window.display_target_message(msg)
+                if self.cache is None:  # 有缓存时新窗口已从缓存显示了这条消息
+                    chat_window.display_target_message(msg)
                 chat_window.show()
 
-    def _add_online_item(self, text, is_system=False, is_self=False):
-        """添加在线列表项"""
-        item = QListWidgetItem(text)
-        item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-        item.setFont(self.list_font)
-
-        if is_system:
-            item.setForeground(QColor(128, 128, 128))
-        elif is_self:
-            item.setForeground(QColor(66, 133, 244))
-            item.setFont(QFont("微软雅黑", 9, QFont.Weight.Bold))
-            item.setBackground(QColor(230, 240, 255))
-        else:
-            item.setForeground(QColor(0, 0, 0))
-
-        self.online_list_widget.addItem(item)
-
     def _refresh_online_list(self, online_list):
-        """刷新在线列表"""
-        self.online_list_widget.clear()
-
-        if not online_list or online_list == "无":
-            self._add_online_item("暂无在线用户", is_system=True)
-            self.status_label.setText("当前在线：0人")
+        """刷新在线列表（完整列表：登录或重新同步时使用）"""
+        usernames = [] if online_list == "无" else [name.strip() for name in online_list.split(',') if name.strip()]
+        self.online_model.reset(usernames)
+        self._update_online_count()
+
+    def _on_user_joined(self, username):
+        """用户上线（增量）：只插入一行"""
+        if not self.online_model.add(username):
             return
+        if username != self.username:
+            self._display_system_message(f"用户 {username} 已上线！")
+        self._update_online_count()
 
-        usernames = [name.strip() for name in online_list.split(',') if name.strip()]
-        self.status_label.setText(f"当前在线：{len(usernames)}人")
-
-        if self.username in usernames:
-            self._add_online_item(f"{self.username}（自己）", is_self=True)
-            usernames.remove(self.username)
-
-        for name in usernames:
-            self._add_online_item(name)
-
-    def start_receive_thread(self):
-        """启动接收线程"""
-        self.receive_thread = ReceiveThread(self.client_socket)
-        self.receive_thread.normal_msg_signal.connect(self._display_normal_message)
-        self.receive_thread.system_msg_signal.connect(self._display_system_message)
-        self.receive_thread.error_signal.connect(self._show_error)
-        self.receive_thread.login_result_signal.connect(self._handle_login_result)
-        self.receive_thread.online_list_update_signal.connect(self._refresh_online_list)
-        self.receive_thread.private_msg_signal.connect(self.handle_private_message)
-        self.receive_thread.start()
-
-    def _display_self_message(self, msg):
+    def _on_user_left(self, username):
+        """用户下线（增量）：只删除一行"""
+        if not self.online_model.remove(username):
+            return
+        self._display_system_message(f"用户 {username} 已下线！")
+        self._update_online_count()
+
+    def _update_online_count(self):
+        self.status_label.setText(f"当前在线：{self.online_model.user_count()}人")
+
+    def start_receiver(self):
+        """开始处理服务器消息（由连接在事件循环中逐帧送来）"""
+        self.receiver.normal_msg_signal.connect(self._display_normal_message)
+        self.receiver.system_msg_signal.connect(self._display_system_message)
+        self.receiver.error_signal.connect(self._show_error)
+        self.receiver.login_result_signal.connect(self._handle_login_result)
+        self.receiver.online_list_update_signal.connect(self._refresh_online_list)
+        self.receiver.private_msg_signal.connect(self.handle_private_message)
+        self.receiver.user_joined_signal.connect(self._on_user_joined)
+        self.receiver.user_left_signal.connect(self._on_user_left)
+        self.receiver.room_joined_signal.connect(self._on_room_joined)
+        self.receiver.room_left_signal.connect(self._on_room_left)
+        self.receiver.history_msg_signal.connect(self._display_history_message)
+        self.receiver.start()
+
+    def _display_self_message(self, msg, room=DEFAULT_ROOM):
         """显示自己的群聊消息（带时间戳）"""
-        self.msg_display.moveCursor(QTextCursor.MoveOperation.End)
-        self.msg_display.setCurrentFont(self.normal_font)
-        self.msg_display.setTextColor(QColor(128, 0, 128))
-        self.msg_display.insertPlainText(f"\n[我] {get_current_time()}")
-        self.msg_display.insertPlainText(f"\n{msg}")
-        self.msg_display.moveCursor(QTextCursor.MoveOperation.End)
-
-    def _display_normal_message(self, msg):
+        self._queue_message(self.pending_messages, room, KIND_SELF, f"[我] {get_current_time()}\n{msg}")
+
+    def _display_normal_message(self, room, msg):
         """显示他人的群聊消息（带时间戳，服务器已拼接）"""
-        self.msg_display.moveCursor(QTextCursor.MoveOperation.End)
-        self.msg_display.setCurrentFont(self.normal_font)
-        self.msg_display.setTextColor(QColor(0, 0, 0))
-        self.msg_display.insertPlainText(f"\n{msg}")
-        self.msg_display.moveCursor(QTextCursor.MoveOperation.End)
+        self._queue_message(self.pending_messages, room, KIND_NORMAL, msg)
 
-    def _display_system_message(self, msg):
+    def _display_history_message(self, room, msg):
+        """显示历史消息（灰色，按顺序插入在实时消息之前；重新登录后补齐的消息追加在末尾）"""
+        pending = self.pending_messages if room in self.catching_up else self.pending_history
+        self._queue_message(pending, room, KIND_HISTORY, msg)
+
+    def _display_system_message(self, msg, room=DEFAULT_ROOM):
         """显示系统通知（带时间戳）"""
-        self.msg_display.moveCursor(QTextCursor.MoveOperation.End)
-        self.msg_display.setCurrentFont(self.bold_font)
-        self.msg_display.setTextColor(QColor(66, 133, 244))
-        self.msg_display.insertPlainText(f"\n【系统通知】{get_current_time()}")
-        self.msg_display.insertPlainText(f"\n{msg}")
-        self.msg_display.moveCursor(QTextCursor.MoveOperation.End)
+        self._queue_message(self.pending_messages, room, KIND_SYSTEM, f"【系统通知】{get_current_time()}\n{msg}")
+
+    def _queue_message(self, pending, room, kind, text):
+        """缓存待显示的消息，由刷新定时器统一显示"""
+        if room not in self.room_views:
+            return
+        pending.setdefault(room, []).append((kind, text))
+        if not self.render_timer.isActive():
+            self.render_timer.start()
+
+    def _flush_messages(self):
+        """显示缓存的消息：每个房间每帧只更新一次模型"""
+        pending_history, self.pending_history = self.pending_history, {}
+        pending_messages, self.pending_messages = self.pending_messages, {}
+        for room, entries in pending_history.items():
+            msg_display = self.room_views.get(room)
+            if msg_display is not None:
+                msg_display.insert_history(entries)
+        for room, entries in pending_messages.items():
+            msg_display = self.room_views.get(room)
+            if msg_display is not None:
+                msg_display.append_messages(entries)
 
     def _handle_login_result(self, login_success, online_list):
         """处理登录结果"""
@@ -287,6 +478,14 @@ class ChatWindow(QMainWindow):
             self._refresh_online_list(online_list)
             online_count = len(online_list.split(',')) if online_list and online_list != "无" else 0
             self._display_system_message(f"登录成功，当前在线 {online_count} 人")
+            if self.logged_in:
+                self._catch_up_room(DEFAULT_ROOM)
+            else:
+                self._load_room_history(DEFAULT_ROOM)
+            self.logged_in = True
+            for room in self.room_views:
+                if room != DEFAULT_ROOM:
+                    self.sender.join_room(room)  # 会话过期后重新登录：重新加入已打开的房间
         else:
             self._refresh_online_list("无")
             self.status_label.setText("登录失败")
@@ -298,14 +497,12 @@ class ChatWindow(QMainWindow):
 
     def closeEvent(self, event):
         """关闭窗口清理"""
-        for chat_window in self.private_chat_windows.values():
+        for chat_window in list(self.private_chat_windows.values()):  # 关闭时会从字典中移除自己
             chat_window.close()
+        self.receiver.stop()  # 先停止处理，避免把服务器断开当作掉线重连
         self.sender.send_exit_signal()
-        if self.receive_thread and self.receive_thread.isRunning():
-            self.receive_thread.stop()
-            self.receive_thread.wait()
-        try:
-            self.client_socket.close()
-        except:
-            pass
+        self.connection.close(flush_timeout=EXIT_FLUSH_TIMEOUT)
+        if self.cache is not None:
+            self.cache_timer.stop()
+            self.cache.close()
         event.accept()
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""客户端网络连接：在 Qt 事件循环中以非阻塞方式连接、发送、接收（不再阻塞界面）
+
+socket 设为非阻塞，由 QSocketNotifier 通知可读/可写：
+    连接：connect_ex 立即返回，可写时检查连接结果，超过 CONNECT_TIMEOUT 秒未完成视为失败；
+    发送：帧追加到发送队列，尽量立即发出，内核缓冲区满时等待可写后继续；
+    接收：可读时读取一次并逐帧解析，通过 frame_received 信号交给上层。
+连接失败或中断时发出 connection_lost（原因为空字符串表示服务器正常关闭了连接）。
+"""
+import errno
+import os
+import socket
+import time
+from PyQt6.QtCore import QObject, QSocketNotifier, QTimer, pyqtSignal
+from config import BUFFER_SIZE, CONNECT_TIMEOUT
+from protocol import FrameDecoder, ProtocolError
+
+# 连接状态
+STATE_DISCONNECTED = "disconnected"
+STATE_CONNECTING = "connecting"
+STATE_CONNECTED = "connected"
+
+# 非阻塞 connect 正在进行中的错误码（Windows 为 WSAEWOULDBLOCK）
+_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK)}
+
+class ClientConnection(QObject):
+    """与服务器的一条连接（断开后可再次 open，用于断线重连）"""
+    state_changed = pyqtSignal(str)        # 连接状态变化
+    connected = pyqtSignal()               # 连接建立
+    frame_received = pyqtSignal(int, str)  # 收到一帧（消息类型，负载）
+    connection_lost = pyqtSignal(str)      # 连接失败或中断（原因）
+
+    def __init__(self, address, parent=None):
+        super().__init__(parent)
+        self.address = address
+        self.sock = None
+        self.state = STATE_DISCONNECTED
+        self.decoder = FrameDecoder()
+        self.send_buffer = bytearray()  # 发送队列（尚未写入内核的数据）
+        self.recv_buffer = bytearray(BUFFER_SIZE)  # 复用同一块接收缓冲区
+        self.recv_view = memoryview(self.recv_buffer)
+        self.last_received = time.monotonic()  # 最后收到服务器数据的时间（心跳检查用）
+        self.read_notifier = None
+        self.write_notifier = None
+        self.connect_timer = QTimer(self)
+        self.connect_timer.setSingleShot(True)
+        self.connect_timer.timeout.connect(lambda: self.abort("连接超时"))
+
+    def open(self, timeout=CONNECT_TIMEOUT):
+        """开始连接服务器（立即返回，结果通过 connected / connection_lost 通知）"""
+        self._close_socket()
+        self.decoder = FrameDecoder()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        self.sock = sock
+        self._set_state(STATE_CONNECTING)
+        try:
+            err = sock.connect_ex(self.address)
+            reason = os.strerror(err)
+        except OSError as e:  # 地址无效等
+            err, reason = e.errno or errno.EINVAL, str(e)
+        if err and err not in _IN_PROGRESS:
+            # 与异步失败一样在之后通知，调用方此时已连接好信号
+            QTimer.singleShot(0, lambda: self.sock is sock and self.abort(f"连接服务器失败：{reason}"))
+            return
+        fd = sock.fileno()
+        self.read_notifier = QSocketNotifier(fd, QSocketNotifier.Type.Read, self)
+        self.read_notifier.activated.connect(self._on_readable)
+        self.read_notifier.setEnabled(False)
+        self.write_notifier = QSocketNotifier(fd, QSocketNotifier.Type.Write, self)
+        self.write_notifier.activated.connect(self._on_writable)
+        self.connect_timer.start(int(timeout * 1000))
+
+    def is_connected(self):
+        return self.state == STATE_CONNECTED
+
+    def send(self, data):
+        """加入发送队列并尽量立即发送，未连接时返回 False"""
+        if self.state != STATE_CONNECTED:
+            return False
+        self.send_buffer += data
+        self._flush()
+        return True
+
+    def close(self, flush_timeout=0):
+        """主动关闭连接（不发出 connection_lost）；flush_timeout 秒内尽量发完发送队列（退出时使用）"""
+        if self.send_buffer and self.state == STATE_CONNECTED and flush_timeout > 0:
+            try:
+                self.sock.settimeout(flush_timeout)
+                self.sock.sendall(self.send_buffer)
+            except OSError:
+                pass
+        self._close_socket()
+
+    def abort(self, reason):
+        """中断连接并通知上层（连接超时、心跳超时、读写出错）"""
+        if self.state == STATE_DISCONNECTED:
+            return
+        self._close_socket()
+        self.connection_lost.emit(reason)
+
+    def _close_socket(self):
+        self.connect_timer.stop()
+        for notifier in (self.read_notifier, self.write_notifier):
+            if notifier is not None:
+                notifier.setEnabled(False)
+                notifier.deleteLater()
+        self.read_notifier = self.write_notifier = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.send_buffer.clear()
+        self._set_state(STATE_DISCONNECTED)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.state_changed.emit(state)
+
+    def _on_writable(self):
+        if self.state == STATE_CONNECTING:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                self.abort(f"连接服务器失败：{os.strerror(err)}")
+                return
+            self.connect_timer.stop()
+            self.write_notifier.setEnabled(False)
+            self.read_notifier.setEnabled(True)
+            self.last_received = time.monotonic()
+            self._set_state(STATE_CONNECTED)
+            self.connected.emit()
+            return
+        self._flush()
+
+    def _flush(self):
+        """把发送队列写入内核，写不完时等待可写通知"""
+        try:
+            while self.send_buffer:
+                sent = self.sock.send(self.send_buffer)
+                del self.send_buffer[:sent]
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            self.abort(str(e))
+            return
+        self.write_notifier.setEnabled(bool(self.send_buffer))
+
+    def _on_readable(self):
+        sock = self.sock
+        try:
+            size = sock.recv_into(self.recv_buffer)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.abort(str(e))
+            return
+        if not size:
+            self.abort("")
+            return
+        self.last_received = time.monotonic()
+        try:
+            frames = self.decoder.feed(self.recv_view[:size])
+        except ProtocolError as e:
+            self.abort(str(e))
+            return
+        for msg_type, payload in frames:
+            self.frame_received.emit(msg_type, payload)
+            if self.sock is not sock:
+                return  # 上层在处理过程中关闭（或重新打开）了连接
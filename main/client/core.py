@@ -0,0 +1,326 @@
+"""客户端协议核心：不依赖 PyQt6 的会话状态机
+
+负责登录、在线状态版本号、断线续传、心跳判定、发送各类请求以及记录本地缓存，但不做任何网络读写：
+    收到的每一帧交给 handle_frame()；
+    需要发送的帧交给构造时传入的 send(data)（未连接时返回 False）；
+    事件通过 listener（ClientListener 子类）的 on_* 方法通知上层。
+网络与定时器由上层实现：Qt 界面见 client/message_receiver.py，asyncio 客户端见 client/chat_client.py；
+上层处理帧后按 presence_gap_remaining() 安排一次 check_presence_gap()（在线状态缺口超时）。
+"""
+import time
+from config import RESUME_GRACE_SECONDS, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+from protocol import (MSG_GROUP, MSG_PRIVATE, MSG_EXIT, MSG_PRESENCE_SYNC, MSG_ROOM_JOIN,
+                      MSG_ROOM_LEAVE, MSG_HISTORY_REQUEST, MSG_RESUME, MSG_PING, MSG_PONG,
+                      UNCOUNTED_TYPES, HISTORY_LAST, DEFAULT_ROOM,
+                      PRESENCE_SNAPSHOT, PRESENCE_JOIN, PRESENCE_LEAVE, encode_frame, encode_login)
+from messages import (SERVER_MESSAGES, Dispatcher, decode_message, LoginResponse, GroupMessage,
+                      HistoryMessage, HistoryScope, PrivateMessage, SystemNotice, PresenceUpdate,
+                      RoomJoined, RoomLeft, Ping)
+
+PRESENCE_GAP_LIMIT = 16  # 缺口后积压的增量超过该数量时立即请求完整在线列表
+PRESENCE_GAP_TIMEOUT = 2.0  # 版本号缺口持续该秒数仍未补齐时请求完整在线列表
+RECONNECT_INTERVAL = 1.0  # 断线重连的重试间隔（秒）
+RESUME_TIMEOUT = 3.0      # 等待续传应答的时间（秒），超时后重试
+
+class ClientListener:
+    """客户端事件回调（默认不处理，按需覆盖）"""
+    def on_login_result(self, success, online_list):
+        """登录结果（成功时附带完整在线列表，逗号分隔）"""
+
+    def on_group_message(self, message):
+        """群聊消息（GroupMessage）"""
+
+    def on_history_message(self, message):
+        """历史消息（HistoryMessage，本地缓存中已有的不再通知）"""
+
+    def on_private_message(self, sender, content):
+        """私聊消息"""
+
+    def on_system_message(self, text):
+        """系统通知（含连接状态提示）"""
+
+    def on_online_list(self, online_list):
+        """完整在线列表（逗号分隔，"无" 表示为空）"""
+
+    def on_user_joined(self, username):
+        """用户上线（增量）"""
+
+    def on_user_left(self, username):
+        """用户下线（增量）"""
+
+    def on_room_joined(self, room, username):
+        """有人加入房间（含本人）"""
+
+    def on_room_left(self, room, username):
+        """有人离开房间（含本人）"""
+
+    def on_error(self, text):
+        """错误（登录失败、连接中断且无法恢复）"""
+
+class ClientCore:
+    """一个用户的客户端会话状态"""
+    def __init__(self, username, send, listener=None, cache=None):
+        self.username = username
+        self.send = send  # send(data) -> bool
+        self.listener = listener or ClientListener()
+        self.cache = cache  # 本地消息缓存（MessageCache，未启用时为 None）
+        self.session_token = ""  # 断线续传令牌（登录成功后由服务器下发）
+        self.received_seq = 0    # 本会话已收到的帧数（MSG_RESUME 应答不计）
+        self.login_done = False
+        self.presence_seq = None    # 已应用的在线状态版本号（登录前为 None）
+        self.pending_presence = {}  # 乱序到达、等待前序版本的增量：{版本号: (操作, 用户名)}
+        self.resync_requested = False
+        self.gap_since = None       # 在线状态版本号出现缺口的时间（没有缺口时为 None）
+        self.last_msg_ids = {}  # 各房间已收到的最大消息ID
+        self.history_scope = ""  # 消息ID所属的范围（集群节点ID），换节点后旧的消息ID不可比较
+        self.reconnect_deadline = None  # 断线重连的截止时间（未在重连时为 None）
+        self.lost_reason = ""           # 最初断线的原因（重连失败时报告）
+        self.resuming = False           # 已发送续传请求，等待服务器应答
+        self.dispatcher = Dispatcher({
+            Ping: self._handle_ping,
+            LoginResponse: self._handle_login_response,
+            PresenceUpdate: self._handle_presence,
+            SystemNotice: self._handle_system,
+            PrivateMessage: self._handle_private,
+            GroupMessage: self._handle_group,
+            HistoryMessage: self._handle_history,
+            HistoryScope: self._handle_history_scope,
+            RoomJoined: self._handle_room_joined,
+            RoomLeft: self._handle_room_left,
+        })
+
+    # ---------- 发送 ----------
+
+    def login_frame(self):
+        """首次连接后发送的登录帧"""
+        return encode_login(self.username)
+
+    def send_group(self, content, room=DEFAULT_ROOM):
+        if not self.send(encode_frame(MSG_GROUP, room, content)):
+            return False
+        if self.cache is not None:
+            self.cache.add_own_group(room, self.username, time.strftime("%H:%M:%S"), content)
+        return True
+
+    def send_private(self, target, content):
+        if not self.send(encode_frame(MSG_PRIVATE, target, content)):
+            return False
+        if self.cache is not None:
+            self.cache.add_private(target, self.username, time.strftime("%H:%M:%S"), content)
+        return True
+
+    def join_room(self, room):
+        return self.send(encode_frame(MSG_ROOM_JOIN, room))
+
+    def leave_room(self, room):
+        return self.send(encode_frame(MSG_ROOM_LEAVE, room))
+
+    def request_history(self, room, count, mode=HISTORY_LAST):
+        """请求房间历史消息（HISTORY_LAST：最近 count 条；HISTORY_SINCE：count 为消息ID）"""
+        return self.send(encode_frame(MSG_HISTORY_REQUEST, room, mode, str(count)))
+
+    def request_presence_sync(self):
+        return self.send(encode_frame(MSG_PRESENCE_SYNC))
+
+    def send_exit(self):
+        return self.send(encode_frame(MSG_EXIT))
+
+    def send_heartbeat(self, msg_type=MSG_PING):
+        """发送心跳请求/应答（负载为空）"""
+        return self.send(encode_frame(msg_type))
+
+    # ---------- 心跳与断线续传（定时器与网络由上层负责） ----------
+
+    def check_heartbeat(self, idle):
+        """连接已空闲 idle 秒：需要时发送心跳，返回 False 表示服务器已失联"""
+        if idle >= HEARTBEAT_TIMEOUT:
+            return False
+        if idle >= HEARTBEAT_INTERVAL:
+            self.send_heartbeat(MSG_PING)
+        return True
+
+    def connection_lost(self, reason):
+        """连接意外断开（或心跳超时、重连失败），返回下次重连前等待的秒数，None 表示不再重连
+        （没有会话时直接报告错误）"""
+        self.resuming = False
+        if self.reconnect_deadline is not None:
+            return RECONNECT_INTERVAL  # 本次重连失败，稍后重试
+        if not self.session_token:
+            self._report_lost(reason)
+            return None
+        self.lost_reason = reason
+        self.reconnect_deadline = time.monotonic() + RESUME_GRACE_SECONDS
+        self.listener.on_system_message("连接中断，正在重新连接…")
+        return 0
+
+    def reconnect_remaining(self):
+        """重连宽限期剩余的秒数；已超时则报告错误并返回 None"""
+        remaining = self.reconnect_deadline - time.monotonic()
+        if remaining <= 0:
+            self.reconnect_deadline = None
+            self._report_lost(self.lost_reason)
+            return None
+        return remaining
+
+    def is_reconnecting(self):
+        return self.reconnect_deadline is not None
+
+    def start_resume(self):
+        """重连成功后首先发送续传请求，服务器的第一帧应答由 handle_frame 处理"""
+        self.send(encode_frame(MSG_RESUME, self.username, self.session_token, str(self.received_seq)))
+        self.resuming = True
+
+    def _report_lost(self, reason):
+        if reason:
+            self.listener.on_error(f"接收消息异常：{reason}")
+        elif not self.login_done:
+            self.listener.on_error("服务器连接中断")
+
+    def _handle_resume_response(self, msg_type, payload):
+        """重连后的第一帧：续传结果"""
+        self.resuming = False
+        self.reconnect_deadline = None
+        if msg_type == MSG_RESUME and payload == "1":
+            if HEARTBEAT_INTERVAL:
+                self.send_heartbeat(MSG_PING)  # 新连接同样声明支持心跳
+            self.listener.on_system_message("已重新连接，会话已恢复")
+        else:
+            # 会话已过期：重新登录，登录响应会刷新在线列表
+            self.session_token = ""
+            self.received_seq = 0
+            self.presence_seq = None
+            self.send(encode_login(self.username))
+            self.listener.on_system_message("会话已过期，正在重新登录…")
+
+    # ---------- 接收 ----------
+
+    def handle_frame(self, msg_type, payload):
+        """处理一帧服务器消息"""
+        if self.resuming:
+            self._handle_resume_response(msg_type, payload)
+            return
+        if msg_type not in UNCOUNTED_TYPES:
+            self.received_seq += 1  # 与服务器写线程的帧序号一一对应
+        message = decode_message(SERVER_MESSAGES, msg_type, payload)
+        if message is not None:
+            self.dispatcher.dispatch(message)
+
+    def _handle_ping(self, message):
+        self.send_heartbeat(MSG_PONG)
+
+    def _handle_system(self, message):
+        self.listener.on_system_message(message.text)
+        if "当前在线：" in message.text:
+            self.listener.on_online_list(message.text.split("当前在线：")[-1].strip())
+
+    def _handle_private(self, message):
+        # 私聊消息无服务器时间戳
+        content = message.content.strip()
+        if self.cache is not None:
+            self.cache.add_private(message.sender, message.sender, time.strftime("%H:%M:%S"), content)
+        self.listener.on_private_message(message.sender, content)
+
+    def _handle_group(self, message):
+        self._record_msg_id(message.room, message.msg_id)
+        self._cache_group(message)
+        self.listener.on_group_message(message)
+
+    def _handle_history(self, message):
+        self._record_msg_id(message.room, message.msg_id)
+        if self._cache_group(message):  # 本地缓存中已有（已显示过）的消息不再通知
+            self.listener.on_history_message(message)
+
+    def _handle_history_scope(self, message):
+        """登录到了（可能是另一个）集群节点：之前记录的消息ID只在原节点内有效"""
+        if message.scope != self.history_scope:
+            self.history_scope = message.scope
+            self.last_msg_ids.clear()
+        if self.cache is not None:
+            self.cache.set_scope(message.scope)
+
+    def _cache_group(self, message):
+        """记录群聊消息到本地缓存，返回 False 表示缓存中已有该消息"""
+        if self.cache is None:
+            return True
+        return self.cache.add_group(message.room, message.msg_id, message.sender, message.time_str,
+                                    message.content, own_name=self.username)
+
+    def _handle_room_joined(self, message):
+        self.listener.on_room_joined(message.room, message.username)
+
+    def _handle_room_left(self, message):
+        self.listener.on_room_left(message.room, message.username)
+
+    def _record_msg_id(self, room, msg_id):
+        """记录房间已收到的最大消息ID（用于之后按 HISTORY_SINCE 补齐）"""
+        if msg_id.isdigit():
+            self.last_msg_ids[room] = max(self.last_msg_ids.get(room, 0), int(msg_id))
+
+    def _handle_login_response(self, message):
+        """处理登录阶段的服务器响应（成功时附带完整在线列表及其版本号；
+        同意的压缩方式无需处理，解压由 FrameDecoder 自动完成）"""
+        self.login_done = True
+        login_success = message.success == "1"
+        self.session_token = message.token if login_success else ""
+        if not login_success:
+            self.listener.on_error(f"【错误】{message.time_str}\n登录失败！")
+        self.listener.on_login_result(login_success, message.online_list)
+        if login_success:
+            self._reset_presence(int(message.seq))
+            if HEARTBEAT_INTERVAL:
+                self.send_heartbeat(MSG_PING)  # 声明支持心跳，服务器此后检查本连接
+
+    def _handle_presence(self, message):
+        """应用在线状态变更：按版本号顺序应用增量，发现缺口时请求重新同步"""
+        op, seq, data = message.op, int(message.seq), message.data
+        if op == PRESENCE_SNAPSHOT:
+            self.listener.on_online_list(data or "无")
+            self._reset_presence(seq)
+            return
+        if self.presence_seq is not None and seq <= self.presence_seq:
+            return  # 已包含在快照中
+        self.pending_presence[seq] = (op, data)
+        self._apply_pending_presence()
+        if len(self.pending_presence) > PRESENCE_GAP_LIMIT:
+            self._request_resync()
+
+    def presence_gap_remaining(self):
+        """距离因版本号缺口请求完整在线列表还有多少秒（没有待补齐的缺口时为 None）"""
+        if self.gap_since is None or self.resync_requested:
+            return None
+        return max(self.gap_since + PRESENCE_GAP_TIMEOUT - time.monotonic(), 0)
+
+    def check_presence_gap(self):
+        """缺口持续 PRESENCE_GAP_TIMEOUT 秒仍未补齐（缺失的增量已丢失）时请求完整在线列表"""
+        if self.presence_gap_remaining() == 0:
+            self._request_resync()
+
+    def _request_resync(self):
+        if not self.login_done or self.resync_requested:
+            return
+        self.resync_requested = self.request_presence_sync()
+        if not self.resync_requested and self.gap_since is not None:
+            self.gap_since = time.monotonic()  # 未连接：再等待一个缺口超时后重试
+
+    def _reset_presence(self, seq):
+        """以完整在线列表为基准，丢弃其中已包含的增量"""
+        self.presence_seq = seq
+        self.resync_requested = False
+        self.pending_presence = {s: d for s, d in self.pending_presence.items() if s > seq}
+        self._apply_pending_presence()
+
+    def _apply_pending_presence(self):
+        """依次应用与当前版本号连续的增量，剩余的增量说明存在缺口"""
+        if self.presence_seq is None:
+            return  # 登录响应尚未到达
+        while self.presence_seq + 1 in self.pending_presence:
+            self.presence_seq += 1
+            op, username = self.pending_presence.pop(self.presence_seq)
+            if op == PRESENCE_JOIN:
+                self.listener.on_user_joined(username)
+            elif op == PRESENCE_LEAVE:
+                self.listener.on_user_left(username)
+        if not self.pending_presence:
+            self.gap_since = None
+        elif self.gap_since is None:
+            self.gap_since = time.monotonic()
@@ -1,15 +1,17 @@
-import socket
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLineEdit, QPushButton, QLabel, QMessageBox)
 from PyQt6.QtGui import QFont
 from config import load_config, save_config, DEFAULT_CONFIG
+from protocol import encode_login
 from client.chat_ui import ChatWindow
+from client.connection import ClientConnection
 
 class LoginWindow(QMainWindow):
     """登录窗口（支持中文用户名+IP/端口配置+配置保存）"""
     def __init__(self):
         super().__init__()
-        self.client_socket = None
+        self.connection = None
+        self.pending_username = ""
         self.config = load_config()  # 加载配置
         self.init_ui()
 
@@ -130,33 +132,44 @@ class LoginWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "端口必须是1-65535之间的整数！")
             return
 
-        # 2. 保存配置（更新最后输入的IP和端口）
-        new_config = {
-            "server_ip": server_ip,
-            "server_port": server_port
-        }
+        # 2. 保存配置（更新最后输入的IP和端口，保留文件中的其他配置项，如服务器的限流设置）
+        new_config = dict(load_config(), server_ip=server_ip, server_port=server_port)
         save_config(new_config)
 
-        # 3. 连接服务器（保持原有utf-8编码发送，已支持中文）
-        try:
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.connect((server_ip, server_port))
-            # 发送用户名（utf-8编码，支持中文）
-            self.client_socket.sendall(username.encode("utf-8"))
-        except Exception as e:
-            QMessageBox.critical(self, "登录失败", f"连接服务器失败：{str(e)}")
-            return
-
-        # 4. 登录成功：打开聊天窗口，隐藏登录窗口
-        self.chat_window = ChatWindow(username, self.client_socket)
+        # 3. 连接服务器（非阻塞：连接结果由 _on_connected / _on_connect_failed 处理，界面不会卡住）
+        if self.connection is not None:
+            return  # 正在连接
+        self.pending_username = username
+        self.connection = ClientConnection((server_ip, server_port))
+        self.connection.connected.connect(self._on_connected)
+        self.connection.connection_lost.connect(self._on_connect_failed)
+        self._set_connecting(True)
+        self.connection.open()
+
+    def _set_connecting(self, connecting):
+        self.login_btn.setEnabled(not connecting)
+        self.login_btn.setText("连接中..." if connecting else "登录")
+
+    def _on_connected(self):
+        """连接成功：发送登录帧，打开聊天窗口，隐藏登录窗口"""
+        connection = self.connection
+        connection.connected.disconnect(self._on_connected)
+        connection.connection_lost.disconnect(self._on_connect_failed)
+        self.connection = None
+        self._set_connecting(False)
+        # 发送登录帧（utf-8编码，支持中文；附带支持的压缩方式）
+        connection.send(encode_login(self.pending_username))
+        self.chat_window = ChatWindow(self.pending_username, connection)
         self.chat_window.show()
         self.hide()
 
+    def _on_connect_failed(self, reason):
+        self.connection = None
+        self._set_connecting(False)
+        QMessageBox.critical(self, "登录失败", reason or "连接服务器失败")
+
     def closeEvent(self, event):
-        """关闭登录窗口时关闭socket（如果已创建）"""
-        if self.client_socket:
-            try:
-                self.client_socket.close()
-            except:
-                pass
+        """关闭登录窗口时取消正在进行的连接"""
+        if self.connection:
+            self.connection.close()
         event.accept()
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""客户端本地消息缓存：按用户保存群聊、私聊记录（SQLite），支持分页加载与全文搜索
+
+每个用户、每个服务器一个数据库文件（CLIENT_CACHE_DIR 下）。会话键：群聊为 "#房间名"，
+私聊为 "@对方用户名"。
+    写入：收到/发出消息时立即写入当前事务，由界面定时 flush() 提交，多条消息合并一次提交；
+    分页：按本地自增ID倒序取一页，窗口打开或向上滚动到顶部时再取更早的一页，不全部载入内存；
+    搜索：FTS5 trigram 索引（子串匹配，支持中文），少于 3 个字符或 SQLite 不支持时退化为 LIKE。
+群聊消息按服务器消息ID去重；自己发送的群聊消息没有消息ID，之后从历史中收到时补上消息ID。
+集群中各节点独立分配消息ID，因此消息ID连同其范围（登录时服务器告知的节点ID）一起记录，
+去重与补齐历史都只在当前范围内进行。
+"""
+import os
+import sqlite3
+import time
+from urllib.parse import quote
+from config import CLIENT_CACHE_DIR, CLIENT_CACHE_PAGE
+
+FLUSH_INTERVAL = 1.0  # 界面提交缓存事务的间隔（秒）
+SEARCH_LIMIT = 200    # 单次搜索最多返回的条数
+TRIGRAM_MIN = 3       # trigram 索引可匹配的最短关键字
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id           INTEGER PRIMARY KEY,
+    conversation TEXT    NOT NULL,
+    scope        TEXT    NOT NULL DEFAULT '',
+    msg_id       INTEGER,
+    timestamp    REAL    NOT NULL,
+    sender       TEXT    NOT NULL,
+    time_str     TEXT    NOT NULL,
+    content      TEXT    NOT NULL
+);
+"""
+
+INDEX_SCHEMA = """
+CREATE INDEX IF NOT EXISTS messages_conversation ON messages (conversation, id);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_scope_msg_id ON messages (conversation, scope, msg_id)
+    WHERE msg_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS messages_unconfirmed ON messages (conversation, sender)
+    WHERE msg_id IS NULL;
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+def group_key(room):
+    return f"#{room}"
+
+def private_key(peer):
+    return f"@{peer}"
+
+class MessageCache:
+    """单个用户的本地消息库（只在界面线程中使用）"""
+    def __init__(self, path, page_size=CLIENT_CACHE_PAGE):
+        self.path = path
+        self.page_size = page_size
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        if "scope" not in [row[1] for row in self.db.execute("PRAGMA table_info(messages)")]:
+            # 旧版缓存：补上范围列（原有消息属于单节点服务器的空范围），换用带范围的唯一索引
+            self.db.execute("ALTER TABLE messages ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+            self.db.execute("DROP INDEX IF EXISTS messages_msg_id")
+        self.db.executescript(INDEX_SCHEMA)
+        try:
+            self.db.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite 未编译 FTS5 或版本过旧（trigram 需要 3.34+）
+        self.in_transaction = False
+        self.scope = ""  # 当前服务器节点的消息ID范围
+
+    def set_scope(self, scope):
+        """登录后设置消息ID范围（服务器在登录响应之前告知）"""
+        self.scope = scope
+
+    def _write(self, sql, params):
+        if not self.in_transaction:
+            self.db.execute("BEGIN")
+            self.in_transaction = True
+        return self.db.execute(sql, params)
+
+    def _insert(self, conversation, msg_id, sender, time_str, content):
+        return self._write(
+            "INSERT OR IGNORE INTO messages (conversation, scope, msg_id, timestamp, sender, time_str, "
+            "content) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (conversation, self.scope, msg_id, time.time(), sender, time_str, content)).rowcount == 1
+
+    def add_group(self, room, msg_id, sender, time_str, content, own_name=None):
+        """记录一条群聊消息，返回 False 表示已记录过（同一消息ID，或自己发送过的消息）"""
+        conversation = group_key(room)
+        msg_id = int(msg_id) if str(msg_id).isdigit() else None
+        if msg_id is not None and sender == own_name:
+            # 自己发送的消息：给最早一条尚无消息ID的相同消息补上消息ID
+            claimed = self._write(
+                "UPDATE messages SET msg_id = ?, scope = ? WHERE id = (SELECT id FROM messages "
+                "WHERE conversation = ? AND sender = ? AND msg_id IS NULL AND content = ? "
+                "ORDER BY id LIMIT 1)", (msg_id, self.scope, conversation, sender, content)).rowcount
+            if claimed:
+                return False
+        return self._insert(conversation, msg_id, sender, time_str, content)
+
+    def add_own_group(self, room, sender, time_str, content):
+        """记录自己发送的群聊消息（服务器不回传，消息ID未知）"""
+        self._insert(group_key(room), None, sender, time_str, content)
+
+    def add_private(self, peer, sender, time_str, content):
+        """记录一条私聊消息（peer 为对方用户名，sender 为发送者）"""
+        self._insert(private_key(peer), None, sender, time_str, content)
+
+    def flush(self):
+        """提交已写入的消息"""
+        if self.in_transaction:
+            self.db.execute("COMMIT")
+            self.in_transaction = False
+
+    def last_msg_id(self, room):
+        """房间在当前范围内已记录的最大服务器消息ID（没有时为 None，此时应按最近 N 条请求历史）"""
+        row = self.db.execute("SELECT MAX(msg_id) FROM messages WHERE conversation = ? "
+                              "AND scope = ? AND msg_id IS NOT NULL",
+                              (group_key(room), self.scope)).fetchone()
+        return row[0]
+
+    def page(self, conversation, before=None, limit=None):
+        """取一页消息（按时间顺序）：before 为本地ID，只取更早的消息；
+        返回 [(本地ID, 发送者, 时间, 内容)]"""
+        limit = limit or self.page_size
+        if before is None:
+            rows = self.db.execute(
+                "SELECT id, sender, time_str, content FROM messages WHERE conversation = ? "
+                "ORDER BY id DESC LIMIT ?", (conversation, limit)).fetchall()
+        else:
+            rows = self.db.execute(
+                "SELECT id, sender, time_str, content FROM messages WHERE conversation = ? "
+                "AND id < ? ORDER BY id DESC LIMIT ?", (conversation, before, limit)).fetchall()
+        rows.reverse()
+        return rows
+
+    def search(self, keyword, limit=SEARCH_LIMIT):
+        """全文搜索（最新的在前）：返回 [(会话, 发送者, 时间戳, 内容)]"""
+        keyword = keyword.strip()
+        if not keyword:
+            return []
+        if self.fts and len(keyword) >= TRIGRAM_MIN:
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            return self.db.execute(
+                "SELECT conversation, sender, timestamp, content FROM messages WHERE id IN "
+                "(SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid DESC LIMIT ?) "
+                "ORDER BY id DESC", (phrase, limit)).fetchall()
+        pattern = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return self.db.execute(
+            "SELECT conversation, sender, timestamp, content FROM messages "
+            "WHERE content LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?", (pattern, limit)).fetchall()
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+def open_message_cache(username, address):
+    """打开用户在该服务器上的本地缓存，未启用或失败时返回 None（不影响聊天）"""
+    if not CLIENT_CACHE_DIR:
+        return None
+    host, port = address
+    try:
+        os.makedirs(CLIENT_CACHE_DIR, exist_ok=True)
+        filename = quote(f"{username}@{host}_{port}", safe="@._-") + ".db"
+        return MessageCache(os.path.join(CLIENT_CACHE_DIR, filename))
+    except (OSError, sqlite3.Error) as e:
+        print(f"打开本地消息缓存失败：{e}")
+        return None
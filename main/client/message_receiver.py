@@ -1,81 +1,137 @@
-import socket
-from PyQt6.QtCore import QThread, pyqtSignal
-from config import BUFFER_SIZE, CHAT_SEPARATOR
+"""Qt 适配层：把 ClientCore 的事件转为 pyqtSignal，并用 QTimer 驱动心跳检查、断线重连与续传超时
 
-class ReceiveThread(QThread):
-    """后台接收消息线程"""
-    normal_msg_signal = pyqtSignal(str)  # 群聊消息
+协议状态（登录、在线状态版本号、断线续传、本地缓存记录）全部在 client/core.py 中，本模块不解析消息。
+"""
+import time
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from config import HEARTBEAT_INTERVAL
+from client.core import ClientCore, ClientListener, RECONNECT_INTERVAL, RESUME_TIMEOUT
+
+class MessageReceiver(QObject, ClientListener):
+    """处理服务器消息（由 ClientConnection 在事件循环中逐帧送来），负责心跳与断线续传的定时"""
+    normal_msg_signal = pyqtSignal(str, str)  # 群聊消息（房间，消息）
     system_msg_signal = pyqtSignal(str)  # 系统通知消息
     error_signal = pyqtSignal(str)       # 错误消息
     login_result_signal = pyqtSignal(bool, str)  # 登录结果（成功状态，在线列表）
     online_list_update_signal = pyqtSignal(str)  # 在线列表更新信号
     private_msg_signal = pyqtSignal(str, str)  # 私聊消息信号（发送者，消息内容）
+    user_joined_signal = pyqtSignal(str)  # 用户上线（增量）
+    user_left_signal = pyqtSignal(str)    # 用户下线（增量）
+    room_joined_signal = pyqtSignal(str, str)  # 有人加入房间（房间，用户名）
+    room_left_signal = pyqtSignal(str, str)    # 有人离开房间（房间，用户名）
+    history_msg_signal = pyqtSignal(str, str)  # 历史消息（房间，消息）
+
+    def __init__(self, connection, username, cache=None, parent=None):
+        super().__init__(parent)
+        self.connection = connection
+        self.core = ClientCore(username, connection.send, listener=self, cache=cache)
+        self.is_running = False
+        self.heartbeat_timer = QTimer(self)  # 连接空闲时发送心跳、判断服务器是否失联
+        self.heartbeat_timer.timeout.connect(self._check_heartbeat)
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setSingleShot(True)
+        self.reconnect_timer.timeout.connect(self._reconnect)
+        self.resume_timer = QTimer(self)
+        self.resume_timer.setSingleShot(True)
+        self.resume_timer.timeout.connect(lambda: self.connection.abort("续传无应答"))
+        self.presence_timer = QTimer(self)  # 在线状态版本号缺口超时后请求完整在线列表
+        self.presence_timer.setSingleShot(True)
+        self.presence_timer.timeout.connect(self._check_presence_gap)
+        connection.frame_received.connect(self._on_frame)
+        connection.connected.connect(self._on_connected)
+        connection.connection_lost.connect(self._on_connection_lost)
 
-    def __init__(self, client_socket):
-        super().__init__()
-        self.client_socket = client_socket
+    def start(self):
+        """开始处理消息（连接已建立、登录帧已发送）"""
         self.is_running = True
+        if HEARTBEAT_INTERVAL:
+            self.heartbeat_timer.start(int(HEARTBEAT_INTERVAL * 1000))
+
+    def _on_frame(self, msg_type, payload):
+        self.core.handle_frame(msg_type, payload)
+        if not self.core.resuming:
+            self.resume_timer.stop()
+        if not self.presence_timer.isActive():
+            self._schedule_presence_check()
+
+    def _schedule_presence_check(self):
+        remaining = self.core.presence_gap_remaining()
+        if remaining is not None:
+            self.presence_timer.start(int(remaining * 1000))
+
+    def _check_presence_gap(self):
+        self.core.check_presence_gap()
+        self._schedule_presence_check()
+
+    def _on_connection_lost(self, reason):
+        """连接意外断开（或心跳超时、重连失败）：有会话时在宽限期内重连，否则报告错误"""
+        self.resume_timer.stop()
+        if not self.is_running:
+            return
+        delay = self.core.connection_lost(reason)
+        if delay is not None:
+            self.reconnect_timer.start(int(delay * 1000))
+
+    def _reconnect(self):
+        """宽限期内反复重连：先尝试续传会话，服务器拒绝时在同一连接上重新登录"""
+        if not self.is_running:
+            return
+        remaining = self.core.reconnect_remaining()
+        if remaining is not None:
+            self.connection.open(min(remaining, RECONNECT_INTERVAL * 3))
+
+    def _on_connected(self):
+        if not self.core.is_reconnecting():
+            return  # 首次连接由登录窗口处理
+        self.core.start_resume()
+        self.resume_timer.start(int(RESUME_TIMEOUT * 1000))
+
+    def _check_heartbeat(self):
+        """定时检查：空闲超过 HEARTBEAT_INTERVAL 时发送心跳，超过 HEARTBEAT_TIMEOUT 视为服务器失联"""
+        if not self.connection.is_connected() or self.core.resuming:
+            return
+        if not self.core.check_heartbeat(time.monotonic() - self.connection.last_received):
+            self.connection.abort("心跳超时，服务器无响应")
+
+    # ---------- ClientListener：转为信号 ----------
+
+    def on_login_result(self, success, online_list):
+        self.login_result_signal.emit(success, online_list)
+
+    def on_group_message(self, message):
+        self.normal_msg_signal.emit(message.room, f"[{message.sender}] {message.time_str}\n{message.content}")
+
+    def on_history_message(self, message):
+        self.history_msg_signal.emit(message.room, f"[{message.sender}] {message.time_str}\n{message.content}")
+
+    def on_private_message(self, sender, content):
+        self.private_msg_signal.emit(sender, content)
+
+    def on_system_message(self, text):
+        self.system_msg_signal.emit(text)
+
+    def on_online_list(self, online_list):
+        self.online_list_update_signal.emit(online_list)
+
+    def on_user_joined(self, username):
+        self.user_joined_signal.emit(username)
+
+    def on_user_left(self, username):
+        self.user_left_signal.emit(username)
+
+    def on_room_joined(self, room, username):
+        self.room_joined_signal.emit(room, username)
+
+    def on_room_left(self, room, username):
+        self.room_left_signal.emit(room, username)
 
-    def run(self):
-        """线程核心逻辑：持续接收并解析服务器消息"""
-        try:
-            self._handle_login_response()
-            self._handle_chat_messages()
-        except Exception as e:
-            self.error_signal.emit(f"接收消息异常：{str(e)}")
-        finally:
-            self.client_socket.close()
-
-    def _handle_login_response(self):
-        """处理登录阶段的服务器响应"""
-        login_data = b""
-        while len(login_data.split(CHAT_SEPARATOR.encode("utf-8"))) < 3 and self.is_running:
-            chunk = self.client_socket.recv(BUFFER_SIZE)
-            if not chunk:
-                self.error_signal.emit("服务器连接中断")
-                return
-            login_data += chunk
-
-        responses = [m.strip() for m in login_data.decode("utf-8").split(CHAT_SEPARATOR) if m.strip()]
-        login_success = False
-        online_list = ""
-        for resp in responses:
-            if resp.startswith("【成功】"):
-                login_success = True
-            elif resp.startswith("【当前在线】"):
-                online_list = resp.replace("【当前在线】", "").strip()
-            elif resp.startswith("【错误】"):
-                self.error_signal.emit(resp)
-            elif resp.startswith("【系统通知】"):
-                self.system_msg_signal.emit(resp)
-
-        self.login_result_signal.emit(login_success, online_list)
-
-    def _handle_chat_messages(self):
-        """处理聊天阶段的服务器消息（修复私聊解析）"""
-        while self.is_running:
-            data = self.client_socket.recv(BUFFER_SIZE).decode("utf-8", errors="ignore")
-            if not data:
-                break
-            msgs = [m.strip() for m in data.split(CHAT_SEPARATOR) if m.strip()]
-            for msg in msgs:
-                if msg.startswith("【系统通知】"):
-                    self.system_msg_signal.emit(msg)
-                    if "当前在线：" in msg:
-                        online_list = msg.split("当前在线：")[-1].strip()
-                        self.online_list_update_signal.emit(online_list)
-                elif msg.startswith("[私聊]"):
-                    try:
-                        # 解析格式：[私聊][发送者] 消息内容（无服务器时间戳）
-                        sender_part = msg.split("[私聊][")[1].split("]")[0]
-                        content_part = msg.split(f"[私聊][{sender_part}] ")[1].strip()
-                        self.private_msg_signal.emit(sender_part, content_part)
-                    except Exception as e:
-                        print(f"解析私聊消息失败：{e}，原始消息：{msg}")
-                        self.normal_msg_signal.emit(f"【解析失败】{msg}")
-                else:
-                    self.normal_msg_signal.emit(msg)
+    def on_error(self, text):
+        self.error_signal.emit(text)
 
     def stop(self):
-        """停止线程"""
-        self.is_running = False
\ No newline at end of file
+        """停止处理（主动下线，之后的断开不再重连）"""
+        self.is_running = False
+        self.heartbeat_timer.stop()
+        self.reconnect_timer.stop()
+        self.resume_timer.stop()
+        self.presence_timer.stop()
@@ -1,38 +1,51 @@
-from config import EXIT_MARKER, CHAT_SEPARATOR
+from protocol import HISTORY_LAST, DEFAULT_ROOM
 
 class MessageSender:
-    """消息发送工具类（修复群聊自己消息格式）"""
-    def __init__(self, client_socket, username, group_ui_callback):
-        self.client_socket = client_socket
-        self.username = username
+    """消息发送工具类（修复群聊自己消息格式）；帧由 ClientCore 编码并加入连接的发送队列，不阻塞界面"""
+    def __init__(self, core, group_ui_callback):
+        self.core = core
+        self.username = core.username
         self.group_ui_callback = group_ui_callback  # 仅用于群聊消息显示
 
-    def send_group_message(self, msg):
+    def send_group_message(self, msg, room=DEFAULT_ROOM):
         """发送群聊消息（修复：只传递纯消息内容，不包含[我]前缀）"""
-        try:
-            self.client_socket.send(f"{msg}{CHAT_SEPARATOR}".encode("utf-8"))
-            self.group_ui_callback(msg)  # 只传递纯消息内容
+        if self.core.send_group(msg, room):
+            self.group_ui_callback(msg, room)  # 只传递纯消息内容
             return True
-        except Exception as e:
-            self.group_ui_callback(f"【发送失败】群聊消息发送失败：{str(e)}")
-            return False
+        self.group_ui_callback("【发送失败】群聊消息发送失败：未连接到服务器", room)
+        return False
+
+    def join_room(self, room):
+        """请求加入房间（服务器确认后才打开房间标签页）"""
+        if self.core.join_room(room):
+            return True
+        print("加入房间失败：未连接到服务器")
+        return False
+
+    def leave_room(self, room):
+        """请求离开房间"""
+        if self.core.leave_room(room):
+            return True
+        print("离开房间失败：未连接到服务器")
+        return False
 
     def send_private_message(self, target_user, msg):
         """发送私聊消息（仅支持对话框调用）"""
         if not target_user or not msg:
             return False
 
-        try:
-            private_msg = f"@{target_user} {msg}"
-            self.client_socket.send(f"{private_msg}{CHAT_SEPARATOR}".encode("utf-8"))
+        if self.core.send_private(target_user, msg):
             return True
-        except Exception as e:
-            print(f"私聊发送失败：{e}")
-            return False
+        print("私聊发送失败：未连接到服务器")
+        return False
+
+    def request_history(self, room, count, mode=HISTORY_LAST):
+        """请求房间历史消息（HISTORY_LAST：最近 count 条；HISTORY_SINCE：count 为消息ID）"""
+        if self.core.request_history(room, count, mode):
+            return True
+        print("请求历史消息失败：未连接到服务器")
+        return False
 
     def send_exit_signal(self):
         """发送退出信号"""
-        try:
-            self.client_socket.send(EXIT_MARKER.encode("utf-8"))
-        except:
-            pass
\ No newline at end of file
+        self.core.send_exit()
@@ -0,0 +1,168 @@
+"""消息显示区域：有界回滚缓冲 + 虚拟化列表视图
+
+每条消息是列表模型中的一行（类别、文本），模型只保留最近 SCROLLBACK_LINES 条，
+超出时从最早的消息开始丢弃，长时间运行内存也不会增长。QListView 只绘制可见的行，
+追加消息的开销与已有消息数无关。
+"""
+from collections import deque
+from PyQt6.QtWidgets import QListView, QAbstractItemView, QApplication
+from PyQt6.QtGui import QColor, QKeySequence
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QPoint, pyqtSignal
+from config import SCROLLBACK_LINES
+
+# 消息类别
+KIND_NORMAL = 0   # 他人的群聊消息
+KIND_SELF = 1     # 自己的群聊消息
+KIND_SYSTEM = 2   # 系统通知
+KIND_HISTORY = 3  # 历史消息
+
+LAYOUT_BATCH_SIZE = 100  # 每次事件循环计算行高的行数
+
+KIND_COLORS = {
+    KIND_NORMAL: QColor(0, 0, 0),
+    KIND_SELF: QColor(128, 0, 128),
+    KIND_SYSTEM: QColor(66, 133, 244),
+    KIND_HISTORY: QColor(128, 128, 128),
+}
+
+class MessageModel(QAbstractListModel):
+    """消息列表模型：环形缓冲（deque），批量追加，超出容量时丢弃最早的消息"""
+    def __init__(self, normal_font, bold_font, capacity=SCROLLBACK_LINES, parent=None):
+        super().__init__(parent)
+        self.messages = deque()  # (类别, 文本)
+        self.capacity = max(capacity, 1)
+        self.history_end = 0  # 历史消息插入位置：历史消息按顺序排在实时消息之前
+        self.fonts = {kind: normal_font for kind in KIND_COLORS}
+        self.fonts[KIND_SYSTEM] = bold_font
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        kind, text = self.messages[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return text
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return KIND_COLORS[kind]
+        if role == Qt.ItemDataRole.FontRole:
+            return self.fonts[kind]
+        return None
+
+    def append_messages(self, entries):
+        """在末尾追加一批消息（一次插入通知）"""
+        entries = entries[-self.capacity:]
+        self._make_room(len(entries))
+        start = len(self.messages)
+        self.beginInsertRows(QModelIndex(), start, start + len(entries) - 1)
+        self.messages.extend(entries)
+        self.endInsertRows()
+
+    def insert_history(self, entries):
+        """把一批历史消息插入到已有历史消息之后、实时消息之前"""
+        entries = entries[-self.capacity:]
+        self._make_room(len(entries))
+        start = min(self.history_end, len(self.messages))
+        self.beginInsertRows(QModelIndex(), start, start + len(entries) - 1)
+        self.messages.rotate(-start)
+        self.messages.extendleft(reversed(entries))
+        self.messages.rotate(start)
+        self.endInsertRows()
+        self.history_end = start + len(entries)
+
+    def prepend_messages(self, entries):
+        """在最前面插入一批更早的消息（从本地缓存向上翻页），只填充剩余容量，返回插入的条数"""
+        count = min(len(entries), self.capacity - len(self.messages))
+        if count <= 0:
+            return 0
+        entries = entries[len(entries) - count:]
+        self.beginInsertRows(QModelIndex(), 0, count - 1)
+        self.messages.extendleft(reversed(entries))
+        self.endInsertRows()
+        self.history_end += count
+        return count
+
+    def _make_room(self, count):
+        """丢弃最早的消息，为即将加入的 count 条腾出空间"""
+        excess = len(self.messages) + count - self.capacity
+        if excess <= 0:
+            return
+        self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+        for _ in range(excess):
+            self.messages.popleft()
+        self.endRemoveRows()
+        self.history_end = max(self.history_end - excess, 0)
+
+    def texts(self, rows=None):
+        """按行号取出消息文本（不指定时为全部消息）"""
+        if rows is None:
+            return [text for _, text in self.messages]
+        return [self.messages[row][1] for row in rows]
+
+class MessageView(QListView):
+    """房间的消息显示区域：只读、自动换行，停留在底部时自动跟随新消息"""
+    top_reached = pyqtSignal()  # 滚动到最上方（需要加载更早的消息）
+
+    def __init__(self, normal_font, bold_font, parent=None):
+        super().__init__(parent)
+        self.message_model = MessageModel(normal_font, bold_font, parent=self)
+        self.setModel(self.message_model)
+        self.setFont(normal_font)
+        self.setWordWrap(True)
+        self.setSpacing(3)
+        self.setUniformItemSizes(False)
+        self.setLayoutMode(QListView.LayoutMode.Batched)  # 分批计算行高，大批量插入/丢弃时不阻塞界面
+        self.setBatchSize(LAYOUT_BATCH_SIZE)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.follow_bottom = True  # 用户向上翻看时为 False，新消息不再自动滚动到底部
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+        self.verticalScrollBar().rangeChanged.connect(self._on_range_changed)
+
+    def _on_scrolled(self, value):
+        scroll_bar = self.verticalScrollBar()
+        self.follow_bottom = value >= scroll_bar.maximum() - 4
+        if value == scroll_bar.minimum() < scroll_bar.maximum():
+            self.top_reached.emit()
+
+    def wheelEvent(self, event):
+        """已在最上方时继续向上滚动也加载更早的消息"""
+        scroll_bar = self.verticalScrollBar()
+        if event.angleDelta().y() > 0 and scroll_bar.value() == scroll_bar.minimum():
+            self.top_reached.emit()
+        super().wheelEvent(event)
+
+    def _on_range_changed(self, minimum, maximum):
+        """行高分批计算完成后滚动范围会继续增大，停留在底部时保持跟随"""
+        if self.follow_bottom:
+            self.verticalScrollBar().setValue(maximum)
+
+    def append_messages(self, entries):
+        self.message_model.append_messages(entries)
+
+    def insert_history(self, entries):
+        self.message_model.insert_history(entries)
+
+    def prepend_messages(self, entries):
+        """在最前面插入更早的消息，保持当前看到的消息位置不变"""
+        anchor = self.indexAt(QPoint(self.spacing() + 1, self.spacing() + 1))  # 最上方可见的消息
+        count = self.message_model.prepend_messages(entries)
+        if count and anchor.isValid():
+            self.scrollTo(self.message_model.index(anchor.row() + count),
+                          QAbstractItemView.ScrollHint.PositionAtTop)
+        return count
+
+    def keyPressEvent(self, event):
+        """Ctrl+C 复制选中的消息"""
+        if event.matches(QKeySequence.StandardKey.Copy):
+            rows = sorted(index.row() for index in self.selectedIndexes())
+            if rows:
+                QApplication.clipboard().setText("\n".join(self.message_model.texts(rows)))
+            return
+        super().keyPressEvent(event)
+
+    def toPlainText(self):
+        """全部消息的文本（与 QTextEdit 接口一致，便于调试和复制全部内容）"""
+        return "\n".join(self.message_model.texts())
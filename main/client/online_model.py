@@ -0,0 +1,124 @@
+"""在线用户列表模型：按用户名增量维护，支持搜索过滤
+
+用户名按排序顺序保存（自己排在最前），上线/下线只插入/删除一行：
+    成员判断查集合 O(1)，定位行号二分查找 O(log n)，不再清空重建整个列表。
+列表为空时显示一行占位提示（「加载中...」「暂无在线用户」）。
+搜索框通过 OnlineFilterModel 过滤，不改动源模型。
+"""
+from bisect import bisect_left
+from PyQt6.QtGui import QColor
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QSortFilterProxyModel
+
+USERNAME_ROLE = Qt.ItemDataRole.UserRole  # 行对应的用户名（占位行为 None）
+
+class OnlineUserModel(QAbstractListModel):
+    """在线用户模型：keys 为排序键列表（自己排在最前，其余按用户名不区分大小写排序）"""
+    def __init__(self, username, font, self_font, parent=None):
+        super().__init__(parent)
+        self.username = username
+        self.keys = []
+        self.members = set()
+        self.placeholder = "加载中..."
+        self.font = font
+        self.self_font = self_font
+
+    def _key(self, username):
+        return (0 if username == self.username else 1, username.casefold(), username)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.keys) or (1 if self.placeholder else 0)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if not self.keys:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return self.placeholder
+            if role == Qt.ItemDataRole.ForegroundRole:
+                return QColor(128, 128, 128)
+            if role == Qt.ItemDataRole.FontRole:
+                return self.font
+            if role == Qt.ItemDataRole.TextAlignmentRole:
+                return Qt.AlignmentFlag.AlignCenter
+            return None
+        rank, _, name = self.keys[index.row()]
+        is_self = rank == 0
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"{name}（自己）" if is_self else name
+        if role == USERNAME_ROLE:
+            return name
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return QColor(66, 133, 244) if is_self else QColor(0, 0, 0)
+        if role == Qt.ItemDataRole.BackgroundRole:
+            return QColor(230, 240, 255) if is_self else None
+        if role == Qt.ItemDataRole.FontRole:
+            return self.self_font if is_self else self.font
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return Qt.AlignmentFlag.AlignCenter
+        return None
+
+    def reset(self, usernames, placeholder="暂无在线用户"):
+        """以完整在线列表重建（登录或重新同步时使用）"""
+        self.beginResetModel()
+        self.members = set(usernames)
+        self.keys = sorted(self._key(name) for name in self.members)
+        self.placeholder = placeholder
+        self.endResetModel()
+
+    def add(self, username):
+        """用户上线：按排序位置插入一行，已在列表中时返回 False"""
+        if username in self.members:
+            return False
+        key = self._key(username)
+        if not self.keys and self.placeholder:
+            # 占位行直接变为第一个用户，行数不变
+            self.members.add(username)
+            self.keys.append(key)
+            self.dataChanged.emit(self.index(0), self.index(0))
+            return True
+        row = bisect_left(self.keys, key)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.members.add(username)
+        self.keys.insert(row, key)
+        self.endInsertRows()
+        return True
+
+    def remove(self, username):
+        """用户下线：删除对应的一行，不在列表中时返回 False"""
+        if username not in self.members:
+            return False
+        self.members.discard(username)
+        if len(self.keys) == 1 and self.placeholder:
+            # 最后一个用户下线：该行变回占位行，行数不变
+            self.keys.clear()
+            self.dataChanged.emit(self.index(0), self.index(0))
+            return True
+        row = bisect_left(self.keys, self._key(username))
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.keys[row]
+        self.endRemoveRows()
+        return True
+
+    def usernames(self):
+        return [key[-1] for key in self.keys]
+
+    def user_count(self):
+        return len(self.keys)
+
+class OnlineFilterModel(QSortFilterProxyModel):
+    """搜索过滤：只显示用户名包含关键字（不区分大小写）的用户，顺序与源模型一致"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.keyword = ""
+
+    def set_keyword(self, keyword):
+        self.keyword = keyword.strip().casefold()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.keyword:
+            return True
+        username = self.sourceModel().index(source_row, 0, source_parent).data(USERNAME_ROLE)
+        return username is not None and self.keyword in username.casefold()
@@ -1,8 +1,9 @@
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTextEdit,
                              QLineEdit, QPushButton, QLabel, QMessageBox)
-from PyQt6.QtGui import QFont, QColor, QTextCursor
+from PyQt6.QtGui import QFont, QColor, QTextCursor, QTextCharFormat
 from PyQt6.QtCore import Qt
 from datetime import datetime
+from client.message_cache import private_key
 
 def get_current_time():
     """获取当前时间，格式：hh:mm:ss"""
@@ -10,12 +11,16 @@ def get_current_time():
 
 class PrivateChatWindow(QDialog):
     """私聊对话框（修复：去掉重复时间戳）"""
-    def __init__(self, parent, username, target_user, message_sender):
+    def __init__(self, parent, username, target_user, message_sender, cache=None):
         super().__init__(parent)
         self.username = username
         self.target_user = target_user  # 对方用户名
         self.message_sender = message_sender
+        self.cache = cache  # 本地消息缓存（未启用时为 None）
+        self.cache_cursor = None  # 已加载的最早消息的本地ID（0 表示已全部加载）
         self.init_ui()
+        if self.cache is not None:
+            self._load_cached_messages()
 
     def init_ui(self):
         """初始化UI（不变）"""
@@ -45,6 +50,7 @@ class PrivateChatWindow(QDialog):
             border-radius: 5px;
             padding: 10px;
         """)
+        self.msg_display.verticalScrollBar().valueChanged.connect(self._on_scrolled)
         main_layout.addWidget(self.msg_display, stretch=1)
 
         input_layout = QHBoxLayout()
@@ -95,6 +101,35 @@ class PrivateChatWindow(QDialog):
         else:
             self._display_system_message("【发送失败】消息发送失败，请重试！")
 
+    def _on_scrolled(self, value):
+        """滚动到顶部时从本地缓存加载更早的消息"""
+        if value == 0 and self.cache_cursor:
+            self._load_cached_messages()
+
+    def _load_cached_messages(self):
+        """从本地缓存加载一页消息：首次加载最近的一页，之后每次加载更早的一页并插入到最前面"""
+        rows = self.cache.page(private_key(self.target_user), before=self.cache_cursor)
+        self.cache_cursor = rows[0][0] if rows else 0
+        if not rows:
+            return
+        scroll_bar = self.msg_display.verticalScrollBar()
+        old_max = scroll_bar.maximum()
+        cursor = QTextCursor(self.msg_display.document())  # 文档开头
+        for _, sender, time_str, content in rows:
+            fmt = QTextCharFormat()
+            fmt.setFont(self.normal_font)
+            if sender == self.username:
+                fmt.setForeground(QColor(128, 0, 128))
+                header = f"[我] {time_str}"
+            else:
+                fmt.setForeground(QColor(231, 76, 60))
+                header = f"[{sender}] {time_str}"
+            cursor.insertText(f"\n{header}\n{content}", fmt)
+        if old_max == 0:
+            self.msg_display.moveCursor(QTextCursor.MoveOperation.End)  # 首次加载：停在最新消息处
+        else:
+            scroll_bar.setValue(scroll_bar.value() + scroll_bar.maximum() - old_max)  # 保持当前看到的内容不动
+
     def _display_self_message(self, msg):
         """[我] hh:mm:ss + 换行消息"""
         self.msg_display.moveCursor(QTextCursor.MoveOperation.End)
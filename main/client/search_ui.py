@@ -0,0 +1,85 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem, QLabel)
+from PyQt6.QtGui import QFont, QColor
+from PyQt6.QtCore import QTimer
+from datetime import datetime
+import time
+
+SEARCH_DELAY_MS = 200  # 停止输入该毫秒数后再搜索
+
+class SearchDialog(QDialog):
+    """聊天记录搜索窗口（搜索本地消息缓存，边输入边搜索）"""
+    def __init__(self, parent, cache, username):
+        super().__init__(parent)
+        self.cache = cache
+        self.username = username
+        self.init_ui()
+
+    def init_ui(self):
+        self.setWindowTitle("搜索聊天记录")
+        self.setFixedSize(500, 450)
+        self.setStyleSheet("background-color: #f5f5f5;")
+
+        self.normal_font = QFont("微软雅黑", 10)
+        self.list_font = QFont("微软雅黑", 9)
+
+        main_layout = QVBoxLayout(self)
+        main_layout.setSpacing(10)
+        main_layout.setContentsMargins(15, 15, 15, 15)
+
+        self.search_input = QLineEdit()
+        self.search_input.setFont(self.normal_font)
+        self.search_input.setPlaceholderText("输入关键字搜索群聊、私聊记录")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.setStyleSheet("""
+            background-color: white;
+            border: 1px solid #ddd;
+            border-radius: 5px;
+            padding: 8px;
+        """)
+        main_layout.addWidget(self.search_input)
+
+        self.status_label = QLabel("")
+        self.status_label.setFont(self.list_font)
+        self.status_label.setStyleSheet("color: #666;")
+        main_layout.addWidget(self.status_label)
+
+        self.result_list = QListWidget()
+        self.result_list.setFont(self.list_font)
+        self.result_list.setWordWrap(True)
+        self.result_list.setStyleSheet("""
+            background-color: white;
+            border: 1px solid #ddd;
+            border-radius: 5px;
+            padding: 5px;
+        """)
+        main_layout.addWidget(self.result_list, stretch=1)
+
+        # 输入停顿后再搜索，避免每个按键都查询一次
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.do_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
+
+    def do_search(self):
+        """搜索并显示结果（最新的在前）"""
+        keyword = self.search_input.text().strip()
+        self.result_list.clear()
+        if not keyword:
+            self.status_label.setText("")
+            return
+        start = time.perf_counter()
+        rows = self.cache.search(keyword)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for conversation, sender, timestamp, content in rows:
+            if conversation.startswith("#"):
+                where = f"群聊 {conversation[1:]}"
+            else:
+                where = f"私聊 {conversation[1:]}"
+            name = "我" if sender == self.username else sender
+            when = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+            item = QListWidgetItem(f"【{where}】[{name}] {when}\n{content}")
+            if sender == self.username:
+                item.setForeground(QColor(128, 0, 128))
+            self.result_list.addItem(item)
+        self.status_label.setText(f"找到 {len(rows)} 条记录（{elapsed_ms:.0f} 毫秒）")
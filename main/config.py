@@ -6,7 +6,64 @@ CONFIG_FILE = "config.json"
 # 默认配置（首次启动时使用）
 DEFAULT_CONFIG = {
     "server_ip": "127.0.0.1",
-    "server_port": 9000
+    "server_port": 9000,
+    "server_mode": "thread",      # 服务器模式：thread（每连接一线程）/ async（asyncio 事件循环）
+    "listen_backlog": 1024,       # 监听队列长度（高并发登录时需调大）
+    "slow_fanout_ms": 50,         # 单条广播扇出耗时超过该值（毫秒）时打印警告
+    "outbound_max_messages": 1024,      # 每个连接出站队列最多缓存的消息数
+    "outbound_max_bytes": 1024 * 1024,  # 每个连接出站队列最多缓存的字节数
+    "outbound_policy": "coalesce",      # 队列满时：drop_oldest / coalesce / disconnect
+    "batch_window_ms": 1,               # 出站批量窗口（毫秒）：首条消息入队后最多等待这么久再发送，0 表示不等待
+    "batch_max_bytes": 16 * 1024,       # 待发送数据达到该字节数时不再等待窗口结束
+    "batch_private": False,             # 私聊消息是否也等待批量窗口（默认立即发送）
+    "tcp_nodelay": True,                # 客户端连接关闭 Nagle 算法（批量由服务器自己完成）
+    "tcp_cork": True,                   # 一批数据需要多次发送时用 TCP_CORK 合并报文（仅 Linux）
+    "compression": "zlib",              # 压缩方式：客户端登录时请求、服务器同意使用（zlib），空字符串表示不压缩
+    "compression_threshold": 256,       # 负载小于该字节数的帧不压缩
+    "compression_level": 6,             # zlib 压缩级别（1 最快，9 压缩率最高）
+    "rate_limit_action": "drop",        # 消息超出限额时：drop（丢弃）/ defer（延后处理，该连接暂停读取）
+    "rate_limit_max_delay": 5,          # defer 最多延后的秒数，需要等待更久的消息仍然丢弃
+    "rate_limit_user": 20,              # 每个用户每秒可发送的消息数（令牌桶速率），0 表示不限
+    "rate_limit_user_burst": 50,        # 每个用户允许的突发消息数（令牌桶容量）
+    "rate_limit_ip": 100,               # 每个 IP 每秒可发送的消息数，0 表示不限
+    "rate_limit_ip_burst": 200,         # 每个 IP 允许的突发消息数
+    "rate_limit_room": 200,             # 每个房间每秒可收到的群聊消息数，0 表示不限
+    "rate_limit_room_burst": 400,       # 每个房间允许的突发群聊消息数
+    "config_reload_seconds": 5,         # 检查配置文件是否修改的间隔（秒），修改后限流配置立即生效，0 表示不检查
+    "heartbeat_interval": 15,           # 连接空闲（未收到对方数据）该秒数后发送心跳，0 表示不启用心跳
+    "heartbeat_timeout": 45,            # 超过该秒数未收到对方任何数据即断开（服务器清理失联客户端，客户端重连）
+    "registry_shards": 16,              # 在线用户表分片数（减少登录/下线时的锁竞争）
+    "room_shards": 4,                   # 每个房间成员表的分片数
+    "max_rooms_per_user": 20,           # 每个用户最多同时加入的房间数（不含大厅）
+    "history_enabled": True,            # 是否记录群聊消息（支持历史消息查询）
+    "history_backend": "sqlite",        # 群聊历史存储：sqlite（与离线私聊共用数据库）/ log（分段日志文件）
+    "history_dir": "history",           # 群聊消息日志目录（按房间、按天分段）
+    "history_fsync_interval": 1.0,      # 消息日志批量刷盘间隔（秒），0 表示每条消息立即刷盘
+    "history_max_fetch": 200,           # 单次历史消息请求最多返回的条数
+    "history_on_login": 50,             # 客户端登录/进入房间时拉取的历史消息条数
+    "scrollback_lines": 2000,           # 客户端每个房间最多保留显示的消息条数（超出时丢弃最早的消息）
+    "client_cache_dir": "client_cache", # 客户端本地消息缓存目录（按用户保存聊天记录，可搜索），空字符串表示不缓存
+    "client_cache_page": 50,            # 打开窗口或向上翻到顶部时从本地缓存加载的消息条数
+    "render_fps": 30,                   # 客户端每秒最多刷新消息显示的次数（期间收到的消息合并为一次更新）
+    "database_path": "chat.db",         # SQLite 数据库文件（群聊历史、离线私聊）
+    "db_batch_size": 512,               # 写线程单个事务最多合并的写入条数
+    "offline_max_messages": 200,        # 每个用户最多保存的离线私聊消息数
+    "offline_max_per_sender": 1000,     # 每个发送者最多保存的离线私聊消息数（发给所有不在线用户的合计）
+    "offline_ttl_days": 30,             # 离线私聊消息的保存天数，过期未取的消息被清除，0 表示不过期
+    "connect_timeout": 5,               # 客户端连接服务器的超时时间（秒）
+    "resume_grace_seconds": 30,         # 断线后保留会话的时间（秒），期间重连可续传，0 表示不保留
+    "resume_buffer_messages": 512,      # 每个会话保留的已发送消息数（重连时重放客户端未收到的部分）
+    "log_level": "INFO",                # 服务器日志级别：DEBUG / INFO / WARNING / ERROR
+    "log_format": "text",               # 服务器日志格式：text / json
+    "metrics_host": "127.0.0.1",        # 监控指标 HTTP 服务监听地址
+    "metrics_port": 9464,               # 监控指标端口（Prometheus 格式，/metrics），0 表示不启用；多进程模式下第 i 个 worker 使用该端口 + i
+    "workers": 0,                       # worker 进程数（共享监听端口，Linux 3.9+），0 表示单进程
+    "bus_socket": "chat-bus.sock",      # 多进程模式下 worker 与主进程通信的 Unix 域套接字路径
+    "bus_request_timeout": 5,           # 多进程模式下 worker 等待中枢应答（申请用户名、续传接管、读取历史）的超时时间（秒）
+    "node_id": "",                      # 集群中本节点的唯一名称（留空时使用 cluster_host:cluster_port）
+    "cluster_host": "127.0.0.1",        # 集群链路监听地址（其他节点连接到这里）
+    "cluster_port": 0,                  # 集群链路端口，0 表示不加入集群
+    "cluster_peers": []                 # 主动连接的其他节点 ["host:port", ...]（节点之间需两两相连）
 }
 
 # 读取配置文件（不存在则创建）
@@ -46,7 +103,64 @@ CONFIG = load_config()
 # 导出配置项
 SERVER_IP = CONFIG["server_ip"]
 SERVER_PORT = CONFIG["server_port"]
-BUFFER_SIZE = 1024
+SERVER_MODE = CONFIG["server_mode"]
+LISTEN_BACKLOG = CONFIG["listen_backlog"]
+SLOW_FANOUT_MS = CONFIG["slow_fanout_ms"]
+OUTBOUND_MAX_MESSAGES = CONFIG["outbound_max_messages"]
+OUTBOUND_MAX_BYTES = CONFIG["outbound_max_bytes"]
+OUTBOUND_POLICY = CONFIG["outbound_policy"]
+BATCH_WINDOW_MS = CONFIG["batch_window_ms"]
+BATCH_MAX_BYTES = CONFIG["batch_max_bytes"]
+BATCH_PRIVATE = CONFIG["batch_private"]
+TCP_NODELAY = CONFIG["tcp_nodelay"]
+TCP_CORK = CONFIG["tcp_cork"]
+COMPRESSION = CONFIG["compression"]
+COMPRESSION_THRESHOLD = CONFIG["compression_threshold"]
+COMPRESSION_LEVEL = CONFIG["compression_level"]
+RATE_LIMIT_ACTION = CONFIG["rate_limit_action"]
+RATE_LIMIT_MAX_DELAY = CONFIG["rate_limit_max_delay"]
+RATE_LIMIT_USER = CONFIG["rate_limit_user"]
+RATE_LIMIT_USER_BURST = CONFIG["rate_limit_user_burst"]
+RATE_LIMIT_IP = CONFIG["rate_limit_ip"]
+RATE_LIMIT_IP_BURST = CONFIG["rate_limit_ip_burst"]
+RATE_LIMIT_ROOM = CONFIG["rate_limit_room"]
+RATE_LIMIT_ROOM_BURST = CONFIG["rate_limit_room_burst"]
+CONFIG_RELOAD_SECONDS = CONFIG["config_reload_seconds"]
+HEARTBEAT_INTERVAL = CONFIG["heartbeat_interval"]
+HEARTBEAT_TIMEOUT = CONFIG["heartbeat_timeout"]
+REGISTRY_SHARDS = CONFIG["registry_shards"]
+ROOM_SHARDS = CONFIG["room_shards"]
+MAX_ROOMS_PER_USER = CONFIG["max_rooms_per_user"]
+HISTORY_ENABLED = CONFIG["history_enabled"]
+HISTORY_BACKEND = CONFIG["history_backend"]
+HISTORY_DIR = CONFIG["history_dir"]
+HISTORY_FSYNC_INTERVAL = CONFIG["history_fsync_interval"]
+HISTORY_MAX_FETCH = CONFIG["history_max_fetch"]
+HISTORY_ON_LOGIN = CONFIG["history_on_login"]
+SCROLLBACK_LINES = CONFIG["scrollback_lines"]
+RENDER_FPS = CONFIG["render_fps"]
+CLIENT_CACHE_DIR = CONFIG["client_cache_dir"]
+CLIENT_CACHE_PAGE = CONFIG["client_cache_page"]
+DATABASE_PATH = CONFIG["database_path"]
+DB_BATCH_SIZE = CONFIG["db_batch_size"]
+OFFLINE_MAX_MESSAGES = CONFIG["offline_max_messages"]
+OFFLINE_MAX_PER_SENDER = CONFIG["offline_max_per_sender"]
+OFFLINE_TTL_DAYS = CONFIG["offline_ttl_days"]
+CONNECT_TIMEOUT = CONFIG["connect_timeout"]
+RESUME_GRACE_SECONDS = CONFIG["resume_grace_seconds"]
+RESUME_BUFFER_MESSAGES = CONFIG["resume_buffer_messages"]
+LOG_LEVEL = CONFIG["log_level"]
+LOG_FORMAT = CONFIG["log_format"]
+METRICS_HOST = CONFIG["metrics_host"]
+METRICS_PORT = CONFIG["metrics_port"]
+WORKERS = CONFIG["workers"]
+BUS_SOCKET = CONFIG["bus_socket"]
+BUS_REQUEST_TIMEOUT = CONFIG["bus_request_timeout"]
+NODE_ID = CONFIG["node_id"]
+CLUSTER_HOST = CONFIG["cluster_host"]
+CLUSTER_PORT = CONFIG["cluster_port"]
+CLUSTER_PEERS = CONFIG["cluster_peers"]
+BUFFER_SIZE = 16 * 1024  # 单次 recv 读取上限（帧可跨多次 recv 拼接）
 EXIT_MARKER = "__EXIT__"
 CHAT_SEPARATOR = "|||"
 SERVER_BIND_ADDR = ("0.0.0.0", SERVER_PORT)
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""消息模型：各类消息的字段定义、一次拆分的解码、按消息类型查表的分发（服务器与客户端共用）
+
+同一消息类型在两个方向上的字段不同（例如 MSG_GROUP：客户端发送 房间、内容，服务器转发时
+附带消息ID、发送者、时间），因此分为两张表：
+    CLIENT_MESSAGES：客户端发出、服务器解码的消息
+    SERVER_MESSAGES：服务器发出、客户端解码的消息
+新增消息类型只需定义一个 Message 子类、登记到对应的表，再在 Dispatcher 中注册处理函数。
+"""
+from protocol import (MSG_LOGIN, MSG_GROUP, MSG_PRIVATE, MSG_SYSTEM, MSG_EXIT, MSG_PRESENCE,
+                      MSG_PRESENCE_SYNC, MSG_ROOM_JOIN, MSG_ROOM_LEAVE, MSG_HISTORY_REQUEST,
+                      MSG_HISTORY, MSG_HISTORY_SCOPE, MSG_RESUME, MSG_PING, MSG_PONG, split_fields)
+
+class Message:
+    """消息基类：field_names 依次对应负载中的字段（最后一个字段可包含任意字符）"""
+    __slots__ = ()
+    msg_type = None
+    field_names = ()
+
+    def __init__(self, *fields):
+        for name, value in zip(self.field_names, fields):
+            setattr(self, name, value)
+
+    @classmethod
+    def decode(cls, payload):
+        """一次拆分负载得到全部字段（字段不足时以空字符串补齐）"""
+        if not cls.field_names:
+            return cls()
+        return cls(*split_fields(payload, len(cls.field_names)))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.field_names)
+        return f"{type(self).__name__}({fields})"
+
+# ---------- 双向 ----------
+
+class Ping(Message):
+    """心跳请求"""
+    __slots__ = ()
+    msg_type = MSG_PING
+
+class Pong(Message):
+    """心跳应答"""
+    __slots__ = ()
+    msg_type = MSG_PONG
+
+# ---------- 客户端 -> 服务器 ----------
+
+class LoginRequest(Message):
+    """登录：用户名、支持的压缩方式"""
+    __slots__ = field_names = ("username", "compression")
+    msg_type = MSG_LOGIN
+
+class GroupSend(Message):
+    """发送群聊消息：房间、内容"""
+    __slots__ = field_names = ("room", "content")
+    msg_type = MSG_GROUP
+
+class PrivateSend(Message):
+    """发送私聊消息：目标用户、内容"""
+    __slots__ = field_names = ("target", "content")
+    msg_type = MSG_PRIVATE
+
+class ExitRequest(Message):
+    """主动下线"""
+    __slots__ = ()
+    msg_type = MSG_EXIT
+
+class PresenceSyncRequest(Message):
+    """请求完整在线列表"""
+    __slots__ = ()
+    msg_type = MSG_PRESENCE_SYNC
+
+class RoomJoinRequest(Message):
+    """加入房间"""
+    __slots__ = field_names = ("room",)
+    msg_type = MSG_ROOM_JOIN
+
+class RoomLeaveRequest(Message):
+    """离开房间"""
+    __slots__ = field_names = ("room",)
+    msg_type = MSG_ROOM_LEAVE
+
+class HistoryRequest(Message):
+    """查询历史消息：房间、方式、条数或消息ID"""
+    __slots__ = field_names = ("room", "mode", "value")
+    msg_type = MSG_HISTORY_REQUEST
+
+class ResumeRequest(Message):
+    """断线续传：用户名、会话令牌、已收到的帧数"""
+    __slots__ = field_names = ("username", "token", "received_seq")
+    msg_type = MSG_RESUME
+
+# ---------- 服务器 -> 客户端 ----------
+
+class LoginResponse(Message):
+    """登录结果、时间、在线版本号、在线列表、会话令牌、同意的压缩方式"""
+    __slots__ = field_names = ("success", "time_str", "seq", "online_list", "token", "compression")
+    msg_type = MSG_LOGIN
+
+class GroupMessage(Message):
+    """群聊消息：房间、消息ID、发送者、时间、内容"""
+    __slots__ = field_names = ("room", "msg_id", "sender", "time_str", "content")
+    msg_type = MSG_GROUP
+
+class HistoryMessage(GroupMessage):
+    """历史消息（字段与群聊消息相同）"""
+    __slots__ = ()
+    msg_type = MSG_HISTORY
+
+class HistoryScope(Message):
+    """消息ID所属的范围：集群中各节点独立分配消息ID，只有同一范围内的消息ID可以比较"""
+    __slots__ = field_names = ("scope",)
+    msg_type = MSG_HISTORY_SCOPE
+
+class PrivateMessage(Message):
+    """私聊消息：发送者、内容"""
+    __slots__ = field_names = ("sender", "content")
+    msg_type = MSG_PRIVATE
+
+class SystemNotice(Message):
+    """系统通知文本"""
+    __slots__ = field_names = ("text",)
+    msg_type = MSG_SYSTEM
+
+class PresenceUpdate(Message):
+    """在线状态变更：操作、版本号、用户名/在线列表"""
+    __slots__ = field_names = ("op", "seq", "data")
+    msg_type = MSG_PRESENCE
+
+class RoomJoined(Message):
+    """有人加入房间：房间、用户名"""
+    __slots__ = field_names = ("room", "username")
+    msg_type = MSG_ROOM_JOIN
+
+class RoomLeft(Message):
+    """有人离开房间：房间、用户名"""
+    __slots__ = field_names = ("room", "username")
+    msg_type = MSG_ROOM_LEAVE
+
+class ResumeResponse(Message):
+    """续传结果（"1" / "0"）"""
+    __slots__ = field_names = ("result",)
+    msg_type = MSG_RESUME
+
+CLIENT_MESSAGES = {cls.msg_type: cls for cls in (
+    LoginRequest, GroupSend, PrivateSend, ExitRequest, PresenceSyncRequest, RoomJoinRequest,
+    RoomLeaveRequest, HistoryRequest, ResumeRequest, Ping, Pong)}
+SERVER_MESSAGES = {cls.msg_type: cls for cls in (
+    LoginResponse, GroupMessage, HistoryMessage, HistoryScope, PrivateMessage, SystemNotice,
+    PresenceUpdate, RoomJoined, RoomLeft, ResumeResponse, Ping, Pong)}
+
+def decode_message(registry, msg_type, payload):
+    """按消息类型解码为消息对象，表中没有的消息类型返回 None"""
+    cls = registry.get(msg_type)
+    return cls.decode(payload) if cls is not None else None
+
+class Dispatcher:
+    """分发表：消息类型 -> 处理函数，处理函数的最后一个参数为消息对象"""
+    def __init__(self, handlers=None):
+        self.handlers = {}
+        for message_cls, handler in (handlers or {}).items():
+            self.register(message_cls, handler)
+
+    def register(self, message_cls, handler):
+        self.handlers[message_cls.msg_type] = handler
+
+    def dispatch(self, message, *args):
+        """调用消息对应的处理函数并返回其结果，没有处理函数时返回 None"""
+        handler = self.handlers.get(message.msg_type)
+        if handler is not None:
+            return handler(*args, message)
+        return None
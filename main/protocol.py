@@ -0,0 +1,250 @@
+"""通信协议模块：长度前缀二进制帧（服务器与客户端共用）
+
+帧格式（网络字节序）：
+    魔数(1B, 0xFE) | 协议版本(1B) | 消息类型(1B) | 负载长度(4B) | 负载(UTF-8)
+
+多字段负载用 FIELD_SEPARATOR 连接。0xFE 不会出现在任何 UTF-8 文本中，
+服务器据此区分新协议客户端和旧版 ||| 文本客户端（迁移期兼容）。
+
+压缩（登录时协商）：客户端在登录帧中声明支持的压缩方式，服务器同意后，负载不小于
+COMPRESSION_THRESHOLD 的帧整帧以 raw deflate 压缩（预置字典 COMPRESSION_DICT）后
+作为 MSG_COMPRESSED 帧的负载发出。每个压缩帧可独立解压，因此广播只需压缩一次，
+断线续传重放的帧也无需重新编码；FrameDecoder 自动解压并产出其中的原始帧。
+
+心跳：客户端登录（或续传）成功后先发一个 MSG_PING 表明支持心跳，此后任一方在
+HEARTBEAT_INTERVAL 秒内没有收到对方任何数据时发送 MSG_PING，收到的一方回复 MSG_PONG；
+超过 HEARTBEAT_TIMEOUT 秒仍未收到任何数据即认为对方已失联。心跳帧不计入续传帧数。
+"""
+import struct
+import zlib
+from config import CHAT_SEPARATOR, EXIT_MARKER
+from config import COMPRESSION, COMPRESSION_THRESHOLD, COMPRESSION_LEVEL
+
+FRAME_MAGIC = 0xFE
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct("!BBBI")
+MAX_FRAME_SIZE = 1024 * 1024  # 单帧负载上限，超出视为协议错误
+FIELD_SEPARATOR = "\x1f"      # ASCII 单元分隔符，用户无法直接输入
+
+# 消息类型
+MSG_LOGIN = 1    # 客户端：用户名；服务器：登录结果、时间、在线版本号、在线列表、会话令牌
+MSG_GROUP = 2    # 客户端：房间、消息内容；服务器：房间、消息ID、发送者、时间、消息内容
+MSG_PRIVATE = 3  # 客户端：目标用户、消息内容；服务器：发送者、消息内容
+MSG_SYSTEM = 4   # 服务器：系统通知文本
+MSG_EXIT = 5     # 客户端：主动下线
+MSG_PRESENCE = 6       # 服务器：在线状态变更（操作、版本号、用户名/在线列表）
+MSG_PRESENCE_SYNC = 7  # 客户端：发现版本号缺口，请求完整在线列表
+MSG_ROOM_JOIN = 8      # 客户端：房间名；服务器：房间名、加入者（广播给房间成员）
+MSG_ROOM_LEAVE = 9     # 客户端：房间名；服务器：房间名、离开者（广播给房间成员）
+MSG_HISTORY_REQUEST = 10  # 客户端：房间、方式（HISTORY_LAST / HISTORY_SINCE）、条数或消息ID
+MSG_HISTORY = 11          # 服务器：房间、消息ID、发送者、时间、消息内容（每条历史消息一帧）
+MSG_RESUME = 12  # 客户端：用户名、会话令牌、已收到的帧数；服务器：结果（"1"/"0"），该帧本身不计入帧数
+MSG_COMPRESSED = 13  # 服务器：压缩后的完整帧（解压后按其中的帧计数，本身不计数）
+MSG_PING = 14  # 双向：心跳请求（负载为空），不计入帧数
+MSG_PONG = 15  # 双向：心跳应答（负载为空），不计入帧数
+MSG_HISTORY_SCOPE = 16  # 服务器：消息ID所属的范围（集群节点ID），登录成功时先于登录响应发送
+UNCOUNTED_TYPES = (MSG_RESUME, MSG_PING, MSG_PONG)  # 不计入续传帧数的消息类型
+
+# 历史消息请求方式
+HISTORY_LAST = "last"    # 最近 N 条
+HISTORY_SINCE = "since"  # 某个消息ID之后的消息
+
+DEFAULT_ROOM = "大厅"  # 所有在线用户自动加入、不可退出的默认房间（即原来的群聊）
+
+# 在线状态操作
+PRESENCE_SNAPSHOT = "S"  # 完整在线列表（逗号分隔）
+PRESENCE_JOIN = "J"      # 用户上线
+PRESENCE_LEAVE = "L"     # 用户下线
+
+# 压缩方式（MSG_LOGIN 的第二个字段为客户端支持的压缩方式，逗号分隔）
+COMPRESSION_ZLIB = "zlib"
+
+# 压缩预置字典：帧中反复出现的片段（越常见越靠后），客户端和服务器必须完全一致
+COMPRESSION_DICT = (
+    "（离线消息 你有 条离线私聊消息 不在线，消息将在其上线后送达 已下线！当前在线："
+    "已上线！当前在线：【系统通知】\n用户 " + DEFAULT_ROOM + FIELD_SEPARATOR
+).encode("utf-8")
+_COMPRESSOR = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15, zdict=COMPRESSION_DICT)
+
+_SEPARATOR_BYTES = CHAT_SEPARATOR.encode("utf-8")
+_EXIT_MARKER_BYTES = EXIT_MARKER.encode("utf-8")
+_COMPACT_THRESHOLD = 64 * 1024  # 已消费字节超过该值时才整理缓冲区
+
+class ProtocolError(Exception):
+    """收到无法解析的数据（魔数/版本不符或帧过大）"""
+
+def encode_frame(msg_type, *fields):
+    """把消息编码为一帧二进制数据"""
+    payload = FIELD_SEPARATOR.join(fields).encode("utf-8")
+    return FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, msg_type, len(payload)) + payload
+
+def encode_login(username, compression=COMPRESSION):
+    """登录帧：用户名，启用压缩时附带支持的压缩方式"""
+    if compression:
+        return encode_frame(MSG_LOGIN, username, compression)
+    return encode_frame(MSG_LOGIN, username)
+
+def compress_frame(frame):
+    """把一帧压缩为 MSG_COMPRESSED 帧（负载小于阈值或压缩后不更小时原样返回）"""
+    if len(frame) - FRAME_HEADER.size < COMPRESSION_THRESHOLD:
+        return frame
+    compressor = _COMPRESSOR.copy()  # 复制已载入预置字典的压缩器，省去每帧重新载入
+    data = compressor.compress(frame) + compressor.flush()
+    if len(data) + FRAME_HEADER.size >= len(frame):
+        return frame
+    return FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, MSG_COMPRESSED, len(data)) + data
+
+def decompress_frames(data):
+    """解压 MSG_COMPRESSED 帧的负载，返回其中的 [(消息类型, 负载文本)]"""
+    decompressor = zlib.decompressobj(-15, zdict=COMPRESSION_DICT)
+    try:
+        inner = decompressor.decompress(data, FRAME_HEADER.size + MAX_FRAME_SIZE + 1)
+    except zlib.error as e:
+        raise ProtocolError(f"压缩帧无法解压：{e}")
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ProtocolError("压缩帧不完整或解压后过大")
+    frames = []
+    pos = 0
+    while pos < len(inner):
+        if len(inner) - pos < FRAME_HEADER.size:
+            raise ProtocolError("压缩帧中的数据不完整")
+        magic, version, msg_type, length = FRAME_HEADER.unpack_from(inner, pos)
+        start = pos + FRAME_HEADER.size
+        if (magic != FRAME_MAGIC or version != PROTOCOL_VERSION or msg_type == MSG_COMPRESSED
+                or len(inner) - start < length):
+            raise ProtocolError("压缩帧中的数据无效")
+        frames.append((msg_type, inner[start:start + length].decode("utf-8", "replace")))
+        pos = start + length
+    return frames
+
+def split_fields(payload, count):
+    """按字段数拆分负载（最后一个字段可包含任意字符），字段不足时以空字符串补齐"""
+    fields = payload.split(FIELD_SEPARATOR, count - 1)
+    if len(fields) < count:
+        fields.extend([""] * (count - len(fields)))
+    return fields
+
+def encode_legacy(msg_type, *fields):
+    """按旧版 ||| 文本格式编码服务器消息（仅用于旧客户端）"""
+    if msg_type == MSG_GROUP:
+        _, _, sender, time_str, content = fields
+        text = f"[{sender}] {time_str}\n{content}{CHAT_SEPARATOR}"
+    elif msg_type == MSG_PRIVATE:
+        sender, content = fields
+        text = f"[私聊][{sender}] {content}{CHAT_SEPARATOR}"
+    elif msg_type == MSG_LOGIN:
+        success, time_str, _, online_str = fields[:4]
+        if success == "1":
+            text = f"【成功】{time_str}\n登录成功！{CHAT_SEPARATOR}【当前在线】{online_str}{CHAT_SEPARATOR}"
+        else:
+            text = f"【错误】{time_str}\n登录失败！{CHAT_SEPARATOR}【当前在线】{online_str}{CHAT_SEPARATOR}"
+    else:
+        text = f"{fields[0] if fields else ''}{CHAT_SEPARATOR}"
+    return text.encode("utf-8")
+
+def encode_message(legacy, msg_type, *fields):
+    """根据连接的协议类型编码消息"""
+    if legacy:
+        return encode_legacy(msg_type, *fields)
+    return encode_frame(msg_type, *fields)
+
+class FrameDecoder:
+    """增量帧解析器：数据追加到可复用缓冲区，按长度前缀切出完整帧，
+    半帧留在缓冲区等待后续数据（不会截断多字节字符）"""
+    legacy = False
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0  # 已消费位置
+
+    def feed(self, data):
+        """追加数据，返回本次解析出的 [(消息类型, 负载文本)]"""
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        pos = self._pos
+        end = len(buffer)
+        with memoryview(buffer) as view:
+            while end - pos >= FRAME_HEADER.size:
+                magic, version, msg_type, length = FRAME_HEADER.unpack_from(buffer, pos)
+                if magic != FRAME_MAGIC or version != PROTOCOL_VERSION:
+                    raise ProtocolError(f"不支持的帧头：magic={magic} version={version}")
+                if length > MAX_FRAME_SIZE:
+                    raise ProtocolError(f"帧过大：{length} 字节")
+                start = pos + FRAME_HEADER.size
+                if end - start < length:
+                    break  # 半帧，等待更多数据
+                if msg_type == MSG_COMPRESSED:
+                    frames.extend(decompress_frames(view[start:start + length]))
+                else:
+                    frames.append((msg_type, str(view[start:start + length], "utf-8", "replace")))
+                pos = start + length
+
+        # 整理缓冲区：全部消费则清空，否则累计到阈值再丢弃已消费部分
+        if pos == end:
+            buffer.clear()
+            pos = 0
+        elif pos >= _COMPACT_THRESHOLD:
+            del buffer[:pos]
+            pos = 0
+        self._pos = pos
+        return frames
+
+class LegacyDecoder:
+    """旧版 ||| 分隔文本协议解析器，输出与 FrameDecoder 相同的 (消息类型, 负载)"""
+    legacy = True
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._logged_in = False
+
+    def feed(self, data):
+        """追加数据，返回本次解析出的 [(消息类型, 负载文本)]"""
+        buffer = self._buffer
+        buffer += data
+        if not self._logged_in:
+            # 旧客户端登录时直接发送用户名（无分隔符），首段数据即为用户名
+            self._logged_in = True
+            username = buffer.decode("utf-8", errors="replace").strip()
+            buffer.clear()
+            return [(MSG_LOGIN, username)]
+
+        frames = []
+        start = 0
+        while True:
+            index = buffer.find(_SEPARATOR_BYTES, start)
+            if index < 0:
+                break
+            text = buffer[start:index].decode("utf-8", errors="replace").strip()
+            start = index + len(_SEPARATOR_BYTES)
+            frame = self._parse_text(text)
+            if frame:
+                frames.append(frame)
+        if start:
+            del buffer[:start]
+
+        # 旧客户端的退出标记不带分隔符
+        if _EXIT_MARKER_BYTES in buffer:
+            buffer.clear()
+            frames.append((MSG_EXIT, ""))
+        return frames
+
+    @staticmethod
+    def _parse_text(text):
+        """把一条旧格式文本转换为 (消息类型, 负载)"""
+        if not text:
+            return None
+        if EXIT_MARKER in text:
+            return (MSG_EXIT, "")
+        if text.startswith("@"):
+            if " " not in text[1:]:
+                return None  # 无消息内容，忽略
+            target_user, content = text[1:].split(" ", 1)
+            return (MSG_PRIVATE, f"{target_user}{FIELD_SEPARATOR}{content}")
+        return (MSG_GROUP, f"{DEFAULT_ROOM}{FIELD_SEPARATOR}{text}")
+
+def create_decoder(first_byte):
+    """根据连接收到的第一个字节选择解析器（新协议帧 / 旧版文本）"""
+    if first_byte == FRAME_MAGIC:
+        return FrameDecoder()
+    return LegacyDecoder()
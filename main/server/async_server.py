@@ -0,0 +1,212 @@
+"""异步服务器模块：单进程 asyncio 事件循环（Linux 下基于 epoll）承载海量连接"""
+import asyncio
+from config import BUFFER_SIZE
+from protocol import MSG_RESUME
+from messages import CLIENT_MESSAGES, decode_message
+from server.outbound import KIND_NORMAL, PUT_OVERFLOW, PUT_RESYNC, BATCH_WINDOW, configure_socket
+from server.connection import (ClientConnection, receive_username, negotiate_compression,
+                               login_user, resume_user, needs_takeover, reject_resume,
+                               dispatch_message, logout_user)
+from server import bus
+from server.system_notify import resync_presence
+from server.rate_limit import check_message
+from server.heartbeat import heartbeat_loop
+from server.logger import get_logger
+from server.metrics import CONNECTIONS_ACCEPTED, BYTES_IN, SEND_FAILURES, SEND_CALLS, count_sent
+
+log = get_logger("async_server")
+
+class AsyncClientConnection(ClientConnection):
+    """基于 asyncio StreamWriter 的客户端连接，接口与线程模式一致；
+    出站队列由独立的写协程发送，队列满时按同样的策略处理慢客户端。
+    send / abort / close 可从其他线程调用（写库回调、会话过期定时器、总线接收线程），
+    对传输层和任务的操作一律转交事件循环线程执行。"""
+    def __init__(self, writer):
+        super().__init__(None, writer.get_extra_info("peername"))
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+
+    def send(self, data, kind=KIND_NORMAL):
+        """放入出站队列并唤醒写协程（不阻塞调用方）"""
+        with self.outbound_cond:
+            if self.closed:
+                return 0
+            result = self.outbound.put(data, kind)
+            # 队列由空变为非空时唤醒写协程；批量窗口内只在需要立即发送时再唤醒
+            wake = len(self.outbound) == 1 or self.outbound.flush_due()
+        if result == PUT_OVERFLOW:
+            self.disconnect_slow_consumer()
+            return 0
+        if self.writer_thread is None:
+            self._call_on_loop(self.start_writer)
+        if wake:
+            self._wake()
+        if result == PUT_RESYNC:
+            resync_presence(self)  # 出站队列丢弃了在线状态帧，以完整列表代替
+        return len(data)
+
+    def _wake(self):
+        """唤醒写协程（允许从其他线程调用）"""
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def _call_on_loop(self, callback):
+        """在事件循环线程中执行 callback（在其他线程调用时转交事件循环，稍后执行）"""
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            callback()
+        else:
+            self.loop.call_soon_threadsafe(callback)
+
+    def start_writer(self):
+        """启动写协程（沿用 writer_thread 字段记录）"""
+        if self.writer_thread is None:
+            self.writer_thread = self.loop.create_task(self._writer_loop())
+
+    async def _writer_loop(self):
+        """写协程：等待批量窗口后取出队列中的全部数据写入传输层，等待缓冲区回落后再继续"""
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                if BATCH_WINDOW and not self.closed and not self.outbound.flush_due():
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), BATCH_WINDOW)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.wakeup.clear()
+                with self.outbound_cond:
+                    batch = self.outbound.drain()
+                    closed = self.closed
+                if batch:
+                    session = self.session
+                    if session is not None:
+                        session.record_sent(batch)  # 先编号：未送达的帧可在重连时重放
+                    self.writer.writelines(batch)  # 整批交给传输层一次写出
+                    SEND_CALLS.inc()
+                    count_sent(batch, self.legacy)
+                    await self.writer.drain()
+                if closed:
+                    break
+        except (ConnectionError, OSError) as e:
+            SEND_FAILURES.inc()
+            log.warning("发送失败", address=self.address, error=e)
+            self.abort()
+        finally:
+            self.writer.close()
+
+    def abort(self):
+        """丢弃未发送数据并立即断开连接"""
+        with self.outbound_cond:
+            self.closed = True
+            self.outbound.clear()
+        self._call_on_loop(self.writer.transport.abort)
+
+    def close(self):
+        """标记关闭：写协程发完剩余数据后关闭连接"""
+        with self.outbound_cond:
+            self.closed = True
+        self._call_on_loop(self._close_on_loop)
+
+    def _close_on_loop(self):
+        if self.writer_thread is None:
+            self.writer.close()
+        else:
+            self.wakeup.set()
+
+async def receive_messages(reader, client_conn):
+    """持续接收并逐条产出解码后的消息对象（忽略未知的消息类型），连接断开时结束"""
+    while True:
+        data = await reader.read(BUFFER_SIZE)
+        if not data:
+            return
+        BYTES_IN.inc(len(data))
+        for msg_type, payload in client_conn.feed(data):
+            message = decode_message(CLIENT_MESSAGES, msg_type, payload)
+            if message is not None:
+                yield message
+        # 让出事件循环，使各连接的写协程及时发送，避免单个发送方霸占循环导致队列溢出
+        await asyncio.sleep(0)
+
+async def handle_resume(client_conn, message):
+    """断线续传：需经中枢接管其他 worker 上的会话时，等待应答期间不阻塞事件循环"""
+    username = resume_user(client_conn, message)
+    if username:
+        return username
+    username, token = message.username, message.token
+    reject_resume(client_conn, username,
+                  needs_takeover(username) and await bus.client.takeover_async(username, token))
+    return None
+
+async def handle_async_client(reader, writer):
+    """以协程方式处理单个客户端连接（登录、群聊、私聊语义与线程模式一致）"""
+    client_conn = AsyncClientConnection(writer)
+    client_address = client_conn.address
+    username = None
+    CONNECTIONS_ACCEPTED.inc()
+    configure_socket(writer.get_extra_info("socket"))
+    try:
+        log.debug("新连接", address=client_address)
+        messages = receive_messages(reader, client_conn)
+
+        # 1~2. 首条消息：登录（验证、登记在线用户、广播上线通知）或断线续传
+        async for message in messages:
+            if message.msg_type == MSG_RESUME:
+                username = await handle_resume(client_conn, message)
+                if username:
+                    break
+                continue  # 续传失败，客户端可在同一连接上重新登录
+            username = receive_username(message)
+            negotiate_compression(client_conn, message)
+            claimed = None
+            if username and bus.client is not None:
+                claimed = await bus.client.claim_async(username)  # 多进程模式：向中枢申请用户名
+            if not login_user(username, client_conn, client_address, claimed):
+                username = None
+            break
+        if not username:
+            await writer.drain()
+            return
+
+        # 3. 持续接收消息（超出限额的消息丢弃或延后处理）
+        async for message in messages:
+            delay = check_message(username, client_conn, message)
+            if delay is None:
+                continue
+            if delay:
+                await asyncio.sleep(delay)
+            if not dispatch_message(username, client_conn, message):
+                log.info("用户主动下线", username=username)
+                break
+
+    except asyncio.CancelledError:
+        pass  # 服务器关闭（Ctrl+C / worker 收到 SIGTERM），正常结束即可
+    except Exception as e:
+        log.warning("客户端异常", address=client_address, error=e)
+    finally:
+        logout_user(username, client_conn)
+        client_conn.close()
+        log.debug("连接已关闭", address=client_address)
+
+async def serve(server_socket, backlog):
+    """在已绑定的监听 socket 上启动异步服务"""
+    server = await asyncio.start_server(handle_async_client, sock=server_socket,
+                                        backlog=backlog)
+    heartbeat = asyncio.create_task(heartbeat_loop())  # 保留引用：未被引用的任务可能被垃圾回收
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        heartbeat.cancel()
+        try:
+            await heartbeat
+        except asyncio.CancelledError:
+            pass
+
+def run_async_server(server_socket, backlog):
+    """异步模式入口（阻塞直到 Ctrl+C）"""
+    server_socket.setblocking(False)
+    asyncio.run(serve(server_socket, backlog))
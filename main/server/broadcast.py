@@ -0,0 +1,89 @@
+"""广播引擎：收件人快照 + 每种协议只编码（压缩）一次 + 写入各连接出站队列（不阻塞发送方）"""
+import threading
+import time
+from collections import deque
+from config import SLOW_FANOUT_MS
+from protocol import encode_message, compress_frame
+from server.outbound import KIND_NORMAL
+from server.logger import get_logger
+from server.metrics import BROADCAST_SECONDS, BROADCAST_RECIPIENTS, SEND_FAILURES
+
+log = get_logger("broadcast")
+
+class FanoutStats:
+    """广播扇出耗时统计（线程安全）"""
+    def __init__(self, window=1024):
+        self.lock = threading.Lock()
+        self.count = 0            # 广播次数
+        self.recipients = 0       # 累计收件人数
+        self.total_seconds = 0.0  # 累计扇出耗时
+        self.max_seconds = 0.0
+        self.recent = deque(maxlen=window)  # 最近若干次 (收件人数, 耗时)
+
+    def record(self, recipients, seconds):
+        with self.lock:
+            self.count += 1
+            self.recipients += recipients
+            self.total_seconds += seconds
+            if seconds > self.max_seconds:
+                self.max_seconds = seconds
+            self.recent.append((recipients, seconds))
+
+    def summary(self):
+        """返回统计摘要（毫秒）"""
+        with self.lock:
+            recent = sorted(seconds for _, seconds in self.recent)
+            count = self.count
+            return {
+                "count": count,
+                "avg_recipients": self.recipients / count if count else 0,
+                "avg_ms": self.total_seconds * 1000 / count if count else 0,
+                "p99_ms": recent[int(len(recent) * 0.99)] * 1000 if recent else 0,
+                "max_ms": self.max_seconds * 1000,
+            }
+
+fanout_stats = FanoutStats()
+
+def broadcast(recipients, msg_type, *fields, exclude=None, kind=KIND_NORMAL, legacy_message=None,
+              legacy_kind=None):
+    """把一条消息扇出给 recipients（[(用户名, 连接)] 快照），返回 (入队人数, 耗时秒)
+
+    legacy_message 为可选的回调，返回发给旧客户端的 (消息类型, *字段)，
+    只在收件人中存在旧客户端时调用一次；legacy_kind 为其出站类别（默认与 kind 相同）。"""
+    start = time.perf_counter()
+    encoded = {}  # 按协议类型缓存编码结果，同类连接共享同一份字节串
+    compressed = None  # 已协商压缩的连接共享的压缩结果（只有新协议连接会启用压缩）
+    delivered = 0
+    if legacy_message is None or legacy_kind is None:
+        legacy_kind = kind
+    for username, client_conn in recipients:
+        if username == exclude or client_conn.remote:
+            continue  # 其他 worker 上的用户由其所在 worker 扇出
+        legacy = client_conn.legacy
+        data = encoded.get(legacy)
+        if data is None:
+            if legacy and legacy_message is not None:
+                data = encoded[legacy] = encode_message(legacy, *legacy_message())
+            else:
+                data = encoded[legacy] = encode_message(legacy, msg_type, *fields)
+        if client_conn.compression:
+            if compressed is None:
+                compressed = compress_frame(data)
+            data = compressed
+        try:
+            if client_conn.send(data, legacy_kind if legacy else kind):
+                delivered += 1
+        except Exception as e:
+            SEND_FAILURES.inc()
+            log.error("广播转发失败", username=username, error=e)
+    elapsed = time.perf_counter() - start
+    fanout_stats.record(delivered, elapsed)
+    BROADCAST_SECONDS.observe(elapsed)
+    BROADCAST_RECIPIENTS.observe(delivered)
+    if elapsed * 1000 > SLOW_FANOUT_MS:
+        log.warning("广播扇出过慢", elapsed_ms=round(elapsed * 1000, 1), recipients=delivered)
+    return delivered, elapsed
+
+def get_fanout_stats():
+    """获取广播扇出耗时统计摘要"""
+    return fanout_stats.summary()
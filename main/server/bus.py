@@ -0,0 +1,336 @@
+"""worker 进程间总线：worker 侧客户端（多进程模式）
+
+多进程模式下每个 worker 通过 Unix 域套接字连接主进程中的总线中枢（server/workers.py），
+消息沿用客户端协议的帧格式（encode_frame / FrameDecoder），类型号从 BUS_BASE 开始。
+
+    用户名 -> worker 目录由中枢维护：登录前向中枢申请用户名（全局唯一），
+    其他 worker 的在线用户以 RemoteConnection 登记在本地在线用户表中，
+    因此查找私聊目标仍是一次 O(1) 字典查找，发给它的消息经中枢转交所在 worker。
+
+    群聊消息交给中枢分配消息ID并写入历史，再由中枢发给全部 worker（含发送方所在 worker），
+    各 worker 只向本进程的房间成员扇出，同一房间在所有 worker 上的顺序一致。
+
+    离线私聊也交给中枢保存、取出（集群模式下由中枢转交接收者的归属节点），
+    接口与本地的 SqliteStore 相同（store_offline / take_offline / ack_offline）。
+
+    需要应答的请求（申请用户名、续传接管、读取历史、离线私聊）返回 Future，中枢超过 BUS_REQUEST_TIMEOUT 秒
+    未应答时以 TimeoutError 结束：线程模式在连接线程中等待，异步模式经 asyncio.wrap_future
+    交回事件循环等待，读取历史以回调发送结果，均不阻塞事件循环。
+"""
+import asyncio
+import itertools
+import json
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from config import BUS_REQUEST_TIMEOUT
+from protocol import MSG_GROUP, MSG_PRIVATE, FrameDecoder, encode_frame, split_fields
+from server.outbound import KIND_NORMAL, PRIVATE_KIND
+from server.broadcast import broadcast
+from server.user_manager import add_user, remove_user, get_user_socket, get_all_users
+from server.room_manager import get_room_members
+from server.system_notify import send_online_notify, send_offline_notify, broadcast_room_event
+from server.session_manager import takeover_session
+from server.logger import get_logger
+
+log = get_logger("bus")
+
+# 总线消息类型（不与客户端协议的消息类型重叠）
+BUS_BASE = 100
+BUS_HELLO = 100       # worker -> 中枢：worker 编号
+BUS_REPLY = 101       # 请求的应答：请求号、结果
+BUS_CLAIM = 102       # 申请用户名：请求号、用户名；应答 "1" / "0"
+BUS_RELEASE = 103     # 释放用户名（下线）：用户名
+BUS_USER_JOIN = 104   # 中枢 -> worker：其他 worker（或集群中其他节点）的用户上线：用户名、所在位置
+BUS_USER_LEAVE = 105  # 中枢 -> worker：其他 worker 的用户下线：用户名
+BUS_GROUP = 106       # worker -> 中枢：房间、发送者、内容；中枢 -> worker：房间、消息ID、发送者、时间、内容
+BUS_DELIVER = 107     # 发给指定用户：用户名、消息类型、字段数、字段...
+BUS_ROOM_EVENT = 108  # 加入/离开房间事件：消息类型、房间、用户名
+BUS_HISTORY = 109     # 查询历史：请求号、房间、方式、数值；应答为 JSON 数组
+BUS_TAKEOVER = 110    # 结束其他 worker 上的断线会话（用户重连到了另一个 worker）：请求号、用户名、令牌
+BUS_OFFLINE_STORE = 111  # 保存离线私聊：请求号、接收者、发送者、内容；应答为保存结果（空表示失败）
+BUS_OFFLINE_TAKE = 112   # 取出离线私聊：请求号、接收者；应答为 JSON 数组（空表示失败）
+BUS_OFFLINE_ACK = 113    # 确认已发送的离线私聊：接收者、取出的ID、已发送的ID（JSON 数组）
+
+client = None  # 本 worker 的 BusClient（单进程模式为 None）
+
+def chain_future(future, convert):
+    """返回以 convert(应答) 完成的新 Future：把中枢的文本应答转换为与本地存储相同的结果"""
+    chained = Future()
+
+    def done(source):
+        try:
+            chained.set_result(convert(source.result()))
+        except Exception as e:
+            chained.set_exception(e)
+    future.add_done_callback(done)
+    return chained
+
+class RemoteConnection:
+    """其他 worker（或其他节点）上的在线用户：登记在本地在线用户表中，发给它的消息经中枢转交"""
+    legacy = False
+    remote = True  # 广播时跳过（各 worker 只向本进程的连接扇出）
+    compression = None
+
+    def __init__(self, username, location):
+        self.username = username
+        self.location = location  # worker 编号或节点ID（仅用于排查问题）
+
+    def send_message(self, msg_type, *fields, kind=KIND_NORMAL):
+        client.deliver(self.username, msg_type, fields)
+        return 1
+
+    def send(self, data, kind=KIND_NORMAL):
+        return 0  # 已编码的广播数据不跨进程转发
+
+    def queue_depth(self):
+        return 0
+
+    def abort(self):
+        pass
+
+    def close(self):
+        pass
+
+class BusClient:
+    """worker 到中枢的连接：发送只把帧放入发送队列，由写线程合并写入套接字
+    （中枢繁忙时不阻塞连接线程，也不阻塞事件循环）；接收由后台线程处理"""
+    def __init__(self, path, worker_id):
+        self.worker_id = worker_id
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.outgoing = queue.SimpleQueue()  # 待发送的帧，None 表示写完已有的帧后停止
+        self.request_ids = itertools.count(1)
+        self.pending = {}  # 请求号 -> (Future, 截止时间)，按发出顺序排列
+        self.pending_lock = threading.Lock()
+        self.closed = False
+        self._send(BUS_HELLO, str(worker_id))
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+        threading.Thread(target=self._expire_loop, daemon=True).start()
+
+    def _send(self, msg_type, *fields):
+        self.outgoing.put(encode_frame(msg_type, *fields))
+
+    def _write_loop(self):
+        """写线程：取出队列中已有的全部帧，合并为一次写入"""
+        while True:
+            batch = [self.outgoing.get()]
+            while True:
+                try:
+                    batch.append(self.outgoing.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.sock.sendall(b"".join(frame for frame in batch if frame is not None))
+            except OSError as e:
+                if not self.closed:
+                    log.error("总线连接异常", error=e)
+                return  # 读线程随后发现连接断开并结束 worker
+            if None in batch:
+                return
+
+    def _request(self, msg_type, *fields):
+        """发送请求，返回 Future（结果为中枢的应答，超时以 TimeoutError 结束）"""
+        future = Future()
+        with self.pending_lock:
+            request_id = next(self.request_ids)
+            self.pending[request_id] = (future, time.monotonic() + BUS_REQUEST_TIMEOUT)
+        self._send(msg_type, str(request_id), *fields)
+        return future
+
+    def _resolve(self, request_id, result=None, error=None):
+        """结束请求（应答与超时只有先到的一方生效；异步等待方已取消时忽略）"""
+        with self.pending_lock:
+            entry = self.pending.pop(request_id, None)
+        if entry is None or not entry[0].set_running_or_notify_cancel():
+            return
+        if error is None:
+            entry[0].set_result(result)
+        else:
+            entry[0].set_exception(error)
+
+    def _expire_loop(self):
+        """每秒检查一次超时未应答的请求（请求按截止时间先后排列，只需检查开头）"""
+        while not self.closed:
+            time.sleep(1)
+            now = time.monotonic()
+            with self.pending_lock:
+                expired = []
+                for request_id, (_, deadline) in self.pending.items():
+                    if deadline > now:
+                        break
+                    expired.append(request_id)
+            for request_id in expired:
+                log.warning("中枢应答超时", request=request_id)
+                self._resolve(request_id, error=TimeoutError("中枢应答超时"))
+
+    # ---------- 发往中枢 ----------
+
+    def claim(self, username):
+        """申请用户名（全局唯一），成功返回 True（线程模式，在连接线程中等待应答）"""
+        try:
+            return self._request(BUS_CLAIM, username).result() == "1"
+        except TimeoutError:
+            self.release(username)  # 中枢可能已登记该用户名，释放以免一直占用
+            return False
+
+    async def claim_async(self, username):
+        """同 claim（异步模式，等待应答期间不阻塞事件循环）"""
+        try:
+            return await asyncio.wrap_future(self._request(BUS_CLAIM, username)) == "1"
+        except TimeoutError:
+            self.release(username)
+            return False
+        except asyncio.CancelledError:
+            self.release(username)  # 等待期间连接已关闭（服务器关闭）
+            raise
+
+    def release(self, username):
+        self._send(BUS_RELEASE, username)
+
+    def publish_group(self, room, sender, content):
+        self._send(BUS_GROUP, room, sender, content)
+
+    def publish_room_event(self, msg_type, room, username):
+        self._send(BUS_ROOM_EVENT, str(msg_type), room, username)
+
+    def deliver(self, username, msg_type, fields):
+        self._send(BUS_DELIVER, username, str(msg_type), str(len(fields)), *fields)
+
+    def read_history(self, room, mode, value):
+        """经中枢读取房间历史，返回 Future（结果为 [[消息ID, 时间戳, 发送者, 内容]]）"""
+        return chain_future(self._request(BUS_HISTORY, room, mode, str(value)), json.loads)
+
+    def store_offline(self, target, sender, content):
+        """经中枢保存离线私聊，返回 Future（结果同 SqliteStore.store_offline）"""
+        return chain_future(self._request(BUS_OFFLINE_STORE, target, sender, content), int)
+
+    def take_offline(self, target):
+        """经中枢取出离线私聊，返回 Future（结果为 [[消息ID, 时间戳, 发送者, 内容]]）"""
+        return chain_future(self._request(BUS_OFFLINE_TAKE, target), json.loads)
+
+    def ack_offline(self, target, taken_ids, sent_ids):
+        self._send(BUS_OFFLINE_ACK, target, json.dumps(taken_ids), json.dumps(sent_ids))
+
+    def takeover(self, username, token):
+        """让其他 worker 结束该用户的断线会话（令牌校验通过时），等待其下线完成"""
+        try:
+            return self._request(BUS_TAKEOVER, username, token).result() == "1"
+        except TimeoutError:
+            return False
+
+    async def takeover_async(self, username, token):
+        """同 takeover（异步模式，等待应答期间不阻塞事件循环）"""
+        try:
+            return await asyncio.wrap_future(self._request(BUS_TAKEOVER, username, token)) == "1"
+        except TimeoutError:
+            return False
+
+    def close(self):
+        """写出已排队的帧（如下线时的释放用户名）后关闭连接"""
+        self.closed = True
+        self.outgoing.put(None)
+        self.writer.join(timeout=1)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # ---------- 来自中枢 ----------
+
+    def _read_loop(self):
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                for msg_type, payload in decoder.feed(data):
+                    try:
+                        self._dispatch(msg_type, payload)
+                    except Exception as e:
+                        log.error("处理总线消息失败", type=msg_type, error=e)
+        except OSError as e:
+            if not self.closed:
+                log.error("总线连接异常", error=e)
+        if not self.closed:
+            log.warning("与主进程的总线连接已断开，worker 退出", worker=self.worker_id)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    def _dispatch(self, msg_type, payload):
+        if msg_type == BUS_REPLY:
+            request_id, result = split_fields(payload, 2)
+            self._resolve(int(request_id), result)
+        elif msg_type == BUS_GROUP:
+            room, msg_id, sender, time_str, content = split_fields(payload, 5)
+            deliver_group(room, msg_id, sender, time_str, content)
+        elif msg_type == BUS_DELIVER:
+            username, msg_type, count, rest = split_fields(payload, 4)
+            fields = split_fields(rest, int(count)) if int(count) else []
+            deliver_local(username, int(msg_type), fields)
+        elif msg_type == BUS_USER_JOIN:
+            username, location = split_fields(payload, 2)
+            remote_user_join(username, location)
+        elif msg_type == BUS_USER_LEAVE:
+            remote_user_leave(payload)
+        elif msg_type == BUS_ROOM_EVENT:
+            event_type, room, username = split_fields(payload, 3)
+            remote_room_event(int(event_type), room, username)
+        elif msg_type == BUS_TAKEOVER:
+            request_id, username, token = split_fields(payload, 3)
+            result = "1" if takeover_session(username, token) else "0"
+            self._send(BUS_REPLY, request_id, result)
+
+def connect(path, worker_id):
+    """worker 启动时连接中枢"""
+    global client
+    client = BusClient(path, worker_id)
+    return client
+
+# ---------- 在本 worker 上执行中枢转来的事件 ----------
+
+def deliver_group(room, msg_id, sender, time_str, content):
+    """群聊消息：只扇出给本 worker 上的房间成员"""
+    broadcast(get_room_members(room).items(), MSG_GROUP, room, msg_id, sender, time_str, content,
+              exclude=sender)
+
+def deliver_local(username, msg_type, fields):
+    """发给本 worker 上的指定用户（私聊、系统通知等）；
+    转交途中用户已下线（或已转到其他 worker）时，私聊改存为离线消息，其他消息丢弃"""
+    client_conn = get_user_socket(username)
+    if client_conn is not None and not client_conn.remote:
+        kind = PRIVATE_KIND if msg_type == MSG_PRIVATE else KIND_NORMAL
+        client_conn.send_message(msg_type, *fields, kind=kind)
+    elif msg_type == MSG_PRIVATE:
+        from server.message_handler import store_offline_message
+        sender, content = fields
+        store_offline_message(sender, username, content)
+
+def remote_user_join(username, location):
+    """其他 worker（或其他节点）的用户上线：登记为 RemoteConnection 并通知本 worker 的在线用户"""
+    seq = add_user(username, RemoteConnection(username, location))
+    if seq:
+        send_online_notify(username, get_all_users(), seq)
+    else:
+        log.warning("其他 worker 的用户与本地用户重名", username=username, location=location)
+
+def remote_user_leave(username):
+    client_conn = get_user_socket(username)
+    if not isinstance(client_conn, RemoteConnection):
+        return
+    seq = remove_user(username, client_conn)
+    if seq:
+        send_offline_notify(username, get_all_users(), seq)
+
+def remote_room_event(msg_type, room, username):
+    """其他 worker 上的加入/离开房间事件：通知本 worker 上的房间成员"""
+    members = get_room_members(room)
+    if members:
+        broadcast_room_event(msg_type, room, username, members)
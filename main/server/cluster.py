@@ -0,0 +1,305 @@
+"""集群：多个服务器节点组成一个聊天服务（同一用户名空间），不依赖外部消息中间件
+
+集群链路运行在各节点主进程的总线中枢（server/workers.py 的 BusHub）中，节点之间两两
+建立 TCP 连接（全互联），沿用客户端协议的帧格式，类型号从 NODE_BASE 开始。
+
+    用户名目录：每个节点保存全集群的 用户名 -> 节点 副本（节点只广播自己用户的上线/下线）。
+    申请用户名时按 rendezvous 哈希在当前存活节点中选出该用户名的归属节点，由归属节点判重
+    并预留，因此同一用户名在全集群只会被批准一次。
+    路由：群聊、房间事件发给全部节点，由各节点存入自己的历史并扇出给本节点的房间成员；
+    私聊、通知按目录转交目标用户所在节点。
+    离线私聊：保存、取出都经用户名的归属节点（与申请用户名相同的 rendezvous 哈希），
+    用户之后在任何节点登录都能收到。
+    群聊消息ID：各节点独立分配，只在同一节点内可比较；客户端登录时收到本节点ID
+    （MSG_HISTORY_SCOPE），换到其他节点后不再按之前的消息ID补齐历史。
+    节点断开：其全部用户视为下线，归属节点随存活节点集合变化，已配置的节点自动重连。
+
+网络分区期间两侧可能各自批准同名用户，合并后以先到的登记为准并打印警告。
+"""
+import asyncio
+import itertools
+import zlib
+from config import NODE_ID, CLUSTER_HOST, CLUSTER_PORT
+from protocol import FrameDecoder, encode_frame, split_fields
+from server.bus import BUS_USER_JOIN, BUS_USER_LEAVE, BUS_ROOM_EVENT
+from server.logger import get_logger
+
+log = get_logger("cluster")
+
+# 节点链路消息类型（不与客户端协议、worker 总线的消息类型重叠）
+NODE_BASE = 120
+NODE_HELLO = 120       # 节点ID
+NODE_REPLY = 121       # 请求的应答：请求号、结果
+NODE_CLAIM = 122       # 向归属节点申请用户名：请求号、用户名；应答 "1" / "0"
+NODE_JOIN = 123        # 本节点用户上线：用户名
+NODE_LEAVE = 124       # 本节点用户下线（或放弃预留）：用户名
+NODE_GROUP = 125       # 群聊：房间、发送者、时间、内容
+NODE_DELIVER = 126     # 发给指定用户：与 BUS_DELIVER 的负载相同
+NODE_ROOM_EVENT = 127  # 加入/离开房间事件：与 BUS_ROOM_EVENT 的负载相同
+NODE_TAKEOVER = 128    # 结束该节点上的断线会话：请求号、用户名、令牌
+NODE_OFFLINE_STORE = 129  # 在归属节点保存离线私聊：请求号、接收者、发送者、内容；应答为保存结果
+NODE_OFFLINE_TAKE = 130   # 从归属节点取出离线私聊：请求号、接收者；应答为 JSON 数组
+NODE_OFFLINE_ACK = 131    # 确认已发送的离线私聊：接收者、取出的ID、已发送的ID（JSON 数组）
+
+RECONNECT_SECONDS = 2  # 到已配置节点的连接断开后的重连间隔
+REQUEST_TIMEOUT = 5    # 跨节点请求的应答超时（秒），超时按失败处理
+
+def local_node_id():
+    """本节点ID（未加入集群时为空字符串）"""
+    if not CLUSTER_PORT:
+        return ""
+    return NODE_ID or f"{CLUSTER_HOST}:{CLUSTER_PORT}"
+
+class NodeLink:
+    """到另一个节点的连接"""
+    def __init__(self, writer, initiator):
+        self.writer = writer
+        self.initiator = initiator  # 发起连接一方的节点ID（重复连接时据此保留其中一条）
+        self.node_id = None
+        self.pending = {}  # 请求号 -> Future
+
+    def send(self, msg_type, *fields):
+        self.writer.write(encode_frame(msg_type, *fields))
+
+    def close(self):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_result(None)  # 链路断开，等待中的请求按失败处理
+        self.pending.clear()
+        self.writer.close()
+
+class Cluster:
+    """本节点的集群链路与用户名目录副本"""
+    def __init__(self, hub, node_id, host, port, peers):
+        self.hub = hub
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self.peers = peers          # 主动连接的节点地址 ["host:port"]
+        self.links = {}             # 节点ID -> NodeLink
+        self.remote_users = {}      # 用户名 -> 所在节点ID（其他节点的用户）
+        self.reserved = {}          # 用户名 -> 节点ID（本节点作为归属节点已批准、尚未上线）
+        self.request_ids = itertools.count(1)
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._accept, self.host, self.port)
+        for address in self.peers:
+            asyncio.ensure_future(self._connect_loop(address))
+        log.info("集群节点已启动", node=self.node_id, listen=f"{self.host}:{self.port}",
+                 peers=",".join(self.peers) or "无")
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for link in list(self.links.values()):
+            link.close()
+
+    # ---------- 链路 ----------
+
+    async def _accept(self, reader, writer):
+        try:
+            await self._run_link(reader, writer, initiator=None)
+        except asyncio.CancelledError:
+            pass  # 关闭时取消
+
+    async def _connect_loop(self, address):
+        """保持到一个已配置节点的连接（已通过对方发起的连接相连时不重复连接）"""
+        host, port = address.rsplit(":", 1)
+        node_id = None
+        while True:
+            if node_id not in self.links:
+                try:
+                    reader, writer = await asyncio.open_connection(host, int(port))
+                except OSError:
+                    pass
+                else:
+                    node_id = await self._run_link(reader, writer, initiator=self.node_id)
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def _run_link(self, reader, writer, initiator):
+        """握手后持续处理对方消息，返回对方节点ID"""
+        link = NodeLink(writer, initiator)
+        link.send(NODE_HELLO, self.node_id)
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for msg_type, payload in decoder.feed(data):
+                    if link.node_id is None:
+                        if msg_type != NODE_HELLO or not self._establish(link, payload, initiator):
+                            return payload if msg_type == NODE_HELLO else None
+                    else:
+                        self._dispatch(link, msg_type, payload)
+                await writer.drain()
+        except (ConnectionError, OSError) as e:
+            if not self.hub.closing:
+                log.warning("节点连接异常", node=link.node_id, error=e)
+        finally:
+            self._drop(link)
+        return link.node_id
+
+    def _establish(self, link, node_id, initiator):
+        """收到对方 HELLO：登记链路并同步本节点的在线用户；重复连接只保留一条"""
+        if node_id == self.node_id:
+            log.error("节点ID与本节点相同，拒绝连接", node=node_id)
+            return False
+        if initiator is None:
+            link.initiator = node_id
+        existing = self.links.get(node_id)
+        if existing is not None:
+            # 双方各自发起了连接：两端都保留由节点ID较小一方发起的那条
+            preferred = min(self.node_id, node_id)
+            if existing.initiator == preferred or link.initiator != preferred:
+                return False
+            self.links[node_id] = link
+            link.node_id = node_id
+            existing.close()
+        else:
+            self.links[node_id] = link
+            link.node_id = node_id
+            log.info("节点已连接", node=node_id, nodes=len(self.links) + 1)
+        for username in self.hub.directory:
+            link.send(NODE_JOIN, username)
+        return True
+
+    def _drop(self, link):
+        """链路断开：该节点的全部用户下线，预留作废，等待中的请求按失败处理"""
+        link.close()
+        node_id = link.node_id
+        if node_id is None or self.links.get(node_id) is not link:
+            return
+        del self.links[node_id]
+        gone = [username for username, owner in self.remote_users.items() if owner == node_id]
+        for username in gone:
+            del self.remote_users[username]
+            self.hub.send_all(encode_frame(BUS_USER_LEAVE, username))
+        for username in [u for u, owner in self.reserved.items() if owner == node_id]:
+            del self.reserved[username]
+        if not self.hub.closing:
+            log.warning("节点已断开", node=node_id, users=len(gone))
+
+    def _dispatch(self, link, msg_type, payload):
+        node_id = link.node_id
+        if msg_type == NODE_GROUP:
+            room, sender, time_str, content = split_fields(payload, 4)
+            self.hub.publish_group(room, sender, content, time_str)
+        elif msg_type == NODE_DELIVER:
+            if not self.hub.deliver_local(payload):
+                self.hub.deliver_offline(payload)
+        elif msg_type == NODE_JOIN:
+            self.reserved.pop(payload, None)
+            owner = self.remote_users.get(payload)
+            if owner == node_id:
+                return
+            if owner is not None or payload in self.hub.directory:
+                log.warning("集群中出现重名用户，保留先登记的一方", username=payload, node=node_id)
+                return
+            self.remote_users[payload] = node_id
+            self.hub.send_all(encode_frame(BUS_USER_JOIN, payload, node_id))
+        elif msg_type == NODE_LEAVE:
+            if self.reserved.get(payload) == node_id:
+                del self.reserved[payload]
+            if self.remote_users.get(payload) == node_id:
+                del self.remote_users[payload]
+                self.hub.send_all(encode_frame(BUS_USER_LEAVE, payload))
+        elif msg_type == NODE_ROOM_EVENT:
+            self.hub.send_all(encode_frame(BUS_ROOM_EVENT, payload))
+        elif msg_type == NODE_CLAIM:
+            request_id, username = split_fields(payload, 2)
+            granted = self.hub.is_free(username)
+            if granted:
+                self.reserved[username] = node_id
+            link.send(NODE_REPLY, request_id, "1" if granted else "0")
+        elif msg_type == NODE_TAKEOVER:
+            request_id, username, token = split_fields(payload, 3)
+            asyncio.ensure_future(self._reply_takeover(link, request_id, username, token))
+        elif msg_type == NODE_OFFLINE_STORE:
+            request_id, target, sender, content = split_fields(payload, 4)
+            asyncio.ensure_future(self._reply(link, request_id,
+                                              self.hub.store_offline_local(target, sender, content)))
+        elif msg_type == NODE_OFFLINE_TAKE:
+            request_id, target = split_fields(payload, 2)
+            asyncio.ensure_future(self._reply(link, request_id, self.hub.take_offline_local(target)))
+        elif msg_type == NODE_OFFLINE_ACK:
+            self.hub.ack_offline_local(*split_fields(payload, 3))
+        elif msg_type == NODE_REPLY:
+            request_id, result = split_fields(payload, 2)
+            future = link.pending.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(result)
+
+    async def _reply_takeover(self, link, request_id, username, token):
+        result = await self.hub.takeover_local(username, token)
+        link.send(NODE_REPLY, request_id, result)
+
+    async def _reply(self, link, request_id, coroutine):
+        link.send(NODE_REPLY, request_id, await coroutine)
+
+    async def request(self, node_id, msg_type, *fields, failure="0"):
+        """向指定节点发送请求并等待应答（链路不存在、断开或超时时返回 failure）"""
+        link = self.links.get(node_id)
+        if link is None:
+            return failure
+        request_id = str(next(self.request_ids))
+        future = link.pending[request_id] = asyncio.get_running_loop().create_future()
+        link.send(msg_type, request_id, *fields)
+        try:
+            result = await asyncio.wait_for(future, REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            link.pending.pop(request_id, None)
+            return failure
+        return failure if result is None else result
+
+    # ---------- 供总线中枢调用 ----------
+
+    def home_node(self, username):
+        """用户名的归属节点：存活节点中 rendezvous 哈希最大者"""
+        nodes = [self.node_id, *self.links]
+        return max(nodes, key=lambda node: zlib.crc32(f"{node}\x1f{username}".encode("utf-8")))
+
+    def is_free(self, username):
+        return username not in self.remote_users and username not in self.reserved
+
+    def owner(self, username):
+        """其他节点上在线用户的所在节点ID"""
+        return self.remote_users.get(username)
+
+    async def claim(self, username):
+        """向归属节点申请用户名，批准后在本节点上线前其他申请都会被拒绝"""
+        home = self.home_node(username)
+        if home == self.node_id:
+            return self.hub.is_free(username)  # 本节点判定后同步登记，无需预留
+        return await self.request(home, NODE_CLAIM, username) == "1"
+
+    def announce_join(self, username):
+        self.reserved.pop(username, None)
+        self._send_all(NODE_JOIN, username)
+
+    def announce_leave(self, username):
+        """用户下线，或申请获批后未能上线（归属节点据此释放预留）"""
+        self.reserved.pop(username, None)
+        self._send_all(NODE_LEAVE, username)
+
+    def forward_group(self, room, sender, time_str, content):
+        self._send_all(NODE_GROUP, room, sender, time_str, content)
+
+    def forward_room_event(self, payload):
+        self._send_all(NODE_ROOM_EVENT, payload)
+
+    def forward_deliver(self, node_id, payload):
+        link = self.links.get(node_id)
+        if link is not None:
+            link.send(NODE_DELIVER, payload)
+
+    def forward_offline_ack(self, node_id, target, taken, sent):
+        link = self.links.get(node_id)
+        if link is not None:
+            link.send(NODE_OFFLINE_ACK, target, taken, sent)
+
+    def _send_all(self, msg_type, *fields):
+        data = encode_frame(msg_type, *fields)
+        for link in self.links.values():
+            link.writer.write(data)
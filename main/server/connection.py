@@ -1,104 +1,437 @@
 import socket
+import threading
+import time
 from config import BUFFER_SIZE, CHAT_SEPARATOR, EXIT_MARKER
+from config import MAX_ROOMS_PER_USER, COMPRESSION
+from protocol import (MSG_LOGIN, MSG_ROOM_JOIN, MSG_ROOM_LEAVE, MSG_SYSTEM, MSG_RESUME, MSG_PONG,
+                      MSG_HISTORY_SCOPE, DEFAULT_ROOM, create_decoder, encode_message, compress_frame)
+from messages import (CLIENT_MESSAGES, Dispatcher, decode_message, LoginRequest, GroupSend,
+                      PrivateSend, ExitRequest, PresenceSyncRequest, RoomJoinRequest,
+                      RoomLeaveRequest, HistoryRequest, Ping, Pong)
+from server.outbound import (OutboundQueue, KIND_NORMAL, KIND_URGENT, PUT_OVERFLOW, PUT_RESYNC,
+                             outbound_stats, send_frames, configure_socket, BATCH_WINDOW)
 from server.user_manager import (add_user, remove_user, get_all_users,
-                                 is_username_exist, get_online_list)
-from server.message_handler import broadcast_group_message, send_private_message
+                                 get_online_list)
+from server.room_manager import (join_room, leave_room, leave_all_rooms,
+                                 get_room_members, get_user_rooms)
+from server.message_handler import (broadcast_group_message, send_private_message,
+                                    send_history, deliver_offline_messages)
+from server.session_manager import (create_session, end_session, detach_session,
+                                    resume_session, sessions)
+from server import bus
+from server.cluster import local_node_id
+from server.rate_limit import check_message
+from server.heartbeat import track, untrack
+from server.logger import get_logger
+from server.metrics import (CONNECTIONS_ACCEPTED, LOGINS, BYTES_IN, SEND_FAILURES, SEND_CALLS,
+                            count_message_in, count_sent)
 from server.system_notify import (send_response, broadcast_system_message,
                                   send_online_list_to_client, send_online_notify,
-                                  send_offline_notify)
+                                  send_offline_notify, send_presence_snapshot, resync_presence,
+                                  broadcast_room_event, get_current_time)
+
+log = get_logger("connection")
+
+HISTORY_SCOPE = local_node_id()  # 本节点分配的消息ID所属的范围（未加入集群时为空）
+
+class ClientConnection:
+    """客户端连接（记录协议类型；发送数据先进入有界出站队列，由独立写线程发送，
+    转发/广播方不会被慢客户端阻塞）"""
+    remote = False  # 本进程的连接（多进程模式下其他 worker 的用户为 RemoteConnection）
+
+    def __init__(self, client_socket, client_address):
+        self.client_socket = client_socket
+        self.address = client_address
+        self.legacy = False  # 是否为旧版 ||| 文本协议客户端
+        self.decoder = None
+        self.outbound = OutboundQueue()  # 出站队列：已编码的字节串
+        self.outbound_cond = threading.Condition()
+        self.closed = False
+        self.writer_thread = None
+        self.session = None  # 断线续传会话（旧客户端没有）
+        self.compression = None  # 协商的压缩方式："" 不压缩；None 表示客户端未声明（登录响应不附带该字段）
+        self.throttle_noticed = 0.0  # 上次发送限流通知的时间（time.monotonic）
+        self.last_received = time.monotonic()  # 最后收到数据的时间（心跳检查用）
+        self.heartbeat = False  # 客户端是否支持心跳（支持时空闲超时会被断开）
+
+    def feed(self, data):
+        """解析收到的数据，首次调用时根据首字节确定协议类型"""
+        self.last_received = time.monotonic()
+        if self.decoder is None:
+            self.decoder = create_decoder(data[0])
+            self.legacy = self.decoder.legacy
+        return self.decoder.feed(data)
+
+    def send_message(self, msg_type, *fields, kind=KIND_NORMAL):
+        """按本连接的协议编码（已协商压缩时压缩）并发送一条消息"""
+        data = encode_message(self.legacy, msg_type, *fields)
+        if self.compression:
+            data = compress_frame(data)
+        return self.send(data, kind)
+
+    def send(self, data, kind=KIND_NORMAL):
+        """把已编码的数据放入出站队列（不阻塞调用方），返回入队字节数"""
+        with self.outbound_cond:
+            if self.closed:
+                return 0
+            result = self.outbound.put(data, kind)
+            # 队列由空变为非空时唤醒写线程；批量窗口内只在需要立即发送时再唤醒
+            if result != PUT_OVERFLOW and (len(self.outbound) == 1 or self.outbound.flush_due()):
+                self.outbound_cond.notify()
+        if result == PUT_OVERFLOW:
+            self.disconnect_slow_consumer()
+            return 0
+        if self.writer_thread is None:
+            self.start_writer()
+        if result == PUT_RESYNC:
+            resync_presence(self)  # 出站队列丢弃了在线状态帧，以完整列表代替
+        return len(data)
+
+    def queue_depth(self):
+        """出站队列中待发送的消息数"""
+        return len(self.outbound)
+
+    def start_writer(self):
+        """启动写线程（首次发送时自动启动）"""
+        with self.outbound_cond:
+            if self.writer_thread is not None:
+                return
+            self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def _writer_loop(self):
+        """写线程：等待批量窗口后取出队列中的全部数据，以分散/聚集写整批发送，
+        连接关闭后发完剩余数据再关闭 socket"""
+        try:
+            while True:
+                with self.outbound_cond:
+                    while not self.outbound.items and not self.closed:
+                        self.outbound_cond.wait()
+                    if BATCH_WINDOW:
+                        deadline = time.monotonic() + BATCH_WINDOW
+                        while not self.closed and not self.outbound.flush_due():
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                break
+                            self.outbound_cond.wait(remaining)
+                    batch = self.outbound.drain()
+                    if not batch and self.closed:
+                        break
+                session = self.session
+                if session is not None:
+                    session.record_sent(batch)  # 先编号：发送失败的帧可在重连时重放
+                if batch:
+                    SEND_CALLS.inc(send_frames(self.client_socket, batch))
+                    count_sent(batch, self.legacy)
+        except OSError as e:
+            SEND_FAILURES.inc()
+            log.warning("发送失败", address=self.address, error=e)
+            self.abort()
+        finally:
+            self.client_socket.close()
+
+    def disconnect_slow_consumer(self):
+        """出站队列溢出：断开消费过慢的客户端"""
+        log.warning("客户端接收过慢，出站队列已满，断开连接", address=self.address)
+        outbound_stats.add(slow_disconnects=1)
+        end_session(self)  # 被断开的慢客户端不保留会话
+        self.abort()
+
+    def abort(self):
+        """丢弃未发送数据并中断连接，接收线程随之退出并走正常下线流程"""
+        with self.outbound_cond:
+            self.closed = True
+            self.outbound.clear()
+            # 在写线程关闭 socket 之前中断连接（已关闭的 socket 无法唤醒阻塞在 recv 上的接收线程）
+            try:
+                self.client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.outbound_cond.notify()
+
+    def close(self):
+        """标记关闭：写线程发完剩余数据后关闭 socket"""
+        with self.outbound_cond:
+            self.closed = True
+            self.outbound_cond.notify()
+            has_writer = self.writer_thread is not None
+        if not has_writer:
+            self.client_socket.close()
+
+def receive_messages(client_conn):
+    """持续接收并逐条产出解码后的消息对象（忽略未知的消息类型），连接断开时结束"""
+    buffer = bytearray(BUFFER_SIZE)  # 复用同一块接收缓冲区
+    view = memoryview(buffer)
+    while True:
+        size = client_conn.client_socket.recv_into(buffer)
+        if not size:
+            return
+        BYTES_IN.inc(size)
+        for msg_type, payload in client_conn.feed(view[:size]):
+            message = decode_message(CLIENT_MESSAGES, msg_type, payload)
+            if message is not None:
+                yield message
 
 def handle_single_client(client_socket, client_address):
     """处理单个客户端连接（支持中文用户名）"""
+    client_conn = ClientConnection(client_socket, client_address)
     username = None
+    CONNECTIONS_ACCEPTED.inc()
+    configure_socket(client_socket)
     try:
-        print(f"📞 接收客户端 {client_address} 登录请求")
-        
-        # 1. 接收用户名（支持中文，指定utf-8编码）
-        username = receive_username(client_socket)
+        log.debug("新连接", address=client_address)
+        messages = receive_messages(client_conn)
+
+        # 1~5. 登录（验证用户名、登记在线用户、发送登录响应并广播上线通知）或断线续传
+        username = start_session(messages, client_conn, client_address)
         if not username:
-            send_response(client_socket, success=False, online_list=get_online_list())
-            return
-        
-        # 2. 验证用户名是否重复
-        if is_username_exist(username):
-            send_response(client_socket, success=False, online_list=get_online_list())
-            print(f"❌ 用户名 {username} 已被占用，{client_address} 登录失败")
             return
-        
-        # 3. 添加在线用户（中文用户名正常存储）
-        add_user(username, client_socket)
-        online_list = get_online_list()
-        
-        # 4. 发送登录成功响应
-        send_response(client_socket, success=True, online_list=online_list)
-        
-        # 5. 广播上线通知（中文用户名正常显示）
-        send_online_notify(username, get_all_users())
-        print(f"✅ 用户 {username} 登录成功，当前在线：{','.join(online_list)}")
-        
-        # 6. 持续接收消息（支持中文消息）
-        while True:
-            # 接收消息时强制utf-8编码，忽略错误字符
-            data = client_socket.recv(BUFFER_SIZE).decode("utf-8", errors="replace")
-            if not data or EXIT_MARKER in data:
-                print(f"👋 用户 {username} 主动下线")
+
+        # 6. 持续接收消息（支持中文消息，半帧自动等待后续数据），超出限额的消息丢弃或延后处理
+        for message in messages:
+            delay = check_message(username, client_conn, message)
+            if delay is None:
+                continue
+            if delay:
+                time.sleep(delay)
+            if not dispatch_message(username, client_conn, message):
+                log.info("用户主动下线", username=username)
                 break
-            
-            # 解析多条消息（中文消息正常分割）
-            msgs = [msg.strip() for msg in data.split(CHAT_SEPARATOR) if msg.strip()]
-            for msg in msgs:
-                if msg.startswith("@"):
-                    handle_private_message(username, msg)  # 中文私聊目标用户支持
-                else:
-                    broadcast_group_message(username, msg)  # 中文群聊消息支持
-    
+
     except Exception as e:
-        print(f"❌ 客户端 {client_address} 异常：{e}")
+        log.warning("客户端异常", address=client_address, error=e)
     finally:
         # 清理资源（中文用户名正常移除）
-        if username and is_username_exist(username):
-            remove_user(username)
-            remaining_online = get_online_list()
-            send_offline_notify(username, get_all_users())
-            print(f"👋 用户 {username} 下线，当前在线：{','.join(remaining_online) if remaining_online else '无'}")
-        client_socket.close()
-        print(f"🔌 连接 {client_address} 已关闭")
-
-def receive_username(client_socket):
-    """接收用户名（支持中文，优化合法性验证）"""
+        logout_user(username, client_conn)
+        client_conn.close()
+        log.debug("连接已关闭", address=client_address)
+
+def start_session(messages, client_conn, client_address):
+    """处理首条消息：登录或断线续传，成功返回用户名。续传失败时客户端可在同一连接上重新登录"""
+    for message in messages:
+        if message.msg_type == MSG_RESUME:
+            username = handle_resume(client_conn, message)
+            if username:
+                return username
+            continue
+        username = receive_username(message)
+        negotiate_compression(client_conn, message)
+        return username if login_user(username, client_conn, client_address) else None
+    return None
+
+def receive_username(message):
+    """从登录消息中取出用户名（支持中文，优化合法性验证）"""
+    if message.msg_type != MSG_LOGIN:
+        log.warning("首条消息不是登录请求", type=message.msg_type)
+        return None
     try:
-        # 强制utf-8解码，确保中文正确接收
-        username = client_socket.recv(BUFFER_SIZE).decode("utf-8", errors="replace").strip()
-        
-        # 验证用户名合法性：
-        # 1. 非空
-        # 2. 长度 1-20（中文算1个字符，符合直觉）
-        # 3. 不包含非法字符（避免分割符冲突）
-        illegal_chars = [CHAT_SEPARATOR, EXIT_MARKER, "@", "[", "]", "|||", "__EXIT__"]
-        if not username:
-            print("❌ 用户名不能为空")
-            return None
-        if len(username) > 20:
-            print(f"❌ 用户名 {username} 过长（最大20个字符）")
-            return None
-        for char in illegal_chars:
-            if char in username:
-                print(f"❌ 用户名包含非法字符：{char}")
-                return None
-        
-        return username
+        return validate_username(message.username.strip())
     except Exception as e:
-        print(f"❌ 接收用户名失败：{e}")
+        log.warning("接收用户名失败", error=e)
+        return None
+
+def negotiate_compression(client_conn, message):
+    """登录消息附带客户端支持的压缩方式（逗号分隔），选用双方都支持的一种"""
+    if not isinstance(message, LoginRequest):
+        return
+    offered = message.compression
+    if offered and not client_conn.legacy:
+        client_conn.compression = COMPRESSION if COMPRESSION in offered.split(",") else ""
+
+def handle_resume(client_conn, message):
+    """断线续传（线程模式）：本 worker 恢复失败时在连接线程中等待中枢接管其他 worker 上的会话"""
+    username = resume_user(client_conn, message)
+    if username:
+        return username
+    username, token = message.username, message.token
+    reject_resume(client_conn, username, needs_takeover(username) and bus.client.takeover(username, token))
+    return None
+
+def resume_user(client_conn, message):
+    """令牌有效且缺失的消息仍在重放缓冲区中时恢复会话（不广播上线/下线），返回用户名"""
+    username, token, received_seq = message.username, message.token, message.received_seq
+    if received_seq.isdigit() and resume_session(username, token, int(received_seq), client_conn):
+        LOGINS.labels("resume").inc()
+        log.info("断线重连，已恢复会话", username=username)
+        return username
+    return None
+
+def needs_takeover(username):
+    """多进程模式下本 worker 没有该用户的会话：会话可能在另一个 worker 上，需经中枢结束"""
+    return bus.client is not None and username not in sessions
+
+def reject_resume(client_conn, username, taken_over):
+    """续传失败：通知客户端重新登录"""
+    if taken_over:
+        # 多进程模式：会话在另一个 worker 上，已让其下线，客户端随后在本 worker 重新登录
+        log.info("会话在其他 worker 上，已结束原会话", username=username)
+    client_conn.send_message(MSG_RESUME, "0")
+    log.info("会话恢复失败，需要重新登录", username=username)
+
+def validate_username(username):
+    """验证用户名合法性（线程模式与异步模式共用）"""
+    # 验证用户名合法性：
+    # 1. 非空
+    # 2. 长度 1-20（中文算1个字符，符合直觉）
+    # 3. 不包含非法字符（避免分割符冲突）
+    illegal_chars = [CHAT_SEPARATOR, EXIT_MARKER, "@", "[", "]", "|||", "__EXIT__", ","]
+    if not username:
+        log.info("用户名不能为空")
         return None
+    if len(username) > 20:
+        log.info("用户名过长（最大20个字符）", username=username)
+        return None
+    for char in illegal_chars:
+        if char in username:
+            log.info("用户名包含非法字符", char=char)
+            return None
+    if not username.isprintable():
+        log.info("用户名包含控制字符")
+        return None
+
+    return username
+
+def login_user(username, client_conn, client_address, claimed=None):
+    """登记在线用户并发送登录响应（claimed 为异步模式事先向中枢申请用户名的结果，None 表示在此申请）"""
+    if not username:
+        LOGINS.labels("failure").inc()
+        send_response(client_conn, success=False, online_list=get_online_list())
+        return False
+
+    # 多进程模式：先向中枢申请用户名（全部 worker 范围内唯一）
+    if bus.client is not None and claimed is None:
+        claimed = bus.client.claim(username)
+    if claimed is False:
+        seq = 0
+    else:
+        # 添加在线用户（检查重复与登记为原子操作，中文用户名正常存储）
+        seq = add_user(username, client_conn)
+        if not seq and bus.client is not None:
+            bus.client.release(username)
+    if not seq:
+        send_response(client_conn, success=False, online_list=get_online_list())
+        LOGINS.labels("failure").inc()
+        log.info("用户名已被占用，登录失败", username=username, address=client_address)
+        return False
+    snapshot = get_all_users()
+    token = create_session(username, client_conn, lambda placeholder: finish_logout(username, placeholder))
+
+    # 消息ID只在本节点内可比较：先告知客户端所在节点，换节点后客户端不再按旧的消息ID补齐历史
+    if not client_conn.legacy:
+        client_conn.send_message(MSG_HISTORY_SCOPE, HISTORY_SCOPE)
+    # 发送登录成功响应（携带完整在线列表及其版本号，此后只推送增量；附带断线续传令牌）
+    send_response(client_conn, success=True, online_list=list(snapshot), seq=snapshot.version,
+                  token=token)
+
+    # 广播上线通知（中文用户名正常显示）
+    send_online_notify(username, snapshot, seq)
+    LOGINS.labels("success").inc()
+    log.info("用户登录成功", username=username, address=client_address, online=len(snapshot))
+
+    # 一次性补发离线期间收到的私聊消息
+    deliver_offline_messages(username, client_conn)
+    return True
 
-def handle_private_message(sender, msg):
+def dispatch_message(username, client_conn, message):
+    """按分发表处理一条客户端消息，返回 False 表示客户端已下线"""
+    count_message_in(message.msg_type)
+    return dispatcher.dispatch(message, username, client_conn) is not False
+
+def handle_exit(username, client_conn, message):
+    end_session(client_conn)  # 主动下线不保留会话
+    return False
+
+def handle_ping(username, client_conn, message):
+    client_conn.send_message(MSG_PONG, kind=KIND_URGENT)
+    track(client_conn)
+
+def handle_pong(username, client_conn, message):
+    track(client_conn)
+
+def handle_presence_sync(username, client_conn, message):
+    send_presence_snapshot(client_conn)
+
+def handle_group_message(username, client_conn, message):
+    content = message.content.strip()
+    if content:
+        broadcast_group_message(username, content, message.room or DEFAULT_ROOM)  # 中文群聊消息支持
+
+def handle_history_request(username, client_conn, message):
+    send_history(client_conn, username, message.room, message.mode, message.value)
+
+def handle_join_room(username, client_conn, message):
+    """加入房间：通知房间全部成员（含本人，作为确认）"""
+    room = message.room.strip()
+    if room == DEFAULT_ROOM:
+        return
+    if not validate_room_name(room):
+        reply_system(client_conn, f"房间名 {room} 不合法")
+        return
+    if len(get_user_rooms(username)) >= MAX_ROOMS_PER_USER:
+        reply_system(client_conn, f"最多同时加入 {MAX_ROOMS_PER_USER} 个房间")
+        return
+    if join_room(room, username, client_conn):
+        broadcast_room_event(MSG_ROOM_JOIN, room, username, get_room_members(room))
+        if bus.client is not None:
+            bus.client.publish_room_event(MSG_ROOM_JOIN, room, username)
+        log.info("用户加入房间", username=username, room=room)
+
+def handle_leave_room(username, client_conn, message):
+    """离开房间：通知本人及房间剩余成员"""
+    room = message.room.strip()
+    if room == DEFAULT_ROOM or not leave_room(room, username):
+        return
+    client_conn.send_message(MSG_ROOM_LEAVE, room, username)
+    broadcast_room_event(MSG_ROOM_LEAVE, room, username, get_room_members(room))
+    if bus.client is not None:
+        bus.client.publish_room_event(MSG_ROOM_LEAVE, room, username)
+    log.info("用户离开房间", username=username, room=room)
+
+def validate_room_name(room):
+    """房间名规则与用户名一致"""
+    return bool(room) and room != DEFAULT_ROOM and validate_username(room) is not None
+
+def reply_system(client_conn, msg):
+    """回复本人一条系统通知"""
+    client_conn.send_message(MSG_SYSTEM, f"【系统通知】{get_current_time()}\n{msg}")
+
+def logout_user(username, client_conn):
+    """连接断开：有会话时保留等待重连（不广播下线），否则立即下线"""
+    untrack(client_conn)
+    if username and detach_session(username, client_conn):
+        log.info("连接断开，等待重连", username=username)
+        return
+    finish_logout(username, client_conn)
+
+def finish_logout(username, client_conn):
+    """移除在线用户并广播下线通知（仅移除本连接登记的用户）"""
+    seq = remove_user(username, client_conn) if username else 0
+    if seq:
+        if bus.client is not None:
+            bus.client.release(username)
+        leave_all_rooms(username)  # 下线由在线状态通知告知，房间内不再单独广播
+        snapshot = get_all_users()
+        send_offline_notify(username, snapshot, seq)
+        log.info("用户下线", username=username, online=len(snapshot))
+
+def handle_private_message(username, client_conn, message):
     """处理私聊消息（支持中文目标用户）"""
     try:
-        if " " not in msg[1:]:
-            return  # 无消息内容，忽略
-        # 分割中文目标用户和消息内容
-        target_user, content = msg[1:].split(" ", 1)
+        target_user, content = message.target.strip(), message.content.strip()
         if target_user and content:
-            send_private_message(sender, target_user, content)
+            send_private_message(username, target_user, content)
     except Exception as e:
-        print(f"❌ 处理私聊消息失败：{e}")
\ No newline at end of file
+        log.warning("处理私聊消息失败", username=username, error=e)
+
+# 客户端消息分发表（登录、续传只作为首条消息处理，之后收到的忽略）
+dispatcher = Dispatcher({
+    ExitRequest: handle_exit,
+    Ping: handle_ping,
+    Pong: handle_pong,
+    PresenceSyncRequest: handle_presence_sync,
+    PrivateSend: handle_private_message,
+    GroupSend: handle_group_message,
+    RoomJoinRequest: handle_join_room,
+    RoomLeaveRequest: handle_leave_room,
+    HistoryRequest: handle_history_request,
+})
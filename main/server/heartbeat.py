@@ -0,0 +1,70 @@
+"""心跳模块：清理失联的客户端（合盖休眠、NAT 超时等，TCP 连接往往很久都不会报错）
+
+客户端登录后发送 MSG_PING 表明支持心跳，此后该连接登记在时间轮中：
+    空闲（未收到任何数据）HEARTBEAT_INTERVAL 秒时发送 MSG_PING，
+    空闲超过 HEARTBEAT_TIMEOUT 秒时中断连接，接收循环随之结束，走与连接断开相同的下线流程
+    （有会话时保留 RESUME_GRACE_SECONDS 秒等待重连）。
+收到数据只更新连接的 last_received，不改动时间轮；定时器到期时再按最新的空闲时间改期，
+因此每次检查只处理到期的连接，与在线连接总数无关。
+未声明支持心跳的客户端（旧版客户端）不检查。
+"""
+import asyncio
+import threading
+import time
+from config import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+from protocol import MSG_PING
+from server.outbound import KIND_URGENT
+from server.timer_wheel import TimerWheel
+from server.metrics import HEARTBEAT_REAPED
+from server.logger import get_logger
+
+log = get_logger("heartbeat")
+
+TICK_SECONDS = 1.0  # 时间轮精度（秒）
+WHEEL_SLOTS = 128   # 时间轮槽数（一圈 128 秒，覆盖常用的心跳超时）
+
+wheel = TimerWheel(TICK_SECONDS, WHEEL_SLOTS, time.monotonic())
+
+def track(client_conn):
+    """客户端表明支持心跳（首次收到 MSG_PING / MSG_PONG）：开始检查该连接"""
+    if HEARTBEAT_INTERVAL and not client_conn.heartbeat:
+        client_conn.heartbeat = True
+        wheel.schedule(client_conn, client_conn.last_received + HEARTBEAT_INTERVAL)
+
+def untrack(client_conn):
+    wheel.cancel(client_conn)
+
+def check_expired(now):
+    """处理到期的连接：发送心跳、断开超时的连接，其余按最后收到数据的时间改期"""
+    for client_conn in wheel.advance(now):
+        if client_conn.closed:
+            continue
+        idle = now - client_conn.last_received
+        if idle >= HEARTBEAT_TIMEOUT:
+            HEARTBEAT_REAPED.inc()
+            log.info("心跳超时，断开连接", address=client_conn.address, idle=round(idle, 1))
+            client_conn.abort()
+        elif idle >= HEARTBEAT_INTERVAL:
+            client_conn.send_message(MSG_PING, kind=KIND_URGENT)
+            wheel.schedule(client_conn, min(client_conn.last_received + HEARTBEAT_TIMEOUT,
+                                            now + HEARTBEAT_INTERVAL))
+        else:
+            wheel.schedule(client_conn, client_conn.last_received + HEARTBEAT_INTERVAL)
+
+def start_heartbeat():
+    """线程模式：后台线程每个 tick 推进一次时间轮"""
+    if not HEARTBEAT_INTERVAL:
+        return
+    def run():
+        while True:
+            time.sleep(TICK_SECONDS)
+            check_expired(time.monotonic())
+    threading.Thread(target=run, name="heartbeat", daemon=True).start()
+
+async def heartbeat_loop():
+    """asyncio 模式：在事件循环中推进时间轮（中断连接须在事件循环线程中进行）"""
+    if not HEARTBEAT_INTERVAL:
+        return
+    while True:
+        await asyncio.sleep(TICK_SECONDS)
+        check_expired(time.monotonic())
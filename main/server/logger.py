@@ -0,0 +1,112 @@
+"""日志模块：结构化、按级别过滤、非阻塞
+
+调用方只构造日志记录并放入队列（级别不够时直接返回，不做任何格式化），
+由后台线程统一格式化并写出，连接线程之间不再争用 stdout。
+
+输出格式（log_format）：
+    text：时间 级别 模块 消息 key=value ...
+    json：每行一个 JSON 对象
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from config import LOG_LEVEL, LOG_FORMAT
+
+class StructuredFormatter(logging.Formatter):
+    """把消息和结构化字段格式化为一行文本或 JSON"""
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        if _context:
+            fields = {**_context, **fields}
+        if LOG_FORMAT == "json":
+            entry = {"time": self.formatTime(record), "level": record.levelname,
+                     "logger": record.name, "msg": record.getMessage(), **fields}
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name} {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    """只入队不格式化（标准 QueueHandler 会在调用方线程里格式化消息）"""
+    def prepare(self, record):
+        return record
+
+class StructuredLogger:
+    """带结构化字段的日志接口：log.info("用户登录成功", username=name, online=3)"""
+    __slots__ = ("_logger",)
+
+    def __init__(self, logger):
+        self._logger = logger
+
+    def _log(self, level, msg, fields, exc_info=None):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, msg, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, exc_info=None, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info)
+
+    def is_enabled(self, level):
+        return self._logger.isEnabledFor(level)
+
+_root = logging.getLogger("chat")
+_listener = None
+_context = {}  # 附加到每条日志的字段（如多进程模式下的 worker 编号）
+
+def _setup():
+    """首次获取日志器时启动后台写线程"""
+    global _listener
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter())
+    _root.setLevel(getattr(logging, str(LOG_LEVEL).upper(), logging.INFO))
+    _root.addHandler(_EnqueueHandler(records))
+    _root.propagate = False
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def _restart_in_child():
+    """fork 出的子进程中没有父进程的后台写线程：丢弃继承的队列，重新启动"""
+    global _listener
+    if _listener is None:
+        return
+    for handler in list(_root.handlers):
+        _root.removeHandler(handler)
+    _listener = None
+    _setup()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
+
+def set_log_context(**fields):
+    """设置附加到本进程每条日志的字段"""
+    _context.update(fields)
+
+def get_logger(name):
+    """获取模块日志器（名称如 chat.connection）"""
+    if _listener is None:
+        _setup()
+    return StructuredLogger(_root.getChild(name))
+
+def shutdown_logging():
+    """写出队列中剩余的日志并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
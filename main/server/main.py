@@ -1,6 +1,12 @@
+import argparse
 import socket
 import threading
-from config import SERVER_BIND_ADDR, SERVER_PORT  # 适配你的配置项
+from config import SERVER_BIND_ADDR, SERVER_PORT, SERVER_MODE, LISTEN_BACKLOG  # 适配你的配置项
+from config import METRICS_HOST, METRICS_PORT, WORKERS, CLUSTER_PORT
+from util import raise_fd_limit
+from server.logger import get_logger, shutdown_logging
+
+log = get_logger("main")
 
 def get_local_ip():
     """自动获取本机局域网IP（优先返回非127.0.0.1的IP）"""
@@ -14,29 +20,82 @@ def get_local_ip():
     except:
         return "127.0.0.1"  # 异常时返回本地回环IP
 
-def main():
-    """服务器主函数（适配JSON配置+自动显示IP）"""
-    local_ip = get_local_ip()
-    
+def parse_args():
+    """解析启动参数（未指定时使用 config.json 中的配置）"""
+    parser = argparse.ArgumentParser(description="SimpleChatApp 聊天服务器")
+    parser.add_argument("--mode", choices=["thread", "async"], default=SERVER_MODE,
+                        help="thread：每连接一线程；async：asyncio 事件循环（适合上万连接）")
+    parser.add_argument("--backlog", type=int, default=LISTEN_BACKLOG,
+                        help="监听队列长度")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="worker 进程数（共享监听端口，需要 SO_REUSEPORT），0 表示单进程")
+    return parser.parse_args()
+
+def create_server_socket(backlog, reuse_port=False):
+    """创建并绑定监听 socket（reuse_port：多进程模式下各 worker 监听同一端口）"""
     # 创建TCP socket
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     # 端口复用（避免重启时端口占用）
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        # 内核把新连接分摊到监听同一端口的各个 worker
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     # 绑定地址（使用 config.py 中的 SERVER_BIND_ADDR = ("0.0.0.0", 9000)）
     server_socket.bind(SERVER_BIND_ADDR)
-    server_socket.listen(5)  # 最大连接数5
-    
+    server_socket.listen(backlog)  # 监听队列长度（可配置）
+    return server_socket
+
+def start_metrics(port):
+    """启动监控指标服务（Prometheus 格式），返回访问地址；未启用或启动失败返回 None"""
+    if not port:
+        return None
+    from server.metrics import start_metrics_server
+    try:
+        start_metrics_server(METRICS_HOST, port)
+        return f"http://{METRICS_HOST}:{port}/metrics"
+    except OSError as e:
+        log.warning("监控指标服务启动失败", port=port, error=e)
+        return None
+
+def main():
+    """服务器主函数（适配JSON配置+自动显示IP）"""
+    args = parse_args()
+    local_ip = get_local_ip()
+    fd_limit = raise_fd_limit()
+
+    if CLUSTER_PORT and args.workers <= 0:
+        args.workers = 1  # 集群链路由多进程模式的主进程负责
+    if args.workers > 0:
+        from server.workers import run_master
+        log.info("服务器以多进程模式启动，按 Ctrl+C 关闭", bind=SERVER_BIND_ADDR,
+                 lan=f"{local_ip}:{SERVER_PORT}", local=f"127.0.0.1:{SERVER_PORT}",
+                 mode=args.mode, workers=args.workers, backlog=args.backlog,
+                 fd_limit=fd_limit or "系统默认")
+        run_master(args)
+        return
+
+    server_socket = create_server_socket(args.backlog)
+    # 监控指标（Prometheus 格式）
+    metrics_addr = start_metrics(METRICS_PORT)
+
     # 启动成功提示（显示关键信息）
-    print("=" * 60)
-    print(f"📡 服务器已启动成功！")
-    print(f"🔌 绑定地址：{SERVER_BIND_ADDR}（监听所有网卡）")
-    print(f"🌐 本机局域网IP：{local_ip}:{SERVER_PORT}（局域网客户端连接）")
-    print(f"💻 本地测试IP：127.0.0.1:{SERVER_PORT}（本机客户端连接）")
-    print(f"⚠️  按 Ctrl+C 关闭服务器")
-    print("=" * 60)
-    print("等待客户端连接...")
+    log.info("服务器已启动，按 Ctrl+C 关闭", bind=SERVER_BIND_ADDR,
+             lan=f"{local_ip}:{SERVER_PORT}", local=f"127.0.0.1:{SERVER_PORT}",
+             mode=args.mode, backlog=args.backlog, fd_limit=fd_limit or "系统默认",
+             metrics=metrics_addr or "未启用")
+    serve(server_socket, args.mode, args.backlog)
 
+def serve(server_socket, mode, backlog):
+    """在监听 socket 上运行服务器直到 Ctrl+C，退出时打印统计并关闭存储"""
+    from server.connection import handle_single_client  # 延迟导入，避免循环依赖
     try:
+        if mode == "async":
+            from server.async_server import run_async_server
+            run_async_server(server_socket, backlog)
+            return
+
+        from server.heartbeat import start_heartbeat
+        start_heartbeat()
         while True:
             # 接受客户端连接
             client_socket, client_address = server_socket.accept()
@@ -47,15 +106,23 @@ def main():
                 daemon=True  # 主线程退出时子线程自动退出
             )
             client_thread.start()
-            print(f"\n✅ 新连接：{client_address}")
-            print(f"📊 当前在线：{threading.active_count() - 1} 人")
     except KeyboardInterrupt:
-        print("\n\n⚠️  正在关闭服务器...")
+        log.info("正在关闭服务器...")
     finally:
         server_socket.close()
-        print("✅ 服务器已完全关闭")
+        from server.broadcast import get_fanout_stats
+        from server.outbound import outbound_stats
+        stats = get_fanout_stats()
+        log.info("广播统计", count=stats["count"], avg_recipients=round(stats["avg_recipients"], 1),
+                 avg_ms=round(stats["avg_ms"], 2), p99_ms=round(stats["p99_ms"], 2),
+                 max_ms=round(stats["max_ms"], 2))
+        log.info("出站队列统计", **outbound_stats.summary())
+        from server.message_store import message_store
+        from server.sqlite_store import sqlite_store
+        message_store.close()  # 刷出尚未落盘的消息日志
+        sqlite_store.close()
+        log.info("服务器已完全关闭")
+        shutdown_logging()
 
 if __name__ == "__main__":
-    # 延迟导入，避免循环依赖
-    from server.connection import handle_single_client
-    main()
\ No newline at end of file
+    main()
@@ -1,7 +1,19 @@
-from config import CHAT_SEPARATOR
-from server.user_manager import get_user_socket, get_online_list
+import asyncio
+from config import HISTORY_ENABLED
+from protocol import (MSG_GROUP, MSG_PRIVATE, MSG_SYSTEM, MSG_HISTORY, DEFAULT_ROOM,
+                      HISTORY_LAST, HISTORY_SINCE)
+from server.user_manager import get_user_socket
+from server.room_manager import get_room_members
+from server.broadcast import broadcast
+from server.outbound import PRIVATE_KIND
+from server.message_store import message_store, format_history_time
+from server.sqlite_store import sqlite_store, OFFLINE_TARGET_FULL, OFFLINE_SENDER_FULL
+from server import bus
+from server.logger import get_logger
 from datetime import datetime
 
+log = get_logger("message_handler")
+
 def get_current_time():
     return datetime.now().strftime("%H:%M:%S")
 
@@ -9,27 +21,118 @@ def send_private_message(sender, target_user, msg):
     """发送私聊消息（修复：仅拼接用户名，不包含时间戳）"""
     target_socket = get_user_socket(target_user)
     if not target_socket:
-        print(f"❌ 私聊失败：{target_user} 不在线")
+        store_offline_message(sender, target_user, msg)
         return False
 
     try:
-        private_msg = f"[私聊][{sender}] {msg}{CHAT_SEPARATOR}".encode("utf-8")
-        target_socket.send(private_msg)
+        target_socket.send_message(MSG_PRIVATE, sender, msg, kind=PRIVATE_KIND)
         return True
     except Exception as e:
-        print(f"❌ 私聊转发失败（{target_user}）：{e}")
+        log.warning("私聊转发失败", target=target_user, error=e)
         return False
 
-def broadcast_group_message(sender, msg):
-    """广播群聊消息（保持不变，群聊仍由服务器添加时间戳）"""
-    online_list = get_online_list()
+def store_offline_message(sender, target_user, msg):
+    """对方不在线：保存为离线私聊消息（写线程批量落库，不阻塞转发），结果通知发送者"""
+    def on_stored(future):
+        if future.exception() is not None:
+            notify_user(sender, f"私聊消息保存失败，{target_user} 未收到")
+        elif future.result() == OFFLINE_TARGET_FULL:
+            notify_user(sender, f"{target_user} 的离线消息已满，消息未保存")
+            log.info("私聊失败：对方不在线且离线消息已满", sender=sender, target=target_user)
+        elif future.result() == OFFLINE_SENDER_FULL:
+            notify_user(sender, f"你保存的离线消息已达上限，发给 {target_user} 的消息未保存")
+            log.info("私聊失败：发送者保存的离线消息已达上限", sender=sender, target=target_user)
+        else:
+            notify_user(sender, f"{target_user} 不在线，消息将在其上线后送达")
+            log.debug("私聊已保存为离线消息", sender=sender, target=target_user)
+            # 保存期间对方可能恰好上线并已取过离线消息，此时立即补发
+            target_socket = get_user_socket(target_user)
+            if target_socket:
+                deliver_offline_messages(target_user, target_socket)
+    offline_store().store_offline(target_user, sender, msg).add_done_callback(on_stored)
+
+def deliver_offline_messages(username, client_conn):
+    """登录后一次性发送全部离线私聊消息，只删除确认已放入发送队列的消息"""
+    def on_taken(future):
+        if future.exception() is not None:
+            return
+        messages = future.result()
+        if not messages:
+            return
+        client_conn.send_message(MSG_SYSTEM, f"【系统通知】{get_current_time()}\n"
+                                             f"你有 {len(messages)} 条离线私聊消息")
+        sent = []
+        for msg_id, timestamp, sender, content in messages:
+            if not client_conn.send_message(MSG_PRIVATE, sender,
+                                            f"（离线消息 {format_history_time(timestamp)}）{content}",
+                                            kind=PRIVATE_KIND):
+                break  # 连接已关闭：其余消息保留，下次登录时补发
+            sent.append(msg_id)
+        offline_store().ack_offline(username, [row[0] for row in messages], sent)
+        log.info("已发送离线私聊消息", username=username, count=len(sent), kept=len(messages) - len(sent))
+    offline_store().take_offline(username).add_done_callback(on_taken)
+
+def offline_store():
+    """离线私聊的存储：多进程模式下经中枢（集群模式下为接收者的归属节点），否则为本进程的数据库"""
+    return bus.client if bus.client is not None else sqlite_store
+
+def notify_user(username, msg):
+    """向在线用户发送一条系统通知"""
+    client_conn = get_user_socket(username)
+    if client_conn:
+        client_conn.send_message(MSG_SYSTEM, f"【系统通知】{get_current_time()}\n{msg}")
+
+def broadcast_group_message(sender, msg, room=DEFAULT_ROOM):
+    """广播群聊消息（只发给房间成员；群聊仍由服务器添加时间戳；收件人快照一次、编码一次）"""
+    members = get_room_members(room)
+    if sender not in members:
+        log.info("群聊失败：发送者不在房间中", sender=sender, room=room)
+        return 0
+    if bus.client is not None:
+        # 多进程模式：由中枢分配消息ID、写入历史并发给全部 worker（含本 worker）
+        bus.client.publish_group(room, sender, msg)
+        return 0
     time_str = get_current_time()
-    group_msg = f"[{sender}] {time_str}\n{msg}{CHAT_SEPARATOR}".encode("utf-8")
-    for username in online_list:
-        if username != sender:
-            client_socket = get_user_socket(username)
-            if client_socket:
-                try:
-                    client_socket.send(group_msg)
-                except Exception as e:
-                    print(f"❌ 群聊转发失败（{username}）：{e}")
\ No newline at end of file
+    # 先追加到消息日志（只写缓冲，刷盘由后台线程批量完成），得到消息ID
+    msg_id = message_store.append(room, sender, msg) if HISTORY_ENABLED else 0
+    delivered, _ = broadcast(members.items(), MSG_GROUP, room, str(msg_id), sender, time_str, msg,
+                             exclude=sender)
+    return delivered
+
+def send_history(client_conn, username, room, mode, value):
+    """按请求发送房间历史消息（仅房间成员可查询）"""
+    if username not in get_room_members(room):
+        return
+    try:
+        value = int(value)
+    except ValueError:
+        return
+    if mode not in (HISTORY_SINCE, HISTORY_LAST):
+        return
+    if bus.client is not None:
+        future = bus.client.read_history(room, mode, value)  # 多进程模式：历史由中枢统一存储
+    elif message_store is sqlite_store:
+        fetch = sqlite_store.fetch_since if mode == HISTORY_SINCE else sqlite_store.fetch_last
+        future = fetch(room, value)  # 读取排在写线程队列中，不等待
+    else:
+        read = message_store.read_since if mode == HISTORY_SINCE else message_store.read_last
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            send_history_records(client_conn, room, read(room, value))  # 线程模式：在本连接线程中读取
+            return
+        future = loop.run_in_executor(None, read, room, value)  # 异步模式：在线程池中读取文件，不阻塞事件循环
+
+    def on_read(future):
+        """读取完成后（在总线接收线程、写线程或事件循环中）发送，不阻塞当前连接"""
+        if future.exception() is not None:
+            log.warning("读取历史消息失败", room=room, error=future.exception())
+            return
+        send_history_records(client_conn, room, future.result())
+    future.add_done_callback(on_read)
+
+def send_history_records(client_conn, room, records):
+    """逐条发送历史消息 [(消息ID, 时间戳, 发送者, 内容)]"""
+    for msg_id, timestamp, sender, content in records:
+        client_conn.send_message(MSG_HISTORY, room, str(msg_id), sender,
+                                 format_history_time(timestamp), content)
@@ -0,0 +1,268 @@
+"""消息存储模块：按房间、按天分段的只追加消息日志 + 定长偏移索引
+
+目录结构：<history_dir>/<房间名(URL编码)>/<YYYYMMDD>.log / .idx
+    .log  记录：消息ID(8B) | 时间戳(8B) | 负载长度(4B) | 负载(发送者 FIELD_SEPARATOR 内容)
+    .idx  记录：消息ID(8B) | 在 .log 中的偏移(8B)，按消息ID递增，可直接二分查找
+
+写入只追加到缓冲文件，由后台线程按配置批量 flush + fsync，转发路径上没有 fsync；
+读取通过 mmap 二分索引、os.pread 按范围读取日志，不会把整个文件读入内存。
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+from config import HISTORY_BACKEND, HISTORY_DIR, HISTORY_FSYNC_INTERVAL, HISTORY_MAX_FETCH
+from protocol import FIELD_SEPARATOR, split_fields
+from server.logger import get_logger
+
+log = get_logger("message_store")
+
+RECORD_HEADER = struct.Struct("!QdI")
+INDEX_ENTRY = struct.Struct("!QQ")
+
+class Segment:
+    """一天的日志分段"""
+    def __init__(self, directory, day):
+        self.day = day
+        self.log_path = os.path.join(directory, f"{day}.log")
+        self.idx_path = os.path.join(directory, f"{day}.idx")
+        self.log_file = None
+        self.idx_file = None
+        self.first_id = 0
+        self.last_id = 0
+        self.count = 0
+        self._load_bounds()
+
+    def _load_bounds(self):
+        """从索引文件读取首尾消息ID（只读开头和结尾各一条）"""
+        if not os.path.exists(self.idx_path):
+            return
+        size = os.path.getsize(self.idx_path)
+        self.count = size // INDEX_ENTRY.size
+        if not self.count:
+            return
+        with open(self.idx_path, "rb") as f:
+            self.first_id = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0]
+            f.seek((self.count - 1) * INDEX_ENTRY.size)
+            self.last_id = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0]
+
+    def open_for_append(self):
+        if self.log_file is None:
+            self.log_file = open(self.log_path, "ab")
+            self.idx_file = open(self.idx_path, "ab")
+
+    def append(self, msg_id, timestamp, payload):
+        """追加一条记录（先写日志再写索引，索引永远不会指向不存在的数据）"""
+        self.open_for_append()
+        offset = self.log_file.tell()
+        self.log_file.write(RECORD_HEADER.pack(msg_id, timestamp, len(payload)))
+        self.log_file.write(payload)
+        self.idx_file.write(INDEX_ENTRY.pack(msg_id, offset))
+        if not self.count:
+            self.first_id = msg_id
+        self.last_id = msg_id
+        self.count += 1
+
+    def flush(self, sync=False):
+        if self.log_file is None:
+            return
+        self.log_file.flush()
+        self.idx_file.flush()
+        if sync:
+            os.fsync(self.log_file.fileno())
+            os.fsync(self.idx_file.fileno())
+
+    def close(self):
+        if self.log_file is not None:
+            self.flush(sync=True)
+            self.log_file.close()
+            self.idx_file.close()
+            self.log_file = self.idx_file = None
+
+    def read(self, start, stop):
+        """读取第 start~stop-1 条记录：[(消息ID, 时间戳, 发送者, 内容)]"""
+        if start >= stop:
+            return []
+        with open(self.idx_path, "rb") as idx:
+            idx.seek(start * INDEX_ENTRY.size)
+            entries = idx.read((stop - start) * INDEX_ENTRY.size)
+        first_offset = INDEX_ENTRY.unpack_from(entries, 0)[1]
+        last_offset = INDEX_ENTRY.unpack_from(entries, len(entries) - INDEX_ENTRY.size)[1]
+
+        fd = os.open(self.log_path, os.O_RDONLY)
+        try:
+            # 先读最后一条记录的头部得到其长度，再一次性读取整段范围
+            _, _, last_length = RECORD_HEADER.unpack(os.pread(fd, RECORD_HEADER.size, last_offset))
+            end = last_offset + RECORD_HEADER.size + last_length
+            data = os.pread(fd, end - first_offset, first_offset)
+        finally:
+            os.close(fd)
+
+        records = []
+        pos = 0
+        while pos < len(data):
+            msg_id, timestamp, length = RECORD_HEADER.unpack_from(data, pos)
+            pos += RECORD_HEADER.size
+            sender, content = split_fields(data[pos:pos + length].decode("utf-8", "replace"), 2)
+            pos += length
+            records.append((msg_id, timestamp, sender, content))
+        return records
+
+    def position_after(self, msg_id, count):
+        """在前 count 条记录中二分查找第一条消息ID大于 msg_id 的序号（通过 mmap 访问索引）"""
+        if not count or msg_id < self.first_id:
+            return 0
+        with open(self.idx_path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            low, high = 0, count
+            while low < high:
+                mid = (low + high) // 2
+                if INDEX_ENTRY.unpack_from(view, mid * INDEX_ENTRY.size)[0] <= msg_id:
+                    low = mid + 1
+                else:
+                    high = mid
+            return low
+
+class RoomLog:
+    """单个房间的分段日志（线程安全）"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.dirty = False
+        os.makedirs(directory, exist_ok=True)
+        days = sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".idx"))
+        self.segments = [Segment(directory, day) for day in days]
+        self.segments = [segment for segment in self.segments if segment.count]
+        self.last_id = self.segments[-1].last_id if self.segments else 0
+
+    def append(self, timestamp, sender, content):
+        """追加一条消息，返回分配的消息ID（房间内递增）"""
+        payload = f"{sender}{FIELD_SEPARATOR}{content}".encode("utf-8")
+        day = datetime.fromtimestamp(timestamp).strftime("%Y%m%d")
+        with self.lock:
+            if not self.segments or self.segments[-1].day != day:
+                if self.segments:
+                    self.segments[-1].close()  # 跨天：封存旧分段
+                self.segments.append(Segment(self.directory, day))
+            self.last_id += 1
+            self.segments[-1].append(self.last_id, timestamp, payload)
+            self.dirty = True
+            return self.last_id
+
+    def flush(self, sync=False):
+        with self.lock:
+            if not self.dirty:
+                return
+            self.segments[-1].flush(sync)
+            self.dirty = False
+
+    def _readable_segments(self):
+        """刷出缓冲数据，返回 [(分段, 当前可读记录数)]（记录数在锁内确定，读取时不受并发追加影响）"""
+        with self.lock:
+            if self.dirty and self.segments:
+                self.segments[-1].flush()
+            return [(segment, segment.count) for segment in self.segments]
+
+    def read_last(self, count):
+        """读取最近 count 条消息（按时间正序）"""
+        records = []
+        for segment, segment_count in reversed(self._readable_segments()):
+            if count <= 0:
+                break
+            take = min(count, segment_count)
+            records[:0] = segment.read(segment_count - take, segment_count)
+            count -= take
+        return records
+
+    def read_since(self, msg_id, limit):
+        """读取消息ID大于 msg_id 的消息，最多 limit 条"""
+        records = []
+        for segment, segment_count in self._readable_segments():
+            if len(records) >= limit:
+                break
+            start = segment.position_after(msg_id, segment_count)
+            stop = min(segment_count, start + limit - len(records))
+            records.extend(segment.read(start, stop))
+        return records
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+
+class MessageStore:
+    """全部房间的消息日志，后台线程按间隔批量 flush + fsync"""
+    def __init__(self, root, fsync_interval=HISTORY_FSYNC_INTERVAL):
+        self.root = root
+        self.fsync_interval = fsync_interval
+        self.rooms = {}
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    def _room_log(self, room, create=True):
+        room_log = self.rooms.get(room)
+        if room_log is None:
+            directory = os.path.join(self.root, quote(room, safe=""))
+            if not create and not os.path.isdir(directory):
+                return None  # 读取不存在的房间不创建目录
+            with self.lock:
+                room_log = self.rooms.get(room)
+                if room_log is None:
+                    room_log = self.rooms[room] = RoomLog(directory)
+                    self._start_flusher()
+        return room_log
+
+    def _start_flusher(self):
+        if self.flusher is None and self.fsync_interval > 0:
+            self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            self.flush(sync=True)
+
+    def append(self, room, sender, content, timestamp=None):
+        """记录一条群聊消息，返回消息ID"""
+        room_log = self._room_log(room)
+        msg_id = room_log.append(timestamp or time.time(), sender, content)
+        if self.fsync_interval <= 0:
+            room_log.flush(sync=True)  # 未开启批量刷盘时每条消息立即落盘
+        return msg_id
+
+    def read_last(self, room, count):
+        """读取房间最近 count 条消息：[(消息ID, 时间戳, 发送者, 内容)]"""
+        room_log = self._room_log(room, create=False)
+        return room_log.read_last(min(count, HISTORY_MAX_FETCH)) if room_log else []
+
+    def read_since(self, room, msg_id, limit=HISTORY_MAX_FETCH):
+        """读取房间中消息ID大于 msg_id 的消息"""
+        room_log = self._room_log(room, create=False)
+        return room_log.read_since(msg_id, min(limit, HISTORY_MAX_FETCH)) if room_log else []
+
+    def flush(self, sync=False):
+        for room_log in list(self.rooms.values()):
+            try:
+                room_log.flush(sync)
+            except OSError as e:
+                log.error("消息日志刷盘失败", error=e)
+
+    def close(self):
+        for room_log in list(self.rooms.values()):
+            room_log.close()
+
+def create_message_store():
+    """按配置选择群聊历史存储（sqlite 与离线私聊共用数据库，log 为分段日志文件）"""
+    if HISTORY_BACKEND == "sqlite":
+        from server.sqlite_store import sqlite_store
+        return sqlite_store
+    return MessageStore(HISTORY_DIR)
+
+message_store = create_message_store()
+
+def format_history_time(timestamp):
+    """历史消息时间格式：yyyy-mm-dd hh:mm:ss"""
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,212 @@
+"""监控指标模块：计数器、直方图、采集时计算的瞬时值，以 Prometheus 文本格式对外暴露
+
+热路径上只做一次加锁自增；在线人数、队列深度等瞬时值在被采集（访问 /metrics）时才计算。
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from protocol import (MSG_LOGIN, MSG_GROUP, MSG_PRIVATE, MSG_SYSTEM, MSG_EXIT, MSG_PRESENCE,
+                      MSG_PRESENCE_SYNC, MSG_ROOM_JOIN, MSG_ROOM_LEAVE, MSG_HISTORY_REQUEST,
+                      MSG_HISTORY, MSG_RESUME, MSG_COMPRESSED, MSG_PING, MSG_PONG)
+
+REGISTRY = []  # 全部指标，按注册顺序输出
+
+MESSAGE_TYPE_NAMES = {
+    MSG_LOGIN: "login", MSG_GROUP: "group", MSG_PRIVATE: "private", MSG_SYSTEM: "system",
+    MSG_EXIT: "exit", MSG_PRESENCE: "presence", MSG_PRESENCE_SYNC: "presence_sync",
+    MSG_ROOM_JOIN: "room_join", MSG_ROOM_LEAVE: "room_leave",
+    MSG_HISTORY_REQUEST: "history_request", MSG_HISTORY: "history", MSG_RESUME: "resume",
+    MSG_COMPRESSED: "compressed", MSG_PING: "ping", MSG_PONG: "pong",
+}
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+class _CounterValue:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+class Counter:
+    """单调递增计数器（可带标签）"""
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.children = {}
+        self.lock = threading.Lock()
+        self._default = None if labelnames else self.labels()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, _CounterValue())
+        return child
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, child in sorted(self.children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {child.value}")
+        return lines
+
+class Histogram:
+    """累积分桶直方图"""
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value):
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def collect(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+class CallbackMetric:
+    """采集时调用 func() 计算的值（gauge 或外部维护的 counter）"""
+    def __init__(self, name, help_text, func, metric_type="gauge"):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.type = metric_type
+        REGISTRY.append(self)
+
+    def collect(self):
+        try:
+            value = self.func()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}",
+                f"{self.name} {value}"]
+
+def render():
+    """全部指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+# ---------- 服务器指标 ----------
+
+CONNECTIONS_ACCEPTED = Counter("chat_connections_accepted_total", "已接受的 TCP 连接数")
+LOGINS = Counter("chat_logins_total", "登录次数（success / failure / resume）", ("result",))
+MESSAGES_IN = Counter("chat_messages_in_total", "收到的客户端消息数", ("type",))
+MESSAGES_OUT = Counter("chat_messages_out_total", "发出的消息帧数（旧客户端为 legacy）", ("type",))
+BYTES_IN = Counter("chat_bytes_in_total", "收到的字节数")
+BYTES_OUT = Counter("chat_bytes_out_total", "发出的字节数")
+SEND_CALLS = Counter("chat_send_calls_total", "发送数据的系统调用次数（一次 sendmsg 可发出多帧）")
+RATE_LIMITED = Counter("chat_rate_limited_total", "超出限额的消息数（按限额类别、处理方式）",
+                       ("scope", "action"))
+HEARTBEAT_REAPED = Counter("chat_heartbeat_reaped_total", "心跳超时被断开的连接数")
+SEND_FAILURES = Counter("chat_send_failures_total", "发送失败次数")
+BROADCAST_SECONDS = Histogram("chat_broadcast_seconds", "单次广播扇出耗时（秒）",
+                              (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+BROADCAST_RECIPIENTS = Histogram("chat_broadcast_recipients", "单次广播的接收人数",
+                                 (1, 10, 100, 1000, 10000, 100000))
+
+_MESSAGES_IN_BY_TYPE = {msg_type: MESSAGES_IN.labels(name)
+                        for msg_type, name in MESSAGE_TYPE_NAMES.items()}
+_MESSAGES_OUT_BY_TYPE = {msg_type: MESSAGES_OUT.labels(name)
+                         for msg_type, name in MESSAGE_TYPE_NAMES.items()}
+_MESSAGES_OUT_LEGACY = MESSAGES_OUT.labels("legacy")
+
+def count_message_in(msg_type):
+    child = _MESSAGES_IN_BY_TYPE.get(msg_type)
+    if child is not None:
+        child.inc()
+
+def count_sent(batch, legacy):
+    """写线程发出一批数据后调用：按消息类型计数并累计字节数"""
+    size = 0
+    for data in batch:
+        size += len(data)
+        if legacy:
+            _MESSAGES_OUT_LEGACY.inc()
+        else:
+            child = _MESSAGES_OUT_BY_TYPE.get(data[2])
+            if child is not None:
+                child.inc()
+    BYTES_OUT.inc(size)
+
+def register_server_gauges():
+    """注册采集时计算的瞬时指标（在线人数、房间数、出站队列深度、会话数等）"""
+    from server.user_manager import get_all_users
+    from server.room_manager import rooms
+    from server.session_manager import sessions
+    from server.outbound import outbound_stats
+
+    def queue_depths():
+        return [conn.queue_depth() for conn in get_all_users().values()]
+
+    CallbackMetric("chat_online_users", "在线用户数", lambda: len(get_all_users()))
+    CallbackMetric("chat_rooms", "房间数（不含大厅）", lambda: len(rooms))
+    CallbackMetric("chat_sessions", "可续传的会话数", lambda: len(sessions))
+    CallbackMetric("chat_outbound_queue_depth_max", "单个连接出站队列的最大深度",
+                   lambda: max(queue_depths(), default=0))
+    CallbackMetric("chat_outbound_queue_depth_total", "全部连接出站队列的消息总数",
+                   lambda: sum(queue_depths()))
+    CallbackMetric("chat_outbound_dropped_total", "出站队列满时丢弃的消息数",
+                   lambda: outbound_stats.summary()["dropped"], "counter")
+    CallbackMetric("chat_outbound_coalesced_total", "出站队列满时合并的在线状态消息数",
+                   lambda: outbound_stats.summary()["coalesced"], "counter")
+    CallbackMetric("chat_slow_disconnects_total", "因接收过慢被断开的连接数",
+                   lambda: outbound_stats.summary()["slow_disconnects"], "counter")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 采集请求不写日志
+
+def start_metrics_server(host, port):
+    """在后台线程中启动 /metrics HTTP 服务，返回服务器对象"""
+    register_server_gauges()
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
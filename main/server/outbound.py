@@ -0,0 +1,220 @@
+"""出站队列模块：每个连接一个有界发送队列，队列满时按策略处理慢客户端
+
+队列中的帧是已编码的不可变字节串（广播时同协议的全部收件人共享同一份），
+写线程取出一批后用 send_frames 以 sendmsg 分散/聚集写一次提交，不再拼接或逐帧发送。
+
+批量窗口：队列由空变为非空时才唤醒写线程，写线程再等待至多 batch_window_ms，
+期间入队的消息合并为一批发送；待发送字节数达到 batch_max_bytes 或有私聊等
+KIND_URGENT 消息入队时立即发送。
+"""
+import socket
+import threading
+from collections import deque
+from config import OUTBOUND_MAX_MESSAGES, OUTBOUND_MAX_BYTES, OUTBOUND_POLICY
+from config import BATCH_WINDOW_MS, BATCH_MAX_BYTES, BATCH_PRIVATE, TCP_NODELAY, TCP_CORK
+
+# 消息类别（决定队列满时能否丢弃）
+KIND_NORMAL = 0
+KIND_PRESENCE = 1  # 在线状态增量：每条都是唯一的上线/下线，不可丢弃（不得不丢弃时改为补发完整列表）
+KIND_URGENT = 2    # 对延迟敏感的消息：立即发送，不等待批量窗口
+KIND_SNAPSHOT = 3  # 完整在线列表：包含此前的全部增量，可覆盖尚未发送的旧列表与增量，不可丢弃
+PRIVATE_KIND = KIND_NORMAL if BATCH_PRIVATE else KIND_URGENT  # 私聊消息使用的类别
+
+BATCH_WINDOW = BATCH_WINDOW_MS / 1000  # 批量窗口（秒）
+
+# 队列满时的处理策略
+POLICY_DROP_OLDEST = "drop_oldest"  # 丢弃最旧的消息
+POLICY_COALESCE = "coalesce"        # 新的完整在线列表覆盖尚未发送的旧列表与增量，其余同 drop_oldest
+POLICY_DISCONNECT = "disconnect"    # 断开慢客户端
+
+# 单次 sendmsg 提交的最大缓冲区数（Linux 的 IOV_MAX 为 1024，超出时分多次提交）
+SENDMSG_MAX_BUFFERS = 1024
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")  # Windows 没有 sendmsg
+USE_CORK = TCP_CORK and hasattr(socket, "TCP_CORK")
+
+# put 的返回值
+PUT_OK = 0
+PUT_DROPPED = 1     # 已入队，但丢弃了旧消息
+PUT_OVERFLOW = 2    # 未入队，连接应被断开
+PUT_RESYNC = 3      # 丢弃了在线状态增量（已排队的，或本条增量未入队），连接应补发完整在线列表
+
+class OutboundStats:
+    """全局出站统计（线程安全）"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dropped = 0              # 因队列满被丢弃的消息数
+        self.coalesced = 0            # 被完整在线列表覆盖而丢弃的在线状态帧数
+        self.slow_disconnects = 0     # 因消费过慢被断开的连接数
+
+    def add(self, dropped=0, coalesced=0, slow_disconnects=0):
+        with self.lock:
+            self.dropped += dropped
+            self.coalesced += coalesced
+            self.slow_disconnects += slow_disconnects
+
+    def summary(self):
+        with self.lock:
+            return {"dropped": self.dropped, "coalesced": self.coalesced,
+                    "slow_disconnects": self.slow_disconnects}
+
+outbound_stats = OutboundStats()
+
+class OutboundQueue:
+    """有界出站队列（本身不加锁，由所属连接负责同步）
+
+    队列元素为 [数据, 类别]，被丢弃的元素把数据置为 None，取出时跳过；
+    droppable 与 presence 按入队顺序分别引用可丢弃的消息和在线状态帧，丢弃时不必扫描整个队列。
+    队列满时只丢弃普通消息（最旧的优先）；只剩在线状态帧时丢弃全部增量，
+    由连接补发一份完整在线列表代替，客户端的在线列表不会因丢帧而出错。"""
+    def __init__(self, max_messages=OUTBOUND_MAX_MESSAGES, max_bytes=OUTBOUND_MAX_BYTES,
+                 policy=OUTBOUND_POLICY):
+        self.items = deque()
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.depth = 0          # 队列中有效消息数
+        self.bytes = 0          # 队列中有效字节数
+        self.high_watermark = 0
+        self.dropped = 0        # 本连接被丢弃的消息数
+        self.droppable = deque()  # 可丢弃的元素（KIND_NORMAL / KIND_URGENT）
+        self.presence = []        # 在线状态帧（KIND_PRESENCE / KIND_SNAPSHOT）
+        self.urgent = False     # 队列中有 KIND_URGENT 消息
+
+    def __len__(self):
+        return self.depth
+
+    def flush_due(self):
+        """是否应立即发送（不再等待批量窗口）"""
+        return self.urgent or self.bytes >= BATCH_MAX_BYTES
+
+    def put(self, data, kind=KIND_NORMAL):
+        """入队，返回 PUT_OK / PUT_DROPPED / PUT_OVERFLOW / PUT_RESYNC"""
+        result = PUT_OK
+        size = len(data)
+        if self._is_full(size):
+            if self.policy == POLICY_DISCONNECT:
+                return PUT_OVERFLOW
+            result = PUT_DROPPED
+            if kind == KIND_SNAPSHOT and self.policy == POLICY_COALESCE:
+                self._discard_presence()  # 新的完整列表覆盖尚未发送的旧列表与增量
+            # 丢弃最旧的普通消息（至少保留本条）
+            while self.droppable and self._is_full(size):
+                self._discard(self.droppable.popleft())
+                self.dropped += 1
+                outbound_stats.add(dropped=1)
+            if self._is_full(size) and self.presence:
+                # 只剩在线状态帧：丢弃全部增量，由完整在线列表代替
+                self._discard_presence()
+                if kind != KIND_SNAPSHOT:
+                    result = PUT_RESYNC
+                    if kind == KIND_PRESENCE:
+                        return result  # 本条增量同样包含在补发的完整列表中
+            self._pop_tombstones()
+
+        entry = [data, kind]
+        self.items.append(entry)
+        self.depth += 1
+        self.bytes += size
+        if self.depth > self.high_watermark:
+            self.high_watermark = self.depth
+        if kind == KIND_PRESENCE or kind == KIND_SNAPSHOT:
+            self.presence.append(entry)
+        else:
+            self.droppable.append(entry)
+            if kind == KIND_URGENT:
+                self.urgent = True
+        return result
+
+    def drain(self):
+        """取出全部有效数据（保持顺序）"""
+        batch = [data for data, _ in self.items if data is not None]
+        self.items.clear()
+        self.depth = 0
+        self.bytes = 0
+        self.droppable.clear()
+        self.presence.clear()
+        self.urgent = False
+        return batch
+
+    def clear(self):
+        self.drain()
+
+    def _is_full(self, size):
+        return self.depth >= self.max_messages or self.bytes + size > self.max_bytes
+
+    def _discard(self, entry):
+        """作废一个队列元素（留下墓碑，取出时跳过）"""
+        if entry[0] is None:
+            return
+        self.depth -= 1
+        self.bytes -= len(entry[0])
+        entry[0] = None
+
+    def _discard_presence(self):
+        """作废全部尚未发送的在线状态帧（随后补发或入队的完整列表包含它们）"""
+        if not self.presence:
+            return
+        for entry in self.presence:
+            self._discard(entry)
+        outbound_stats.add(coalesced=len(self.presence))
+        self.presence.clear()
+
+    def _pop_tombstones(self):
+        """清理队首的墓碑元素"""
+        while self.items and self.items[0][0] is None:
+            self.items.popleft()
+
+def configure_socket(sock):
+    """设置客户端连接的 TCP 选项（TCP_NODELAY）"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if TCP_NODELAY else 0)
+    except OSError:
+        pass
+
+def send_frames(sock, frames):
+    """把一批帧完整写入阻塞 socket，返回发送系统调用次数
+
+    支持 sendmsg 时按原顺序把各帧作为独立缓冲区一次提交（不复制数据），
+    部分写入时只用 memoryview 切掉已发送的部分继续提交剩余缓冲区。
+    一次提交不完时用 TCP_CORK 暂存不满一个报文的尾部，全部提交后再发出。"""
+    if not HAS_SENDMSG:
+        sock.sendall(frames[0] if len(frames) == 1 else b"".join(frames))
+        return 1
+    sent = sock.sendmsg(frames[:SENDMSG_MAX_BUFFERS])
+    if sent == sum(map(len, frames)):
+        return 1
+    corked = USE_CORK and _set_cork(sock, 1)
+    try:
+        return 1 + _send_rest(sock, frames, sent)
+    finally:
+        if corked:
+            _set_cork(sock, 0)
+
+def _set_cork(sock, value):
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, value)
+        return True
+    except OSError:
+        return False
+
+def _send_rest(sock, frames, sent):
+    """第一次 sendmsg 已发出 sent 字节后，继续发送剩余部分，返回追加的系统调用次数"""
+    calls = 0
+    index = 0
+    head = None  # 当前缓冲区的未发送部分
+    while True:
+        # 跳过已发出的部分
+        while index < len(frames):
+            data = frames[index] if head is None else head
+            if sent < len(data):
+                head = memoryview(data)[sent:]
+                break
+            sent -= len(data)
+            index += 1
+            head = None
+        if index >= len(frames):
+            return calls
+        buffers = frames[index:index + SENDMSG_MAX_BUFFERS]
+        buffers[0] = head
+        sent = sock.sendmsg(buffers)
+        calls += 1
@@ -0,0 +1,180 @@
+"""限流模块：按用户、IP、房间的令牌桶限制客户端消息速率（防刷屏、防客户端 bug 占满转发能力）
+
+每个键（用户名 / IP / 房间名）一个令牌桶，只保存令牌数和上次更新时间：令牌按速率随时间
+补充、不超过突发上限，每条客户端消息消耗一个令牌（群聊消息同时消耗所在房间的令牌）。
+超出限额时按 rate_limit_action 处理：
+    drop：丢弃该消息；
+    defer：预支令牌，该连接等待令牌补足后再处理这条消息（等待期间不读取其后续数据），
+           需要等待超过 rate_limit_max_delay 秒时仍然丢弃。
+两种方式都会通知发送者（每个连接每 NOTICE_INTERVAL 秒最多一次）。
+
+限额可热更新：每隔 config_reload_seconds 秒检查 config.json 的修改时间，变化时重新读取；
+文件无法解析或限流配置取值非法时保留原有限额并记录警告，下次检查时重试。
+已补满的令牌桶与新建的等价，检查时顺带删除，空闲的键不会一直占用内存。
+多进程模式下各 worker 分别计数。
+"""
+import json
+import os
+import threading
+import time
+from config import CONFIG, CONFIG_FILE, DEFAULT_CONFIG
+from protocol import MSG_GROUP, MSG_EXIT, MSG_SYSTEM, MSG_PING, MSG_PONG, DEFAULT_ROOM
+from server.system_notify import get_current_time
+from server.logger import get_logger
+from server.metrics import RATE_LIMITED
+
+log = get_logger("rate_limit")
+
+ACTION_DROP = "drop"
+ACTION_DEFER = "defer"
+NOTICE_INTERVAL = 5  # 同一连接两次限流通知的最小间隔（秒）
+NUMERIC_KEYS = ("rate_limit_user", "rate_limit_user_burst", "rate_limit_ip", "rate_limit_ip_burst",
+                "rate_limit_room", "rate_limit_room_burst", "rate_limit_max_delay",
+                "config_reload_seconds")
+
+class TokenBucket:
+    """一个键的令牌桶"""
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+
+class Limiter:
+    """一类键（用户 / IP / 房间）的令牌桶集合（由模块锁保护）"""
+    def __init__(self, scope):
+        self.scope = scope
+        self.rate = 0    # 每秒补充的令牌数，0 表示不限
+        self.burst = 0   # 桶容量（允许的突发条数）
+        self.buckets = {}
+
+    def configure(self, rate, burst):
+        self.rate = max(rate, 0)
+        self.burst = max(burst, 1)
+        for bucket in self.buckets.values():
+            bucket.tokens = min(bucket.tokens, self.burst)
+
+    def bucket(self, key, now):
+        """取出键的令牌桶，按经过的时间补充令牌"""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+
+    def prune(self, now):
+        """删除已补满的令牌桶"""
+        if self.rate <= 0:
+            self.buckets.clear()
+            return
+        full = [key for key, bucket in self.buckets.items()
+                if bucket.tokens + (now - bucket.updated) * self.rate >= self.burst]
+        for key in full:
+            del self.buckets[key]
+
+users = Limiter("user")
+ips = Limiter("ip")
+rooms = Limiter("room")
+_lock = threading.Lock()
+_settings = {}
+_config_mtime = None
+_failed_mtime = None  # 最近一次读取失败的配置文件修改时间（同一版本只警告一次）
+_next_check = 0.0
+
+def configure(config):
+    """按配置设置限额（启动时及 config.json 变化时调用）"""
+    users.configure(config["rate_limit_user"], config["rate_limit_user_burst"])
+    ips.configure(config["rate_limit_ip"], config["rate_limit_ip_burst"])
+    rooms.configure(config["rate_limit_room"], config["rate_limit_room_burst"])
+    _settings["action"] = config["rate_limit_action"]
+    _settings["max_delay"] = config["rate_limit_max_delay"]
+    _settings["reload_seconds"] = config["config_reload_seconds"]
+
+def _config_file_mtime():
+    try:
+        return os.stat(CONFIG_FILE).st_mtime
+    except OSError:
+        return None
+
+def _read_config():
+    """读取 config.json 并校验限流配置，文件无法解析或取值非法时抛出 ValueError（或 OSError）"""
+    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError("配置文件不是 JSON 对象")
+    config = {**DEFAULT_CONFIG, **config}
+    for key in NUMERIC_KEYS:
+        value = config[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f"{key} 应为非负数：{value!r}")
+    if config["rate_limit_action"] not in (ACTION_DROP, ACTION_DEFER):
+        raise ValueError(f"rate_limit_action 应为 drop 或 defer：{config['rate_limit_action']!r}")
+    return config
+
+def _maintain(now):
+    """定期检查 config.json 是否修改（修改则重新加载限额），并清理已补满的令牌桶"""
+    global _config_mtime, _failed_mtime, _next_check
+    reload_seconds = _settings["reload_seconds"]
+    _next_check = now + reload_seconds if reload_seconds > 0 else float("inf")
+    mtime = _config_file_mtime()
+    if mtime is not None and mtime != _config_mtime:
+        try:
+            config = _read_config()
+        except (OSError, ValueError) as e:
+            # 保留原有限额；不记录修改时间，下次检查时重试（文件可能正在写入）
+            if mtime != _failed_mtime:
+                _failed_mtime = mtime
+                log.warning("限流配置重新加载失败，继续使用原有配置", error=e)
+        else:
+            _config_mtime = mtime
+            configure(config)
+            log.info("限流配置已重新加载", user=users.rate, ip=ips.rate, room=rooms.rate,
+                     action=_settings["action"])
+    for limiter in (users, ips, rooms):
+        limiter.prune(now)
+
+def check_message(username, client_conn, message):
+    """检查一条客户端消息是否超出限额
+
+    返回 0 表示立即处理，返回正数表示（defer）等待该秒数后再处理，返回 None 表示丢弃。"""
+    msg_type = message.msg_type
+    if msg_type in (MSG_EXIT, MSG_PING, MSG_PONG):
+        return 0
+    now = time.monotonic()
+    keys = [(users, username), (ips, client_conn.address[0] if client_conn.address else "")]
+    if msg_type == MSG_GROUP:
+        keys.append((rooms, message.room or DEFAULT_ROOM))
+    with _lock:
+        if now >= _next_check:
+            _maintain(now)
+        buckets = [(limiter, limiter.bucket(key, now)) for limiter, key in keys if limiter.rate > 0]
+        if not buckets:
+            return 0
+        # 令牌补足到 1 还需的时间，取最紧的一类限额
+        wait, scope = max(((1 - bucket.tokens) / limiter.rate, limiter.scope)
+                          for limiter, bucket in buckets)
+        if wait <= 0:
+            for _, bucket in buckets:
+                bucket.tokens -= 1
+            return 0
+        action = _settings["action"]
+        if action == ACTION_DEFER and wait <= _settings["max_delay"]:
+            for _, bucket in buckets:
+                bucket.tokens -= 1  # 预支，等待期间到达的消息排在后面
+            result = wait
+        else:
+            action = ACTION_DROP
+            result = None
+    RATE_LIMITED.labels(scope, action).inc()
+    if now - client_conn.throttle_noticed >= NOTICE_INTERVAL:
+        client_conn.throttle_noticed = now
+        log.info("消息超出限额", username=username, scope=scope, action=action)
+        notice = "部分消息已被丢弃" if action == ACTION_DROP else "消息将延迟发送"
+        client_conn.send_message(MSG_SYSTEM, f"【系统通知】{get_current_time()}\n发送过快，{notice}")
+    return result
+
+configure(CONFIG)
+_config_mtime = _config_file_mtime()
+_next_check = time.monotonic() + _settings["reload_seconds"]
@@ -0,0 +1,77 @@
+"""房间管理模块：维护每个房间的成员索引（线程安全）
+
+每个房间的成员表复用在线用户表的分片写时复制结构，广播时无锁遍历房间快照，
+扇出范围是房间人数而不是全部在线用户。默认房间（大厅）即全部在线用户，
+直接使用在线用户表，不额外维护索引。
+"""
+import threading
+from config import ROOM_SHARDS
+from protocol import DEFAULT_ROOM
+from server.user_manager import UserRegistry, RegistrySnapshot, get_all_users
+
+rooms = {}       # 房间名 -> UserRegistry
+user_rooms = {}  # 用户名 -> 已加入的房间名集合（不含大厅）
+lock = threading.Lock()
+
+_EMPTY_ROOM = RegistrySnapshot(0, ({},))
+
+def join_room(room, username, client_conn):
+    """加入房间（房间不存在时创建），已在房间中返回 False"""
+    with lock:
+        members = rooms.get(room)
+        if members is None:
+            members = rooms[room] = UserRegistry(ROOM_SHARDS)
+        joined = user_rooms.setdefault(username, set())
+        if room in joined:
+            return False
+        members.add(username, client_conn)
+        joined.add(room)
+        return True
+
+def leave_room(room, username):
+    """离开房间（房间为空时删除），不在房间中返回 False"""
+    with lock:
+        joined = user_rooms.get(username)
+        if not joined or room not in joined:
+            return False
+        joined.discard(room)
+        if not joined:
+            del user_rooms[username]
+        members = rooms[room]
+        members.remove(username)
+        if not members.snapshot:
+            del rooms[room]
+        return True
+
+def leave_all_rooms(username):
+    """用户下线时退出全部房间，返回退出的房间名列表"""
+    with lock:
+        joined = user_rooms.pop(username, set())
+        for room in joined:
+            members = rooms[room]
+            members.remove(username)
+            if not members.snapshot:
+                del rooms[room]
+        return list(joined)
+
+def replace_member_connection(username, old_conn, new_conn):
+    """替换用户在其全部房间中登记的连接（断线续传）"""
+    with lock:
+        for room in user_rooms.get(username, ()):
+            rooms[room].replace(username, old_conn, new_conn)
+
+def get_room_members(room):
+    """获取房间成员快照（只读字典接口，遍历无需加锁）"""
+    if room == DEFAULT_ROOM:
+        return get_all_users()
+    members = rooms.get(room)
+    return members.snapshot if members is not None else _EMPTY_ROOM
+
+def is_room_member(room, username):
+    """检查用户是否在房间中"""
+    return username in get_room_members(room)
+
+def get_user_rooms(username):
+    """获取用户已加入的房间（不含大厅）"""
+    with lock:
+        return sorted(user_rooms.get(username, ()))
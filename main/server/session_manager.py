@@ -0,0 +1,200 @@
+"""会话管理模块：断线续传（仅新协议客户端）
+
+登录成功时创建会话并下发随机令牌。写线程每发出一帧，会话帧序号加一并把该帧保存在
+有界的重放缓冲区中；客户端同样对收到的帧计数（MSG_RESUME 应答和心跳帧不计数）。
+
+连接意外断开后会话保留 RESUME_GRACE_SECONDS 秒：在线用户表和房间中的登记换成
+DetachedConnection，期间发给该用户的消息先缓存起来，不广播下线/上线通知。
+客户端在宽限期内重连并发送 MSG_RESUME（用户名、令牌、已收到帧数），服务器重放客户端
+缺失的帧和断线期间缓存的消息，再把登记换回新连接。宽限期结束仍未重连才真正下线。
+"""
+import secrets
+import threading
+from collections import deque
+from config import RESUME_GRACE_SECONDS, RESUME_BUFFER_MESSAGES, OUTBOUND_MAX_MESSAGES
+from protocol import MSG_RESUME, UNCOUNTED_TYPES, encode_frame
+from server.outbound import KIND_NORMAL
+from server.user_manager import replace_user_socket
+from server.room_manager import replace_member_connection
+
+sessions = {}  # 用户名 -> Session
+lock = threading.Lock()
+
+class Session:
+    """一个登录会话：帧序号、重放缓冲区、断线期间的待发消息"""
+    def __init__(self, username, conn, on_expire):
+        self.username = username
+        self.token = secrets.token_hex(16)
+        self.conn = conn  # 当前连接（断线期间为 DetachedConnection）
+        self.lock = threading.Lock()
+        self.sent_seq = 0
+        self.replay = deque(maxlen=RESUME_BUFFER_MESSAGES)  # (帧序号, 帧数据)
+        self.pending = []  # 断线期间发给该用户的帧
+        self.timer = None
+        self.on_expire = on_expire
+        self.compression = conn.compression  # 续传的连接沿用登录时协商的压缩方式
+
+    def record_sent(self, batch):
+        """写线程发送一批帧之前调用：依次编号并放入重放缓冲区"""
+        with self.lock:
+            for data in batch:
+                if data[2] in UNCOUNTED_TYPES:
+                    continue
+                self.sent_seq += 1
+                self.replay.append((self.sent_seq, data))
+
+    def rewind(self, received_seq):
+        """取出客户端未收到的帧（序号大于 received_seq），缓冲区已不完整时返回 None。
+        取出的帧会重新发送并重新编号，因此序号回退到 received_seq"""
+        if received_seq > self.sent_seq:
+            return None
+        if received_seq < self.sent_seq and (not self.replay or self.replay[0][0] > received_seq + 1):
+            return None
+        frames = []
+        while self.replay and self.replay[-1][0] > received_seq:
+            frames.append(self.replay.pop()[1])
+        frames.reverse()
+        self.sent_seq = received_seq
+        return frames
+
+class DetachedConnection:
+    """断线宽限期内代替原连接登记在线用户表和房间，缓存发给该用户的消息"""
+    legacy = False
+    remote = False
+    compression = None  # 缓存的是未压缩的帧，续传后由新连接发送
+
+    def __init__(self, session):
+        self.session = session
+        self.target = None  # 续传成功后转发到的新连接
+
+    def send_message(self, msg_type, *fields, kind=KIND_NORMAL):
+        return self.send(encode_frame(msg_type, *fields), kind)
+
+    def send(self, data, kind=KIND_NORMAL):
+        session = self.session
+        with session.lock:
+            target = self.target
+            if target is None and len(session.pending) < OUTBOUND_MAX_MESSAGES:
+                session.pending.append(data)
+                return len(data)
+        if target is not None:
+            return target.send(data, kind)
+        # 断线期间积压过多：不再等待重连，直接下线
+        expire_session(session, self)
+        return 0
+
+    def queue_depth(self):
+        return len(self.session.pending)
+
+    def abort(self):
+        pass
+
+    def close(self):
+        pass
+
+def create_session(username, client_conn, on_expire):
+    """登录成功后创建会话，返回会话令牌（旧客户端不支持续传，返回空字符串）。
+    会话过期时调用 on_expire(DetachedConnection) 执行真正的下线流程"""
+    if client_conn.legacy or RESUME_GRACE_SECONDS <= 0:
+        return ""
+    session = Session(username, client_conn, on_expire)
+    with lock:
+        sessions[username] = session
+    client_conn.session = session
+    return session.token
+
+def end_session(client_conn):
+    """主动下线或被断开（慢客户端）：结束会话，不再允许续传"""
+    session = client_conn.session
+    client_conn.session = None
+    if session is None:
+        return
+    with lock:
+        if sessions.get(session.username) is session:
+            del sessions[session.username]
+
+def detach_session(username, client_conn):
+    """连接意外断开：保留会话等待重连，返回 True 表示无需立即下线"""
+    session = client_conn.session
+    if session is None:
+        return False
+    client_conn.session = None
+    with session.lock:
+        if session.conn is not client_conn:
+            return True  # 已被新连接接管
+        placeholder = DetachedConnection(session)
+        session.conn = placeholder
+        with client_conn.outbound_cond:
+            session.pending = client_conn.outbound.drain()  # 尚未写出的消息留到重连后发送
+    if not replace_user_socket(username, client_conn, placeholder):
+        return False
+    replace_member_connection(username, client_conn, placeholder)
+    session.timer = threading.Timer(RESUME_GRACE_SECONDS, expire_session, (session, placeholder))
+    session.timer.daemon = True
+    session.timer.start()
+    return True
+
+def expire_session(session, placeholder):
+    """宽限期结束（或断线期间积压过多）：删除会话并执行下线流程"""
+    with lock:
+        if sessions.get(session.username) is not session or session.conn is not placeholder:
+            return  # 已续传或已结束
+        del sessions[session.username]
+    if session.timer is not None:
+        session.timer.cancel()
+    session.on_expire(placeholder)
+
+def resume_session(username, token, received_seq, client_conn):
+    """断线重连：校验令牌后重放客户端缺失的帧和断线期间的消息，把登记换回新连接"""
+    with lock:
+        session = sessions.get(username)
+    if session is None or not secrets.compare_digest(session.token, token):
+        return False
+    old_conn = session.conn
+    if not isinstance(old_conn, DetachedConnection):
+        # 服务器尚未发现旧连接断开（客户端先察觉）：立即摘下旧连接
+        detach_session(username, old_conn)
+        old_conn.abort()
+    with lock:
+        placeholder = session.conn
+        if sessions.get(username) is not session or not isinstance(placeholder, DetachedConnection):
+            return False
+        session.conn = client_conn  # 认领会话，此后宽限期定时器不再生效
+    if session.timer is not None:
+        session.timer.cancel()
+
+    with session.lock:
+        frames = session.rewind(received_seq)
+    if frames is None:
+        # 缺失的消息已不在重放缓冲区中，无法续传：按正常流程下线，由客户端重新登录
+        with lock:
+            if sessions.get(username) is session:
+                del sessions[username]
+        session.on_expire(placeholder)
+        return False
+
+    client_conn.session = session
+    client_conn.compression = session.compression
+    client_conn.send_message(MSG_RESUME, "1")
+    with session.lock:
+        for data in frames + session.pending:
+            client_conn.send(data)
+        session.pending = []
+        placeholder.target = client_conn
+    replace_user_socket(username, placeholder, client_conn)
+    replace_member_connection(username, placeholder, client_conn)
+    return True
+
+def takeover_session(username, token):
+    """多进程模式：用户重连到了另一个 worker，令牌有效时立即结束本 worker 上的会话并下线，
+    由新 worker 重新登录（会话不跨进程迁移）"""
+    with lock:
+        session = sessions.get(username)
+    if session is None or not secrets.compare_digest(session.token, token):
+        return False
+    old_conn = session.conn
+    if not isinstance(old_conn, DetachedConnection):
+        detach_session(username, old_conn)
+        old_conn.abort()
+    expire_session(session, session.conn)
+    return True
@@ -0,0 +1,250 @@
+"""SQLite 存储模块：群聊历史 + 离线私聊队列
+
+所有数据库操作都交给唯一的写线程按提交顺序执行：写线程一次取出队列中积压的全部任务
+（最多 DB_BATCH_SIZE 条），合并在一个事务中提交。转发路径只把写入任务放进队列，
+不等待磁盘；读取任务排在此前的写入之后执行，因此总能读到已提交的消息。
+"""
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from config import DATABASE_PATH, DB_BATCH_SIZE, HISTORY_MAX_FETCH, OFFLINE_MAX_MESSAGES
+from config import OFFLINE_MAX_PER_SENDER, OFFLINE_TTL_DAYS
+from server.logger import get_logger
+
+log = get_logger("sqlite_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    room      TEXT    NOT NULL,
+    id        INTEGER NOT NULL,
+    timestamp REAL    NOT NULL,
+    sender    TEXT    NOT NULL,
+    content   TEXT    NOT NULL,
+    PRIMARY KEY (room, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS offline_messages (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    target    TEXT    NOT NULL,
+    sender    TEXT    NOT NULL,
+    timestamp REAL    NOT NULL,
+    content   TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS offline_target ON offline_messages (target, id);
+CREATE INDEX IF NOT EXISTS offline_sender ON offline_messages (sender);
+"""
+
+_STOP = object()
+
+# store_offline 的结果
+OFFLINE_STORED = 0
+OFFLINE_TARGET_FULL = 1  # 对方的离线消息已满
+OFFLINE_SENDER_FULL = 2  # 发送者保存的离线消息已达上限
+
+PURGE_INTERVAL = 3600  # 清除过期离线消息的间隔（秒）
+OFFLINE_LEASE = 60     # 取出后未确认的离线消息在该秒数后可再次取出（取出方已断开，如 worker 退出）
+
+def execute_quietly(db, sql):
+    """执行事务控制语句，失败时记录日志并返回异常（不中断写线程）"""
+    try:
+        db.execute(sql)
+    except sqlite3.Error as e:
+        log.error("数据库事务操作失败", sql=sql, error=e)
+        return e
+    return None
+
+class SqliteStore:
+    """单写线程的 SQLite 存储（群聊历史接口与 MessageStore 一致）"""
+    def __init__(self, path, batch_size=DB_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.tasks = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.last_ids = {}  # 房间名 -> 已分配的最大消息ID
+        self.offline_taken = {}  # 已取出、等待确认送达的离线消息ID -> 租约到期时间（只在写线程中访问）
+        self.next_purge = 0  # 下次清除过期离线消息的时间（只在写线程中访问）
+        self.writer = None
+
+    def _start(self):
+        """首次使用时打开数据库、读取各房间最大消息ID并启动写线程"""
+        with self.lock:
+            if self.writer is not None:
+                return
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")  # WAL 模式下只在检查点时 fsync
+            db.executescript(SCHEMA)
+            self.last_ids = dict(db.execute("SELECT room, MAX(id) FROM history GROUP BY room"))
+            self.writer = threading.Thread(target=self._writer_loop, args=(db,), daemon=True)
+            self.writer.start()
+
+    def submit(self, task, want_result=False):
+        """提交一个数据库任务 task(db)，需要结果时返回 Future"""
+        if self.writer is None:
+            self._start()
+        future = Future() if want_result else None
+        self.tasks.put((task, future))
+        return future
+
+    def _writer_loop(self, db):
+        """写线程：批量取出任务，在同一个事务中执行；每个任务一个保存点，
+        出错的任务（任何异常）只撤销自己的写入并通知等待方，写线程继续运行"""
+        while True:
+            batch = [self.tasks.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.tasks.get_nowait())
+                except queue.Empty:
+                    break
+            results = []  # (Future, 结果, 异常)
+            stop = False
+            execute_quietly(db, "BEGIN")
+            for task, future in batch:
+                if task is _STOP:
+                    stop = True
+                    results.append((future, None, None))
+                    continue
+                try:
+                    db.execute("SAVEPOINT task")
+                    result = task(db)
+                    db.execute("RELEASE task")
+                except Exception as e:
+                    log.error("数据库操作失败", error=e)
+                    execute_quietly(db, "ROLLBACK TO task")
+                    execute_quietly(db, "RELEASE task")
+                    results.append((future, None, e))
+                    continue
+                results.append((future, result, None))
+            commit_error = execute_quietly(db, "COMMIT") if db.in_transaction else None
+            if commit_error is not None:
+                execute_quietly(db, "ROLLBACK")
+            # 事务提交后再通知等待方（回调中可以安全地再次提交任务，但不能等待其结果）
+            for future, result, error in results:
+                if future is None:
+                    continue
+                error = error or commit_error
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            if stop:
+                db.close()
+                return
+
+    # ---------- 群聊历史 ----------
+
+    def append(self, room, sender, content, timestamp=None):
+        """记录一条群聊消息（只入队，不等待写入），返回消息ID"""
+        if self.writer is None:
+            self._start()
+        timestamp = timestamp or time.time()
+        with self.lock:
+            msg_id = self.last_ids.get(room, 0) + 1
+            self.last_ids[room] = msg_id
+            # 在锁内入队，保证同一房间的消息按消息ID顺序写入
+            self.tasks.put((lambda db: db.execute(
+                "INSERT INTO history VALUES (?, ?, ?, ?, ?)",
+                (room, msg_id, timestamp, sender, content)), None))
+        return msg_id
+
+    def read_last(self, room, count):
+        """读取房间最近 count 条消息：[(消息ID, 时间戳, 发送者, 内容)]"""
+        return self.fetch_last(room, count).result()
+
+    def read_since(self, room, msg_id, limit=HISTORY_MAX_FETCH):
+        """读取房间中消息ID大于 msg_id 的消息"""
+        return self.fetch_since(room, msg_id, limit).result()
+
+    def fetch_last(self, room, count):
+        """同 read_last，但不等待写线程，返回 Future（结果以回调取得，不阻塞调用方）"""
+        count = min(count, HISTORY_MAX_FETCH)
+
+        def task(db):
+            rows = db.execute("SELECT id, timestamp, sender, content FROM history WHERE room = ? "
+                              "ORDER BY id DESC LIMIT ?", (room, count)).fetchall()
+            rows.reverse()
+            return rows
+        return self.submit(task, want_result=True)
+
+    def fetch_since(self, room, msg_id, limit=HISTORY_MAX_FETCH):
+        """同 read_since，返回 Future"""
+        limit = min(limit, HISTORY_MAX_FETCH)
+        return self.submit(lambda db: db.execute(
+            "SELECT id, timestamp, sender, content FROM history WHERE room = ? AND id > ? "
+            "ORDER BY id LIMIT ?", (room, msg_id, limit)).fetchall(), want_result=True)
+
+    # ---------- 离线私聊 ----------
+
+    def store_offline(self, target, sender, content):
+        """保存一条离线私聊消息，返回 Future（结果为 OFFLINE_STORED / OFFLINE_TARGET_FULL / OFFLINE_SENDER_FULL）
+
+        任何人都可以给任意不在线的用户名留言，因此同时限制每个接收者和每个发送者的条数，
+        并定期清除超过 OFFLINE_TTL_DAYS 天未取走的消息，表的大小不会无限增长。"""
+        timestamp = time.time()
+
+        def task(db):
+            self._purge_expired(db)
+            count, = db.execute("SELECT COUNT(*) FROM offline_messages WHERE target = ?",
+                                (target,)).fetchone()
+            if count >= OFFLINE_MAX_MESSAGES:
+                return OFFLINE_TARGET_FULL
+            count, = db.execute("SELECT COUNT(*) FROM offline_messages WHERE sender = ?",
+                                (sender,)).fetchone()
+            if count >= OFFLINE_MAX_PER_SENDER:
+                return OFFLINE_SENDER_FULL
+            db.execute("INSERT INTO offline_messages (target, sender, timestamp, content) "
+                       "VALUES (?, ?, ?, ?)", (target, sender, timestamp, content))
+            return OFFLINE_STORED
+        return self.submit(task, want_result=True)
+
+    def _purge_expired(self, db):
+        """每 PURGE_INTERVAL 秒清除一次过期的离线消息（在写线程中调用）"""
+        now = time.time()
+        if not OFFLINE_TTL_DAYS or now < self.next_purge:
+            return
+        self.next_purge = now + PURGE_INTERVAL
+        expired = time.monotonic()
+        self.offline_taken = {msg_id: deadline for msg_id, deadline in self.offline_taken.items()
+                              if deadline > expired}  # 取出方未确认的租约
+        deleted = db.execute("DELETE FROM offline_messages WHERE timestamp < ?",
+                             (now - OFFLINE_TTL_DAYS * 86400,)).rowcount
+        if deleted:
+            log.info("已清除过期的离线消息", count=deleted)
+
+    def take_offline(self, target):
+        """取出用户的离线私聊消息（暂不删除），返回 Future（结果为 [(消息ID, 时间戳, 发送者, 内容)]）
+
+        发送后须调用 ack_offline：只删除确认已发送的消息，其余保留到下次登录；
+        确认之前（至多 OFFLINE_LEASE 秒）这些消息不会被再次取出（保存离线消息时对方恰好上线会再次触发补发）。"""
+        def task(db):
+            now = time.monotonic()
+            rows = [row for row in db.execute(
+                "SELECT id, timestamp, sender, content FROM offline_messages "
+                "WHERE target = ? ORDER BY id", (target,)) if self.offline_taken.get(row[0], 0) < now]
+            for row in rows:
+                self.offline_taken[row[0]] = now + OFFLINE_LEASE
+            return rows
+        return self.submit(task, want_result=True)
+
+    def ack_offline(self, target, taken_ids, sent_ids):
+        """确认 take_offline 取出的消息：删除已发送的 sent_ids，未发送的留待下次取出"""
+        def task(db):
+            for msg_id in taken_ids:
+                self.offline_taken.pop(msg_id, None)
+            db.executemany("DELETE FROM offline_messages WHERE target = ? AND id = ?",
+                           [(target, msg_id) for msg_id in sent_ids])
+        self.submit(task)
+
+    def flush(self, sync=False):
+        """等待此前提交的全部任务写入"""
+        if self.writer is not None:
+            self.submit(lambda db: None, want_result=True).result()
+
+    def close(self):
+        """写完队列中的剩余任务后关闭数据库"""
+        if self.writer is not None:
+            self.submit(_STOP, want_result=True).result()
+            self.writer = None
+
+sqlite_store = SqliteStore(DATABASE_PATH)
@@ -1,30 +1,34 @@
-from config import CHAT_SEPARATOR
+from protocol import (MSG_LOGIN, MSG_SYSTEM, MSG_PRESENCE, PRESENCE_SNAPSHOT,
+                      PRESENCE_JOIN, PRESENCE_LEAVE)
+from server.broadcast import broadcast
+from server.outbound import KIND_NORMAL, KIND_PRESENCE, KIND_SNAPSHOT
+from server.user_manager import get_all_users, get_online_list
+from server.logger import get_logger
 from datetime import datetime
 
+log = get_logger("system_notify")
+
 def get_current_time():
     """获取时间戳：hh:mm:ss"""
     return datetime.now().strftime("%H:%M:%S")
 
-def send_login_response(client_socket, success, online_list):
+def send_login_response(client_socket, success, online_list, seq=0, token=""):
+    """登录响应（成功时即为完整在线列表快照，seq 为该快照的在线版本号，token 为断线续传令牌；
+    客户端声明了压缩能力时附带协商结果）"""
     time_str = get_current_time()
     online_str = ','.join(online_list) if online_list else '无'
-    if success:
-        response = f"【成功】{time_str}\n登录成功！{CHAT_SEPARATOR}【当前在线】{online_str}{CHAT_SEPARATOR}"
-    else:
-        response = f"【错误】{time_str}\n登录失败！{CHAT_SEPARATOR}【当前在线】{online_str}{CHAT_SEPARATOR}"
-    client_socket.send(response.encode("utf-8"))
+    fields = ["1" if success else "0", time_str, str(seq), online_str, token]
+    if client_socket.compression is not None:
+        fields.append(client_socket.compression)
+    client_socket.send_message(MSG_LOGIN, *fields)
 
-def send_response(client_socket, success, online_list):
+def send_response(client_socket, success, online_list, seq=0, token=""):
     """兼容旧代码的登录响应"""
-    send_login_response(client_socket, success, online_list)
+    send_login_response(client_socket, success, online_list, seq, token)
 
-def broadcast_system_message(all_client_sockets, msg):
+def broadcast_system_message(all_client_sockets, msg, kind=KIND_NORMAL):
     """广播系统消息"""
-    for client_socket in all_client_sockets.values():
-        try:
-            client_socket.send(f"{msg}{CHAT_SEPARATOR}".encode("utf-8"))
-        except:
-            pass
+    broadcast(all_client_sockets.items(), MSG_SYSTEM, msg, kind=kind)
 
 def send_online_list_to_client(client_socket, online_list):
     """发送在线列表"""
@@ -32,20 +36,42 @@ def send_online_list_to_client(client_socket, online_list):
     online_str = ','.join(online_list) if online_list else '无'
     msg = f"【系统通知】{time_str}\n当前在线：{online_str}"
     try:
-        client_socket.send(f"{msg}{CHAT_SEPARATOR}".encode("utf-8"))
+        client_socket.send_message(MSG_SYSTEM, msg, kind=KIND_SNAPSHOT)
     except Exception as e:
-        print(f"❌ 发送在线列表失败：{e}")
+        log.warning("发送在线列表失败", error=e)
+
+def send_presence_snapshot(client_socket):
+    """发送完整在线列表（客户端发现版本号缺口时请求重新同步，或出站队列丢弃了增量）"""
+    snapshot = get_all_users()
+    client_socket.send_message(MSG_PRESENCE, PRESENCE_SNAPSHOT, str(snapshot.version),
+                               ','.join(snapshot), kind=KIND_SNAPSHOT)
+
+def resync_presence(client_socket):
+    """出站队列丢弃了在线状态帧：补发完整在线列表（旧客户端为带在线列表的文本通知）"""
+    if client_socket.legacy:
+        send_online_list_to_client(client_socket, get_online_list())
+    else:
+        send_presence_snapshot(client_socket)
 
-def send_online_notify(username, all_client_sockets):
+def broadcast_presence(op, username, seq, all_client_sockets, action):
+    """广播在线状态增量：新协议客户端只收到「上线/下线 + 版本号」（不可丢弃），
+    旧客户端仍收到带完整在线列表的文本通知（仅在存在旧客户端时才拼接，新通知可覆盖旧通知）"""
+    def legacy_message():
+        time_str = get_current_time()
+        online_str = ','.join(all_client_sockets.keys()) if all_client_sockets else '无'
+        return MSG_SYSTEM, f"【系统通知】{time_str}\n用户 {username} {action}！当前在线：{online_str}"
+
+    broadcast(all_client_sockets.items(), MSG_PRESENCE, op, str(seq), username,
+              kind=KIND_PRESENCE, legacy_message=legacy_message, legacy_kind=KIND_SNAPSHOT)
+
+def broadcast_room_event(msg_type, room, username, members):
+    """向房间成员广播加入/离开房间事件（MSG_ROOM_JOIN / MSG_ROOM_LEAVE）"""
+    broadcast(members.items(), msg_type, room, username)
+
+def send_online_notify(username, all_client_sockets, seq):
     """上线通知"""
-    time_str = get_current_time()
-    online_str = ','.join(all_client_sockets.keys()) if all_client_sockets else '无'
-    notify_msg = f"【系统通知】{time_str}\n用户 {username} 已上线！当前在线：{online_str}"
-    broadcast_system_message(all_client_sockets, notify_msg)
+    broadcast_presence(PRESENCE_JOIN, username, seq, all_client_sockets, "已上线")
 
-def send_offline_notify(username, all_client_sockets):
+def send_offline_notify(username, all_client_sockets, seq):
     """下线通知"""
-    time_str = get_current_time()
-    online_str = ','.join(all_client_sockets.keys()) if all_client_sockets else '无'
-    notify_msg = f"【系统通知】{time_str}\n用户 {username} 已下线！当前在线：{online_str}"
-    broadcast_system_message(all_client_sockets, notify_msg)
\ No newline at end of file
+    broadcast_presence(PRESENCE_LEAVE, username, seq, all_client_sockets, "已下线")
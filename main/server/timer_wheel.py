@@ -0,0 +1,54 @@
+"""哈希时间轮：大量定时器的 O(1) 登记/取消，到期检查只处理到期的定时器
+
+时间按 tick 划分，定时器按到期 tick 散列到 slots 个槽之一。每推进一个 tick 只检查
+当前槽：到期的取出，尚未到期（到期时间超过一圈）的留在槽中等下一圈。
+slots × tick 大于常用的定时时长时，槽中的定时器基本都是本圈到期的。
+"""
+import math
+import threading
+
+class TimerWheel:
+    """以任意可哈希对象为键的定时器集合（线程安全），每个键同时只有一个定时器"""
+    def __init__(self, tick, slots, now):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # 每槽：键 -> 到期 tick
+        self.positions = {}  # 键 -> 所在槽（取消时直接定位）
+        self.current = int(now / tick)  # 下一个待处理的 tick
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def schedule(self, key, deadline):
+        """登记（或改期）键的定时器，deadline 与 now 同一时钟（time.monotonic）"""
+        with self.lock:
+            due = max(math.ceil(deadline / self.tick), self.current)  # 向上取整，不会提前到期
+            index = due % len(self.slots)
+            old = self.positions.get(key)
+            if old is not None and old != index:
+                del self.slots[old][key]
+            self.slots[index][key] = due
+            self.positions[key] = index
+
+    def cancel(self, key):
+        with self.lock:
+            index = self.positions.pop(key, None)
+            if index is not None:
+                del self.slots[index][key]
+
+    def advance(self, now):
+        """推进到 now，取出全部到期的键"""
+        expired = []
+        target = int(now / self.tick)
+        with self.lock:
+            # 停顿超过一圈时每个槽检查一次即可
+            start = max(self.current, target - len(self.slots) + 1)
+            for due_tick in range(start, target + 1):
+                slot = self.slots[due_tick % len(self.slots)]
+                due = [key for key, tick in slot.items() if tick <= target]
+                for key in due:
+                    del slot[key]
+                    del self.positions[key]
+                expired.extend(due)
+            self.current = max(self.current, target + 1)
+        return expired
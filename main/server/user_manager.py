@@ -1,36 +1,134 @@
-"""用户管理模块：维护在线用户列表（线程安全）"""
+"""用户管理模块：维护在线用户列表（线程安全）
+
+按用户名哈希分片，每个分片独立加锁并以写时复制方式发布不可变字典；
+所有分片字典组成带版本号的全局快照。读操作（查找、遍历）不加锁、不复制，
+写操作只复制一个分片并在发布锁内替换 O(分片数) 的快照引用。
+"""
 import threading
+from config import REGISTRY_SHARDS
+
+class RegistrySnapshot:
+    """在线用户的不可变快照（版本号 + 各分片字典），可当作只读字典使用"""
+    __slots__ = ("version", "shards", "_size")
+
+    def __init__(self, version, shards):
+        self.version = version  # 在线成员版本号，每次上线/下线加一
+        self.shards = shards
+        self._size = sum(len(shard) for shard in shards)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def __contains__(self, username):
+        return username in self.shards[_shard_index(username, len(self.shards))]
+
+    def get(self, username, default=None):
+        return self.shards[_shard_index(username, len(self.shards))].get(username, default)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for shard in self.shards:
+            yield from shard.values()
+
+    def items(self):
+        for shard in self.shards:
+            yield from shard.items()
 
-online_users = {}
-lock = threading.Lock()
+def _shard_index(username, shard_count):
+    return hash(username) % shard_count
+
+class UserRegistry:
+    """分片在线用户表"""
+    def __init__(self, shard_count=REGISTRY_SHARDS):
+        self.shard_count = shard_count
+        self.shard_locks = [threading.Lock() for _ in range(shard_count)]
+        self.publish_lock = threading.Lock()
+        self.snapshot = RegistrySnapshot(0, tuple({} for _ in range(shard_count)))
+
+    def _publish(self, index, new_shard, bump=True):
+        """替换一个分片并发布新快照，返回新版本号（bump=False 时成员未变，版本号不变）"""
+        with self.publish_lock:
+            shards = list(self.snapshot.shards)
+            shards[index] = new_shard
+            version = self.snapshot.version + 1 if bump else self.snapshot.version
+            self.snapshot = RegistrySnapshot(version, tuple(shards))
+            return self.snapshot.version
+
+    def add(self, username, client_conn):
+        """用户名未被占用时登记，返回新版本号；已被占用返回 0"""
+        index = _shard_index(username, self.shard_count)
+        with self.shard_locks[index]:
+            shard = self.snapshot.shards[index]
+            if username in shard:
+                return 0
+            new_shard = dict(shard)
+            new_shard[username] = client_conn
+            return self._publish(index, new_shard)
+
+    def remove(self, username, client_conn=None):
+        """移除用户（指定 client_conn 时仅当登记的是该连接才移除），返回新版本号；未移除返回 0"""
+        index = _shard_index(username, self.shard_count)
+        with self.shard_locks[index]:
+            shard = self.snapshot.shards[index]
+            current = shard.get(username)
+            if current is None or (client_conn is not None and current is not client_conn):
+                return 0
+            new_shard = dict(shard)
+            del new_shard[username]
+            return self._publish(index, new_shard)
+
+    def replace(self, username, old_conn, new_conn):
+        """把用户登记的连接从 old_conn 换成 new_conn（成员不变，不增加版本号），成功返回 True"""
+        index = _shard_index(username, self.shard_count)
+        with self.shard_locks[index]:
+            shard = self.snapshot.shards[index]
+            if shard.get(username) is not old_conn:
+                return False
+            new_shard = dict(shard)
+            new_shard[username] = new_conn
+            self._publish(index, new_shard, bump=False)
+            return True
+
+registry = UserRegistry()
 
 def add_user(username, client_socket):
-    """添加在线用户"""
-    with lock:
-        online_users[username] = client_socket
+    """添加在线用户（原子操作），返回本次变更的在线版本号；用户名已存在时返回 0"""
+    return registry.add(username, client_socket)
+
+def remove_user(username, client_socket=None):
+    """移除在线用户，返回本次变更的在线版本号；未移除时返回 0"""
+    return registry.remove(username, client_socket)
 
-def remove_user(username):
-    """移除在线用户"""
-    with lock:
-        if username in online_users:
-            del online_users[username]
+def replace_user_socket(username, old_socket, new_socket):
+    """替换在线用户的连接（断线续传），不产生上线/下线变更"""
+    return registry.replace(username, old_socket, new_socket)
 
 def get_user_socket(username):
-    """根据用户名获取客户端socket"""
-    with lock:
-        return online_users.get(username)
+    """根据用户名获取客户端连接（无锁 O(1) 查找）"""
+    return registry.snapshot.get(username)
 
 def get_all_users():
-    """获取所有在线用户名（返回字典，兼容旧代码）"""
-    with lock:
-        return online_users  # 返回完整字典：{username: socket}
+    """获取在线用户快照（只读字典接口：keys/values/items，遍历期间不受其他线程修改影响）"""
+    return registry.snapshot
 
 def get_online_list():
     """获取在线用户名列表（仅返回用户名，用于显示）"""
-    with lock:
-        return list(online_users.keys())
+    return list(registry.snapshot)
+
+def get_connection_snapshot():
+    """获取在线用户快照，可直接遍历 (用户名, 连接)，供广播使用"""
+    return registry.snapshot.items()
+
+def get_presence_version():
+    """获取在线成员版本号"""
+    return registry.snapshot.version
 
 def is_username_exist(username):
     """检查用户名是否已存在"""
-    with lock:
-        return username in online_users
\ No newline at end of file
+    return username in registry.snapshot
@@ -0,0 +1,380 @@
+"""多进程模式：主进程运行总线中枢，fork 出 N 个 worker 共享监听端口（SO_REUSEPORT）
+
+每个 worker 是一个完整的线程模式或异步模式服务器，只负责连到本进程的客户端；
+跨 worker 的事件经主进程中的 BusHub 转发（协议见 server/bus.py）：
+
+    用户名目录：用户名 -> worker 编号，登录申请在这里判重，上线/下线转告其他 worker
+    群聊：分配消息ID、写入历史（历史只由主进程写入），再发给全部 worker 各自扇出
+    私聊/通知：按目录 O(1) 转交目标用户所在的 worker
+    worker 退出：其全部用户视为下线
+
+配置了 cluster_port 时中枢还负责与其他节点的集群链路（server/cluster.py）：
+用户名申请先经归属节点判重，目录中不在本节点的用户、群聊和房间事件经链路在节点之间转发。
+离线私聊由中枢统一保存（集群模式下存放在接收者的归属节点），worker 不直接读写。
+"""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import socket
+from config import BUS_SOCKET, HISTORY_ENABLED, METRICS_PORT
+from config import CLUSTER_HOST, CLUSTER_PORT, CLUSTER_PEERS
+from protocol import MSG_PRIVATE, HISTORY_SINCE, FrameDecoder, encode_frame, split_fields
+from server import bus
+from server.bus import (BUS_HELLO, BUS_REPLY, BUS_CLAIM, BUS_RELEASE, BUS_USER_JOIN,
+                        BUS_USER_LEAVE, BUS_GROUP, BUS_DELIVER, BUS_ROOM_EVENT, BUS_HISTORY,
+                        BUS_TAKEOVER, BUS_OFFLINE_STORE, BUS_OFFLINE_TAKE, BUS_OFFLINE_ACK)
+from server.cluster import (Cluster, NODE_TAKEOVER, NODE_OFFLINE_STORE, NODE_OFFLINE_TAKE,
+                            local_node_id)
+from server.message_store import message_store
+from server.sqlite_store import sqlite_store
+from server.system_notify import get_current_time
+from server.logger import get_logger, set_log_context, shutdown_logging
+
+log = get_logger("workers")
+
+class BusHub:
+    """总线中枢（主进程，asyncio）：维护用户名目录并在 worker 之间转发事件"""
+    def __init__(self):
+        self.workers = {}    # worker 编号 -> StreamWriter
+        self.directory = {}  # 用户名 -> worker 编号
+        self.takeovers = {}  # 中枢请求号 -> (Future, 目标 worker)
+        self.request_ids = itertools.count(1)
+        self.closing = False
+        self.cluster = None  # 集群模式下的 Cluster
+
+    def send_to(self, worker_id, data):
+        writer = self.workers.get(worker_id)
+        if writer is not None:
+            writer.write(data)
+
+    def send_others(self, worker_id, data):
+        for other_id, writer in self.workers.items():
+            if other_id != worker_id:
+                writer.write(data)
+
+    def send_all(self, data):
+        for writer in self.workers.values():
+            writer.write(data)
+
+    async def handle_worker(self, reader, writer):
+        """一个 worker 的总线连接"""
+        decoder = FrameDecoder()
+        worker_id = None
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for msg_type, payload in decoder.feed(data):
+                    if msg_type == BUS_HELLO:
+                        worker_id = int(payload)
+                        self.register(worker_id, writer)
+                    elif worker_id is not None:
+                        self.dispatch(worker_id, writer, msg_type, payload)
+                await writer.drain()
+        except (ConnectionError, OSError) as e:
+            if not self.closing:
+                log.warning("worker 总线连接异常", worker=worker_id, error=e)
+        finally:
+            if worker_id is not None:
+                self.unregister(worker_id)
+            writer.close()
+
+    def register(self, worker_id, writer):
+        """worker 连上总线：发送其他 worker 上已在线的用户"""
+        self.workers[worker_id] = writer
+        for username, owner in self.directory.items():
+            writer.write(encode_frame(BUS_USER_JOIN, username, str(owner)))
+        if self.cluster is not None:
+            for username, node_id in self.cluster.remote_users.items():
+                writer.write(encode_frame(BUS_USER_JOIN, username, node_id))
+        log.info("worker 已连接总线", worker=worker_id)
+
+    def unregister(self, worker_id):
+        """worker 退出：其全部用户下线，等待它应答的接管请求按失败处理"""
+        self.workers.pop(worker_id, None)
+        gone = [username for username, owner in self.directory.items() if owner == worker_id]
+        for username in gone:
+            del self.directory[username]
+            self.send_all(encode_frame(BUS_USER_LEAVE, username))
+            if self.cluster is not None:
+                self.cluster.announce_leave(username)
+        for request_id, (future, target) in list(self.takeovers.items()):
+            if target == worker_id:
+                del self.takeovers[request_id]
+                future.set_result("0")
+        if not self.closing:
+            log.warning("worker 已断开总线", worker=worker_id, users=len(gone))
+
+    def dispatch(self, worker_id, writer, msg_type, payload):
+        if msg_type == BUS_GROUP:
+            room, sender, content = split_fields(payload, 3)
+            time_str = get_current_time()
+            self.publish_group(room, sender, content, time_str)
+            if self.cluster is not None:
+                self.cluster.forward_group(room, sender, time_str, content)
+        elif msg_type == BUS_DELIVER:
+            if self.deliver_local(payload):
+                return
+            node_id = (self.cluster.owner(split_fields(payload, 2)[0]) if self.cluster is not None
+                       else None)
+            if node_id is not None:
+                self.cluster.forward_deliver(node_id, payload)
+            else:
+                self.deliver_offline(payload)
+        elif msg_type == BUS_CLAIM:
+            request_id, username = split_fields(payload, 2)
+            if self.cluster is None:
+                self.finish_claim(worker_id, writer, request_id, username, True)
+            else:
+                asyncio.ensure_future(self.cluster_claim(worker_id, writer, request_id, username))
+        elif msg_type == BUS_RELEASE:
+            if self.directory.get(payload) == worker_id:
+                del self.directory[payload]
+                self.send_others(worker_id, encode_frame(BUS_USER_LEAVE, payload))
+                if self.cluster is not None:
+                    self.cluster.announce_leave(payload)
+        elif msg_type == BUS_ROOM_EVENT:
+            self.send_others(worker_id, encode_frame(BUS_ROOM_EVENT, payload))
+            if self.cluster is not None:
+                self.cluster.forward_room_event(payload)
+        elif msg_type == BUS_HISTORY:
+            asyncio.ensure_future(self.reply_history(writer, *split_fields(payload, 4)))
+        elif msg_type == BUS_TAKEOVER:
+            request_id, username, token = split_fields(payload, 3)
+            asyncio.ensure_future(self.reply_takeover(worker_id, writer, request_id, username,
+                                                      token))
+        elif msg_type == BUS_OFFLINE_STORE:
+            request_id, target, sender, content = split_fields(payload, 4)
+            asyncio.ensure_future(self.reply(writer, request_id,
+                                             self.store_offline(target, sender, content)))
+        elif msg_type == BUS_OFFLINE_TAKE:
+            request_id, target = split_fields(payload, 2)
+            asyncio.ensure_future(self.reply(writer, request_id, self.take_offline(target)))
+        elif msg_type == BUS_OFFLINE_ACK:
+            self.ack_offline(*split_fields(payload, 3))
+        elif msg_type == BUS_REPLY:
+            hub_request, result = split_fields(payload, 2)
+            pending = self.takeovers.pop(hub_request, None)
+            if pending is not None:
+                pending[0].set_result(result)
+
+    def is_free(self, username):
+        """用户名未被本节点及（集群模式下）其他节点占用"""
+        return username not in self.directory and (self.cluster is None or
+                                                   self.cluster.is_free(username))
+
+    def finish_claim(self, worker_id, writer, request_id, username, granted):
+        """登记申请结果：批准时转告其他 worker（及其他节点）该用户上线"""
+        if not granted or not self.is_free(username):
+            if granted and self.cluster is not None:
+                self.cluster.announce_leave(username)  # 归属节点已预留，释放
+            writer.write(encode_frame(BUS_REPLY, request_id, "0"))
+            return
+        self.directory[username] = worker_id
+        writer.write(encode_frame(BUS_REPLY, request_id, "1"))
+        self.send_others(worker_id, encode_frame(BUS_USER_JOIN, username, str(worker_id)))
+        if self.cluster is not None:
+            self.cluster.announce_join(username)
+
+    async def cluster_claim(self, worker_id, writer, request_id, username):
+        """集群模式：先向用户名的归属节点申请"""
+        granted = self.is_free(username) and await self.cluster.claim(username)
+        self.finish_claim(worker_id, writer, request_id, username, granted)
+
+    def publish_group(self, room, sender, content, time_str):
+        """分配消息ID、写入历史并发给全部 worker"""
+        msg_id = message_store.append(room, sender, content) if HISTORY_ENABLED else 0
+        self.send_all(encode_frame(BUS_GROUP, room, str(msg_id), sender, time_str, content))
+
+    def deliver_local(self, payload):
+        """把 BUS_DELIVER 负载转交目标用户所在的本节点 worker，用户不在本节点时返回 False"""
+        owner = self.directory.get(split_fields(payload, 2)[0])
+        if owner is None:
+            return False
+        self.send_to(owner, encode_frame(BUS_DELIVER, payload))
+        return True
+
+    def deliver_offline(self, payload):
+        """BUS_DELIVER 的目标用户已不在线：私聊改存为离线消息，其他消息（系统通知等）丢弃"""
+        username, msg_type, count, rest = split_fields(payload, 4)
+        if int(msg_type) != MSG_PRIVATE:
+            return
+        sender, content = split_fields(rest, 2)
+        log.info("私聊转交时对方已下线，改存为离线消息", sender=sender, target=username)
+        asyncio.ensure_future(self.store_offline(username, sender, content))
+
+    async def takeover_local(self, username, token, requester=None):
+        """让本节点上持有该用户会话的 worker 结束会话，返回 "1"（已结束）或 "0"（无可结束的会话）"""
+        owner = self.directory.get(username)
+        if owner is None or owner == requester or owner not in self.workers:
+            return "0"
+        hub_request = str(next(self.request_ids))
+        future = asyncio.get_running_loop().create_future()
+        self.takeovers[hub_request] = (future, owner)
+        self.send_to(owner, encode_frame(BUS_TAKEOVER, hub_request, username, token))
+        return await future
+
+    async def reply_takeover(self, worker_id, writer, request_id, username, token):
+        """用户重连到了 worker_id：结束其在其他 worker（或其他节点）上的会话"""
+        if username in self.directory:
+            result = await self.takeover_local(username, token, requester=worker_id)
+        elif self.cluster is not None and self.cluster.owner(username) is not None:
+            result = await self.cluster.request(self.cluster.owner(username), NODE_TAKEOVER,
+                                                username, token)
+        else:
+            result = "0"
+        writer.write(encode_frame(BUS_REPLY, request_id, result))
+
+    async def reply_history(self, writer, request_id, room, mode, value):
+        """读取历史（在线程池中执行，不阻塞转发）后应答"""
+        read = message_store.read_since if mode == HISTORY_SINCE else message_store.read_last
+        try:
+            records = await asyncio.get_running_loop().run_in_executor(None, read, room, int(value))
+        except Exception as e:
+            log.error("读取历史消息失败", room=room, error=e)
+            records = []
+        writer.write(encode_frame(BUS_REPLY, request_id, json.dumps(records, ensure_ascii=False)))
+
+    async def reply(self, writer, request_id, coroutine):
+        writer.write(encode_frame(BUS_REPLY, request_id, await coroutine))
+
+    # ---------- 离线私聊（集群模式下存放在接收者的归属节点） ----------
+
+    def offline_home(self, target):
+        """接收者的归属节点ID（未加入集群或本节点即为归属节点时为 None）"""
+        if self.cluster is None:
+            return None
+        home = self.cluster.home_node(target)
+        return None if home == self.cluster.node_id else home
+
+    async def store_offline(self, target, sender, content):
+        """保存一条离线私聊，返回应答文本（保存结果；空字符串表示失败）"""
+        home = self.offline_home(target)
+        if home is not None:
+            return await self.cluster.request(home, NODE_OFFLINE_STORE, target, sender, content,
+                                              failure="")
+        return await self.store_offline_local(target, sender, content)
+
+    async def take_offline(self, target):
+        """取出用户的离线私聊，返回应答文本（JSON 数组；空字符串表示失败）"""
+        home = self.offline_home(target)
+        if home is not None:
+            return await self.cluster.request(home, NODE_OFFLINE_TAKE, target, failure="")
+        return await self.take_offline_local(target)
+
+    def ack_offline(self, target, taken, sent):
+        """确认已发送的离线私聊（taken、sent 为消息ID的 JSON 数组）"""
+        home = self.offline_home(target)
+        if home is not None:
+            self.cluster.forward_offline_ack(home, target, taken, sent)
+        else:
+            self.ack_offline_local(target, taken, sent)
+
+    async def store_offline_local(self, target, sender, content):
+        return await self.wait_store(sqlite_store.store_offline(target, sender, content), str)
+
+    async def take_offline_local(self, target):
+        return await self.wait_store(sqlite_store.take_offline(target),
+                                     lambda rows: json.dumps(rows, ensure_ascii=False))
+
+    def ack_offline_local(self, target, taken, sent):
+        sqlite_store.ack_offline(target, json.loads(taken), json.loads(sent))
+
+    async def wait_store(self, future, encode):
+        """等待写线程完成（不阻塞中枢的事件循环），返回编码后的结果；失败时返回空字符串"""
+        try:
+            return encode(await asyncio.wrap_future(future))
+        except Exception as e:
+            log.error("离线私聊存储失败", error=e)
+            return ""
+
+    async def serve(self, hub_socket, processes):
+        """运行中枢直到收到 Ctrl+C / SIGTERM（或全部 worker 已退出），再依次关闭全部 worker"""
+        loop = asyncio.get_running_loop()
+        stopping = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopping.set)
+        server = await asyncio.start_unix_server(self.handle_worker, sock=hub_socket)
+        if CLUSTER_PORT:
+            self.cluster = Cluster(self, local_node_id(), CLUSTER_HOST, CLUSTER_PORT, CLUSTER_PEERS)
+            await self.cluster.start()
+        alive = set(processes)
+        while alive and not stopping.is_set():
+            try:
+                await asyncio.wait_for(stopping.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+            for process in [p for p in alive if not p.is_alive()]:
+                alive.discard(process)
+                log.error("worker 进程已退出", worker=process.name, exitcode=process.exitcode)
+
+        log.info("正在关闭服务器...")
+        self.closing = True
+        for process in alive:
+            os.kill(process.pid, signal.SIGTERM)  # worker 打印统计并关闭存储后退出
+        deadline = loop.time() + 10
+        while any(process.is_alive() for process in alive) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        server.close()
+        for writer in list(self.workers.values()):
+            writer.close()
+        if self.cluster is not None:
+            self.cluster.close()
+
+def _request_shutdown(signum, frame):
+    """worker 收到 SIGTERM：与单进程模式的 Ctrl+C 相同的关闭流程（只处理一次）"""
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+def run_worker(worker_id, args, bus_path):
+    """worker 进程入口：连接总线，在共享端口上运行线程模式或异步模式服务器"""
+    from server.main import create_server_socket, start_metrics, serve
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由主进程统一转为 SIGTERM
+    signal.signal(signal.SIGTERM, _request_shutdown)
+    set_log_context(worker=worker_id)
+    client = bus.connect(bus_path, worker_id)
+    server_socket = create_server_socket(args.backlog, reuse_port=True)
+    metrics_addr = start_metrics(METRICS_PORT + worker_id if METRICS_PORT else 0)
+    log.info("worker 已启动", pid=os.getpid(), mode=args.mode, metrics=metrics_addr or "未启用")
+    try:
+        serve(server_socket, args.mode, args.backlog)
+    finally:
+        client.close()
+
+def run_master(args):
+    """主进程：创建总线套接字，启动 worker，运行中枢直到 Ctrl+C"""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        log.error("当前平台不支持 SO_REUSEPORT，无法使用多进程模式")
+        return
+    if os.path.exists(BUS_SOCKET):
+        os.unlink(BUS_SOCKET)  # 上次未正常退出留下的套接字文件
+    hub_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    hub_socket.bind(BUS_SOCKET)
+    hub_socket.listen(args.workers)
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=run_worker, args=(worker_id, args, BUS_SOCKET),
+                                 name=f"worker-{worker_id}")
+                 for worker_id in range(args.workers)]
+    for process in processes:
+        process.start()
+    log.info("worker 进程已启动", pids=",".join(str(p.pid) for p in processes), bus=BUS_SOCKET)
+
+    try:
+        asyncio.run(BusHub().serve(hub_socket, processes))
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+            process.join()
+        hub_socket.close()
+        if os.path.exists(BUS_SOCKET):
+            os.unlink(BUS_SOCKET)
+        message_store.close()  # 群聊历史只由主进程写入
+        sqlite_store.close()
+        log.info("服务器已完全关闭")
+        shutdown_logging()
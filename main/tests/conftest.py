@@ -0,0 +1,11 @@
+"""单元测试公共设置（在 main 目录下运行：python -m pytest tests）
+
+被测模块按运行时的方式导入（from config import ...），config 导入时会在当前目录生成 config.json，
+因此测试切换到临时目录运行，不在代码目录中留下配置文件或数据库。
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="chat-tests-"))
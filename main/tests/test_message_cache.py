@@ -0,0 +1,134 @@
+"""客户端本地消息缓存（client/message_cache.py）：自己消息的消息ID补齐、去重、分页、搜索"""
+import sqlite3
+import pytest
+from client.message_cache import MessageCache, group_key, private_key, TRIGRAM_MIN
+
+ROOM = "dev"
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MessageCache(str(tmp_path / "cache.db"), page_size=3)
+    yield cache
+    cache.close()
+
+def contents(rows):
+    return [row[-1] for row in rows]
+
+def test_own_message_claims_history_id(cache):
+    """自己发送的消息（无消息ID）从历史中收到时补上消息ID，不重复记录"""
+    cache.add_own_group(ROOM, "me", "10:00:00", "hi")
+    assert cache.last_msg_id(ROOM) is None
+    assert cache.add_group(ROOM, "5", "me", "10:00:00", "hi", own_name="me") is False
+    assert contents(cache.page(group_key(ROOM))) == ["hi"]
+    assert cache.last_msg_id(ROOM) == 5
+    assert cache.add_group(ROOM, "5", "me", "10:00:00", "hi", own_name="me") is False
+
+def test_identical_own_messages_claimed_oldest_first(cache):
+    cache.add_own_group(ROOM, "me", "10:00:00", "same")
+    cache.add_own_group(ROOM, "me", "10:00:01", "same")
+    assert cache.add_group(ROOM, "5", "me", "10:00:00", "same", own_name="me") is False
+    assert cache.add_group(ROOM, "6", "me", "10:00:01", "same", own_name="me") is False
+    assert cache.add_group(ROOM, "7", "me", "10:00:02", "same", own_name="me") is True  # 其他客户端发出的
+    assert len(cache.page(group_key(ROOM), limit=10)) == 3
+    assert cache.last_msg_id(ROOM) == 7
+
+def test_other_senders_do_not_claim_own_messages(cache):
+    cache.add_own_group(ROOM, "me", "10:00:00", "hi")
+    assert cache.add_group(ROOM, "5", "bob", "10:00:00", "hi", own_name="me") is True
+    assert cache.add_group(ROOM, "6", "me", "10:00:00", "hi", own_name="me") is False
+    assert contents(cache.page(group_key(ROOM))) == ["hi", "hi"]
+
+def test_dedup_on_msg_id_per_room(cache):
+    assert cache.add_group(ROOM, "7", "bob", "10:00:00", "x") is True
+    assert cache.add_group(ROOM, "7", "bob", "10:00:00", "x") is False
+    assert cache.add_group("other", "7", "bob", "10:00:00", "x") is True
+    assert len(cache.page(group_key(ROOM))) == 1
+
+def test_messages_without_id_are_not_deduplicated(cache):
+    assert cache.add_group(ROOM, "", "bob", "10:00:00", "x") is True
+    assert cache.add_group(ROOM, "", "bob", "10:00:00", "x") is True
+    assert cache.last_msg_id(ROOM) is None
+
+def test_msg_ids_scoped_by_node(cache):
+    """换到另一个集群节点后，旧节点的消息ID既不参与去重，也不作为补齐历史的起点"""
+    cache.add_group(ROOM, "9", "bob", "10:00:00", "old node")
+    cache.set_scope("node-b")
+    assert cache.last_msg_id(ROOM) is None
+    assert cache.add_group(ROOM, "9", "bob", "10:00:01", "new node") is True
+    assert cache.last_msg_id(ROOM) == 9
+    cache.set_scope("")
+    assert cache.add_group(ROOM, "9", "bob", "10:00:00", "old node") is False
+
+def test_old_cache_migrated_to_scoped_ids(tmp_path):
+    path = str(tmp_path / "old.db")
+    db = sqlite3.connect(path)
+    db.executescript(f"""
+        CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation TEXT NOT NULL, msg_id INTEGER,
+            timestamp REAL NOT NULL, sender TEXT NOT NULL, time_str TEXT NOT NULL, content TEXT NOT NULL);
+        CREATE UNIQUE INDEX messages_msg_id ON messages (conversation, msg_id) WHERE msg_id IS NOT NULL;
+        INSERT INTO messages VALUES (1, '{group_key(ROOM)}', 5, 0, 'bob', '10:00:00', 'kept');
+    """)
+    db.close()
+    cache = MessageCache(path)
+    assert cache.last_msg_id(ROOM) == 5
+    assert cache.add_group(ROOM, "5", "bob", "10:00:00", "kept") is False
+    cache.set_scope("node-b")
+    assert cache.add_group(ROOM, "5", "bob", "10:00:00", "elsewhere") is True
+    cache.close()
+
+def test_paging_with_before(cache):
+    for i in range(7):
+        cache.add_group(ROOM, str(i + 1), "bob", "10:00:00", f"m{i}")
+    latest = cache.page(group_key(ROOM))
+    assert contents(latest) == ["m4", "m5", "m6"]
+    older = cache.page(group_key(ROOM), before=latest[0][0])
+    assert contents(older) == ["m1", "m2", "m3"]
+    oldest = cache.page(group_key(ROOM), before=older[0][0])
+    assert contents(oldest) == ["m0"]
+    assert cache.page(group_key(ROOM), before=oldest[0][0]) == []
+
+def test_group_and_private_conversations_are_separate(cache):
+    cache.add_group(ROOM, "1", "bob", "10:00:00", "group")
+    cache.add_private("bob", "bob", "10:00:01", "private")
+    assert contents(cache.page(group_key(ROOM))) == ["group"]
+    assert contents(cache.page(private_key("bob"))) == ["private"]
+
+def test_flush_persists_across_reopen(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = MessageCache(path)
+    cache.add_private("bob", "me", "10:00:00", "saved")
+    cache.flush()
+    cache.close()
+    reopened = MessageCache(path)
+    assert contents(reopened.page(private_key("bob"))) == ["saved"]
+    reopened.close()
+
+def test_search_trigram(cache):
+    if not cache.fts:
+        pytest.skip("SQLite 不支持 FTS5 trigram")
+    cache.add_group(ROOM, "1", "bob", "10:00:00", "今天天气很好")
+    cache.add_private("bob", "bob", "10:00:01", "天气预报说明天下雨")
+    cache.add_group(ROOM, "2", "bob", "10:00:02", "无关")
+    results = cache.search("天气预")
+    assert contents(results) == ["天气预报说明天下雨"]
+    assert [row[0] for row in cache.search("天气很")] == [group_key(ROOM)]
+
+def test_search_short_keyword_uses_like(cache):
+    keyword = "天气"
+    assert len(keyword) < TRIGRAM_MIN  # trigram 无法匹配，退化为 LIKE
+    cache.add_group(ROOM, "1", "bob", "10:00:00", "今天天气很好")
+    cache.add_private("bob", "bob", "10:00:01", "天气预报")
+    cache.add_group(ROOM, "2", "bob", "10:00:02", "无关")
+    assert contents(cache.search(keyword)) == ["天气预报", "今天天气很好"]  # 最新的在前
+
+def test_search_like_escapes_wildcards(cache):
+    cache.add_group(ROOM, "1", "bob", "10:00:00", "100% sure")
+    cache.add_group(ROOM, "2", "bob", "10:00:01", "1000 sure")
+    cache.add_group(ROOM, "3", "bob", "10:00:02", "a_b")
+    cache.add_group(ROOM, "4", "bob", "10:00:03", "axb")
+    assert contents(cache.search("0%")) == ["100% sure"]
+    assert contents(cache.search("_")) == ["a_b"]
+
+def test_search_blank_keyword(cache):
+    cache.add_group(ROOM, "1", "bob", "10:00:00", "x")
+    assert cache.search("   ") == []
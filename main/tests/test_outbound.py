@@ -0,0 +1,129 @@
+"""出站队列（server/outbound.py）：数量/字节上限下各策略、各类别的入队结果与保留的帧"""
+import pytest
+from server.outbound import (OutboundQueue, outbound_stats, KIND_NORMAL, KIND_PRESENCE,
+                             KIND_URGENT, KIND_SNAPSHOT, PUT_OK, PUT_DROPPED, PUT_OVERFLOW,
+                             PUT_RESYNC, POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_DISCONNECT)
+from config import BATCH_MAX_BYTES
+
+ALL_KINDS = (KIND_NORMAL, KIND_PRESENCE, KIND_URGENT, KIND_SNAPSHOT)
+DROPPING_POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE)
+
+def make_queue(policy, max_messages=3, max_bytes=1000):
+    return OutboundQueue(max_messages=max_messages, max_bytes=max_bytes, policy=policy)
+
+def fill(queue, *entries):
+    """依次入队 (数据, 类别)，返回各次的结果"""
+    return [queue.put(data, kind) for data, kind in entries]
+
+@pytest.mark.parametrize("policy", (POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_DISCONNECT))
+def test_below_limits_keeps_order(policy):
+    queue = make_queue(policy)
+    assert fill(queue, (b"a", KIND_NORMAL), (b"p", KIND_PRESENCE), (b"u", KIND_URGENT)) == [PUT_OK] * 3
+    assert len(queue) == 3
+    assert queue.bytes == 3
+    assert queue.drain() == [b"a", b"p", b"u"]
+    assert len(queue) == 0 and queue.bytes == 0
+
+@pytest.mark.parametrize("kind", ALL_KINDS)
+def test_disconnect_at_message_limit(kind):
+    queue = make_queue(POLICY_DISCONNECT)
+    fill(queue, (b"a", KIND_NORMAL), (b"b", KIND_NORMAL), (b"c", KIND_NORMAL))
+    assert queue.put(b"d", kind) == PUT_OVERFLOW
+    assert queue.drain() == [b"a", b"b", b"c"]
+
+@pytest.mark.parametrize("kind", ALL_KINDS)
+def test_disconnect_at_byte_limit(kind):
+    queue = make_queue(POLICY_DISCONNECT, max_bytes=10)
+    assert queue.put(b"x" * 6) == PUT_OK
+    assert queue.put(b"y" * 5, kind) == PUT_OVERFLOW
+    assert queue.drain() == [b"x" * 6]
+
+@pytest.mark.parametrize("policy", DROPPING_POLICIES)
+@pytest.mark.parametrize("kind", (KIND_NORMAL, KIND_URGENT))
+def test_drop_oldest_at_message_limit(policy, kind):
+    queue = make_queue(policy)
+    fill(queue, (b"a", KIND_URGENT), (b"b", KIND_NORMAL), (b"c", KIND_NORMAL))
+    before = outbound_stats.summary()["dropped"]
+    assert queue.put(b"d", kind) == PUT_DROPPED
+    assert queue.drain() == [b"b", b"c", b"d"]
+    assert queue.dropped == 1
+    assert outbound_stats.summary()["dropped"] == before + 1
+
+@pytest.mark.parametrize("policy", DROPPING_POLICIES)
+def test_drop_oldest_at_byte_limit(policy):
+    queue = make_queue(policy, max_messages=100, max_bytes=10)
+    fill(queue, (b"1111", KIND_NORMAL), (b"2222", KIND_NORMAL))
+    assert queue.put(b"333333") == PUT_DROPPED  # 丢弃一条即可放下
+    assert queue.bytes == 10
+    assert queue.drain() == [b"2222", b"333333"]
+
+@pytest.mark.parametrize("policy", DROPPING_POLICIES)
+def test_presence_survives_while_normal_messages_remain(policy):
+    queue = make_queue(policy)
+    fill(queue, (b"p", KIND_PRESENCE), (b"a", KIND_NORMAL), (b"b", KIND_NORMAL))
+    assert queue.put(b"c") == PUT_DROPPED
+    assert queue.drain() == [b"p", b"b", b"c"]
+
+@pytest.mark.parametrize("policy", DROPPING_POLICIES)
+@pytest.mark.parametrize("kind", (KIND_NORMAL, KIND_URGENT))
+def test_only_presence_left_requests_resync(policy, kind):
+    queue = make_queue(policy, max_messages=2)
+    fill(queue, (b"p1", KIND_PRESENCE), (b"p2", KIND_PRESENCE))
+    assert queue.put(b"a", kind) == PUT_RESYNC
+    assert queue.drain() == [b"a"]
+
+@pytest.mark.parametrize("policy", DROPPING_POLICIES)
+def test_presence_delta_not_queued_on_resync(policy):
+    queue = make_queue(policy, max_messages=2)
+    fill(queue, (b"p1", KIND_PRESENCE), (b"p2", KIND_PRESENCE))
+    assert queue.put(b"p3", KIND_PRESENCE) == PUT_RESYNC  # 本条增量包含在补发的完整列表中
+    assert len(queue) == 0
+    assert queue.drain() == []
+
+@pytest.mark.parametrize("policy", DROPPING_POLICIES)
+def test_snapshot_replaces_presence_without_resync(policy):
+    queue = make_queue(policy, max_messages=2)
+    fill(queue, (b"p1", KIND_PRESENCE), (b"p2", KIND_PRESENCE))
+    assert queue.put(b"s", KIND_SNAPSHOT) == PUT_DROPPED
+    assert queue.drain() == [b"s"]
+
+def test_coalesce_snapshot_discards_presence_before_normal_messages():
+    queue = make_queue(POLICY_COALESCE)
+    fill(queue, (b"p1", KIND_PRESENCE), (b"a", KIND_NORMAL), (b"p2", KIND_PRESENCE))
+    before = outbound_stats.summary()["coalesced"]
+    assert queue.put(b"s", KIND_SNAPSHOT) == PUT_DROPPED
+    assert queue.drain() == [b"a", b"s"]  # 普通消息保留，旧的在线状态帧被完整列表覆盖
+    assert queue.dropped == 0
+    assert outbound_stats.summary()["coalesced"] == before + 2
+
+def test_drop_oldest_snapshot_drops_normal_messages_first():
+    queue = make_queue(POLICY_DROP_OLDEST)
+    fill(queue, (b"p1", KIND_PRESENCE), (b"a", KIND_NORMAL), (b"p2", KIND_PRESENCE))
+    assert queue.put(b"s", KIND_SNAPSHOT) == PUT_DROPPED
+    assert queue.drain() == [b"p1", b"p2", b"s"]
+
+def test_tombstones_in_the_middle_are_skipped():
+    queue = make_queue(POLICY_DROP_OLDEST)
+    fill(queue, (b"p", KIND_PRESENCE), (b"a", KIND_NORMAL), (b"b", KIND_NORMAL))
+    queue.put(b"c")
+    assert len(queue.items) == 4  # 被丢弃的 a 留下墓碑
+    assert len(queue) == 3
+    assert queue.bytes == 3
+    assert queue.drain() == [b"p", b"b", b"c"]
+
+def test_tombstones_at_the_head_are_popped():
+    queue = make_queue(POLICY_DROP_OLDEST)
+    fill(queue, (b"a", KIND_NORMAL), (b"b", KIND_NORMAL), (b"c", KIND_NORMAL))
+    queue.put(b"d")
+    assert [data for data, _ in queue.items] == [b"b", b"c", b"d"]
+
+def test_flush_due():
+    queue = make_queue(POLICY_COALESCE, max_bytes=BATCH_MAX_BYTES * 2)
+    queue.put(b"a")
+    assert not queue.flush_due()
+    queue.put(b"u", KIND_URGENT)
+    assert queue.flush_due()
+    queue.drain()
+    assert not queue.flush_due()
+    queue.put(b"x" * BATCH_MAX_BYTES)
+    assert queue.flush_due()
@@ -0,0 +1,167 @@
+"""通信协议（protocol.py）：长度前缀帧解析、旧版 ||| 文本解析、压缩帧"""
+import os
+import zlib
+import pytest
+from config import CHAT_SEPARATOR, EXIT_MARKER, COMPRESSION_THRESHOLD
+from protocol import (FRAME_HEADER, FRAME_MAGIC, PROTOCOL_VERSION, MAX_FRAME_SIZE, FIELD_SEPARATOR,
+                      MSG_LOGIN, MSG_GROUP, MSG_PRIVATE, MSG_EXIT, MSG_PING, MSG_COMPRESSED,
+                      DEFAULT_ROOM, COMPRESSION_DICT, FrameDecoder, LegacyDecoder, ProtocolError,
+                      create_decoder, encode_frame, split_fields, compress_frame, decompress_frames)
+
+def deflate(data):
+    """按协议的方式（raw deflate + 预置字典）压缩任意数据"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=COMPRESSION_DICT)
+    return compressor.compress(data) + compressor.flush()
+
+def compressed_frame(payload):
+    return FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, MSG_COMPRESSED, len(payload)) + payload
+
+def test_frame_round_trip():
+    frame = encode_frame(MSG_GROUP, DEFAULT_ROOM, "你好，world")
+    assert FrameDecoder().feed(frame) == [(MSG_GROUP, f"{DEFAULT_ROOM}{FIELD_SEPARATOR}你好，world")]
+
+def test_empty_payload():
+    assert FrameDecoder().feed(encode_frame(MSG_PING)) == [(MSG_PING, "")]
+
+def test_several_frames_in_one_read():
+    data = encode_frame(MSG_LOGIN, "alice") + encode_frame(MSG_PING) + encode_frame(MSG_EXIT)
+    assert FrameDecoder().feed(data) == [(MSG_LOGIN, "alice"), (MSG_PING, ""), (MSG_EXIT, "")]
+
+def test_frame_split_byte_by_byte():
+    """逐字节到达（包括拆开帧头和多字节字符）时，只在帧完整后产出"""
+    frame = encode_frame(MSG_PRIVATE, "bob", "中文内容")
+    decoder = FrameDecoder()
+    for byte in frame[:-1]:
+        assert decoder.feed(bytes([byte])) == []
+    assert decoder.feed(frame[-1:]) == [(MSG_PRIVATE, f"bob{FIELD_SEPARATOR}中文内容")]
+
+def test_partial_frame_kept_across_reads():
+    first = encode_frame(MSG_GROUP, DEFAULT_ROOM, "a")
+    second = encode_frame(MSG_GROUP, DEFAULT_ROOM, "b")
+    decoder = FrameDecoder()
+    assert decoder.feed(first + second[:5]) == [(MSG_GROUP, f"{DEFAULT_ROOM}{FIELD_SEPARATOR}a")]
+    assert decoder.feed(second[5:]) == [(MSG_GROUP, f"{DEFAULT_ROOM}{FIELD_SEPARATOR}b")]
+
+def test_large_frames_across_buffer_compaction():
+    """已消费数据超过整理阈值后丢弃已消费部分，半帧数据不受影响"""
+    frames = [encode_frame(MSG_GROUP, DEFAULT_ROOM, str(i) * 40000) for i in range(5)]
+    data = b"".join(frames)
+    decoder = FrameDecoder()
+    received = []
+    for offset in range(0, len(data), 30000):
+        received += decoder.feed(data[offset:offset + 30000])
+    assert [payload for _, payload in received] == [f"{DEFAULT_ROOM}{FIELD_SEPARATOR}{str(i) * 40000}"
+                                                    for i in range(5)]
+
+def test_bad_magic():
+    frame = bytearray(encode_frame(MSG_PING))
+    frame[0] = 0x7B
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(bytes(frame))
+
+def test_bad_version():
+    frame = bytearray(encode_frame(MSG_PING))
+    frame[1] = PROTOCOL_VERSION + 1
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(bytes(frame))
+
+def test_oversized_length_rejected_from_header():
+    """帧头声明的长度超过上限时立即报错，不等待负载到达"""
+    header = FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, MSG_GROUP, MAX_FRAME_SIZE + 1)
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(header)
+
+def test_max_size_frame_accepted():
+    header = FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, MSG_GROUP, MAX_FRAME_SIZE)
+    assert FrameDecoder().feed(header + b"x" * MAX_FRAME_SIZE) == [(MSG_GROUP, "x" * MAX_FRAME_SIZE)]
+
+def test_split_fields_pads_and_keeps_separators_in_last_field():
+    assert split_fields("a", 3) == ["a", "", ""]
+    assert split_fields(f"a{FIELD_SEPARATOR}b{FIELD_SEPARATOR}c", 2) == ["a", f"b{FIELD_SEPARATOR}c"]
+
+def test_create_decoder_by_first_byte():
+    assert isinstance(create_decoder(FRAME_MAGIC), FrameDecoder)
+    assert isinstance(create_decoder(ord("a")), LegacyDecoder)
+
+def test_legacy_login_then_messages():
+    decoder = LegacyDecoder()
+    assert decoder.feed("老用户\n".encode("utf-8")) == [(MSG_LOGIN, "老用户")]
+    data = f"hello{CHAT_SEPARATOR}@bob hi there{CHAT_SEPARATOR}".encode("utf-8")
+    assert decoder.feed(data) == [(MSG_GROUP, f"{DEFAULT_ROOM}{FIELD_SEPARATOR}hello"),
+                                  (MSG_PRIVATE, f"bob{FIELD_SEPARATOR}hi there")]
+
+def test_legacy_separator_split_across_reads():
+    decoder = LegacyDecoder()
+    decoder.feed(b"old")
+    assert decoder.feed(b"hel") == []
+    assert decoder.feed(b"lo||") == []
+    assert decoder.feed(b"|") == [(MSG_GROUP, f"{DEFAULT_ROOM}{FIELD_SEPARATOR}hello")]
+
+def test_legacy_ignores_empty_and_contentless_private():
+    decoder = LegacyDecoder()
+    decoder.feed(b"old")
+    assert decoder.feed(f"{CHAT_SEPARATOR}@bob{CHAT_SEPARATOR}".encode("utf-8")) == []
+
+def test_legacy_exit_marker_without_separator():
+    decoder = LegacyDecoder()
+    decoder.feed(b"old")
+    assert decoder.feed(f"bye{CHAT_SEPARATOR}{EXIT_MARKER}".encode("utf-8")) == [
+        (MSG_GROUP, f"{DEFAULT_ROOM}{FIELD_SEPARATOR}bye"), (MSG_EXIT, "")]
+
+# ---------- 压缩帧 ----------
+
+def test_small_frame_not_compressed():
+    frame = encode_frame(MSG_GROUP, DEFAULT_ROOM, "x" * (COMPRESSION_THRESHOLD - 10))
+    assert compress_frame(frame) is frame
+
+def test_compressed_round_trip():
+    frame = encode_frame(MSG_GROUP, DEFAULT_ROOM, "7", "alice", "12:00:00", "重复的内容" * 200)
+    compressed = compress_frame(frame)
+    assert compressed[2] == MSG_COMPRESSED
+    assert len(compressed) < len(frame)
+    assert FrameDecoder().feed(compressed) == FrameDecoder().feed(frame)
+
+def test_compressed_frame_split_across_reads():
+    frame = encode_frame(MSG_PRIVATE, "bob", "abc" * 1000)
+    compressed = compress_frame(frame)
+    decoder = FrameDecoder()
+    assert decoder.feed(compressed[:10]) == []
+    assert decoder.feed(compressed[10:]) == [(MSG_PRIVATE, f"bob{FIELD_SEPARATOR}{'abc' * 1000}")]
+
+def test_incompressible_frame_returned_unchanged():
+    payload = os.urandom(4096)
+    frame = FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, MSG_GROUP, len(payload)) + payload
+    assert compress_frame(frame) is frame
+
+def test_decompress_several_inner_frames():
+    inner = encode_frame(MSG_PING) + encode_frame(MSG_GROUP, DEFAULT_ROOM, "hi")
+    assert decompress_frames(deflate(inner)) == [(MSG_PING, ""),
+                                                 (MSG_GROUP, f"{DEFAULT_ROOM}{FIELD_SEPARATOR}hi")]
+
+def test_decompression_size_bound():
+    """解压后超过一帧上限的数据（压缩炸弹）被拒绝，不会完整解压"""
+    header = FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, MSG_GROUP, MAX_FRAME_SIZE * 4)
+    bomb = deflate(header + b"\0" * (MAX_FRAME_SIZE * 4))
+    assert len(bomb) < 16 * 1024
+    with pytest.raises(ProtocolError):
+        decompress_frames(bomb)
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(compressed_frame(bomb))
+
+def test_decompress_garbage():
+    with pytest.raises(ProtocolError):
+        decompress_frames(b"not deflate data at all")
+
+def test_decompress_truncated_stream():
+    data = deflate(encode_frame(MSG_GROUP, DEFAULT_ROOM, "hello" * 100))
+    with pytest.raises(ProtocolError):
+        decompress_frames(data[:len(data) // 2])
+
+def test_decompress_truncated_inner_frame():
+    with pytest.raises(ProtocolError):
+        decompress_frames(deflate(encode_frame(MSG_GROUP, DEFAULT_ROOM, "hello")[:-2]))
+
+def test_nested_compressed_frame_rejected():
+    nested = compressed_frame(deflate(encode_frame(MSG_PING)))
+    with pytest.raises(ProtocolError):
+        decompress_frames(deflate(nested))
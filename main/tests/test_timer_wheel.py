@@ -0,0 +1,85 @@
+"""哈希时间轮（server/timer_wheel.py）：到期、改期、取消、超过一圈的定时器"""
+from server.timer_wheel import TimerWheel
+
+def make_wheel():
+    return TimerWheel(tick=1.0, slots=8, now=0.0)
+
+def advance_each(wheel, start, end):
+    """逐 tick 推进，返回 {tick: 到期的键}（只记录有到期的 tick）"""
+    fired = {}
+    for now in range(start, end + 1):
+        expired = wheel.advance(float(now))
+        if expired:
+            fired[now] = sorted(expired)
+    return fired
+
+def test_expires_at_deadline():
+    wheel = make_wheel()
+    wheel.schedule("a", 3.0)
+    assert len(wheel) == 1
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ["a"]
+    assert len(wheel) == 0
+    assert wheel.advance(4.0) == []
+
+def test_fractional_deadline_never_fires_early():
+    wheel = make_wheel()
+    wheel.schedule("a", 2.1)
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ["a"]
+
+def test_reschedule_later():
+    wheel = make_wheel()
+    wheel.schedule("a", 2.0)
+    wheel.schedule("a", 5.0)
+    assert len(wheel) == 1
+    assert advance_each(wheel, 0, 8) == {5: ["a"]}
+
+def test_reschedule_earlier():
+    wheel = make_wheel()
+    wheel.schedule("a", 6.0)
+    wheel.schedule("a", 1.0)
+    assert advance_each(wheel, 0, 8) == {1: ["a"]}
+
+def test_reschedule_to_same_slot_next_lap():
+    wheel = make_wheel()
+    wheel.schedule("a", 2.0)
+    wheel.schedule("a", 10.0)  # 同一个槽，下一圈
+    assert advance_each(wheel, 0, 12) == {10: ["a"]}
+
+def test_cancel():
+    wheel = make_wheel()
+    wheel.schedule("a", 2.0)
+    wheel.schedule("b", 2.0)
+    wheel.cancel("a")
+    wheel.cancel("missing")  # 未登记的键忽略
+    assert len(wheel) == 1
+    assert advance_each(wheel, 0, 4) == {2: ["b"]}
+
+def test_timer_beyond_one_lap_waits_in_slot():
+    wheel = make_wheel()
+    wheel.schedule("near", 3.0)
+    wheel.schedule("far", 19.0)  # 与 near 同槽，两圈之后
+    assert advance_each(wheel, 0, 24) == {3: ["near"], 19: ["far"]}
+
+def test_long_pause_expires_everything_due():
+    wheel = make_wheel()
+    wheel.schedule("a", 3.0)
+    wheel.schedule("b", 30.0)
+    wheel.schedule("c", 200.0)
+    assert sorted(wheel.advance(100.0)) == ["a", "b"]
+    assert len(wheel) == 1
+    assert wheel.advance(200.0) == ["c"]
+
+def test_past_deadline_fires_on_next_tick():
+    wheel = make_wheel()
+    wheel.advance(5.0)
+    wheel.schedule("a", 1.0)
+    assert wheel.advance(6.0) == ["a"]
+
+def test_clock_going_backwards_is_ignored():
+    wheel = make_wheel()
+    wheel.schedule("a", 8.0)
+    wheel.advance(5.0)
+    assert wheel.advance(4.0) == []
+    assert wheel.advance(8.0) == ["a"]
@@ -0,0 +1,12 @@
+"""通用工具（服务器、命令行机器人与压测工具共用）"""
+
+def raise_fd_limit():
+    """尽量把进程可打开文件数提升到硬上限（每个连接占用一个文件描述符）"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError, OSError):
+        return None  # Windows 无 resource 模块，保持系统默认